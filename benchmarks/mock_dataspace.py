@@ -0,0 +1,223 @@
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+import asyncio
+import time
+import httpx
+import hashlib
+import os
+from email.utils import formatdate
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# Local stand-in for the dataspace used by the benchmark suite:
+# token endpoint, management API, federated catalog and data plane.
+# Everything is configured with environment variables (set by run_benchmarks.py).
+LATENCY = float(os.getenv("MOCK_LATENCY_MS", "20")) / 1000                    # management API / token latency
+CATALOG_LATENCY = float(os.getenv("MOCK_CATALOG_LATENCY_MS", "50")) / 1000    # (federated) catalog latency
+DATAPLANE_LATENCY = float(os.getenv("MOCK_DATAPLANE_LATENCY_MS", "20")) / 1000 # data plane latency
+PARTICIPANTS = int(os.getenv("MOCK_PARTICIPANTS", "10"))     # number of providers in the federated catalog
+DATASETS = int(os.getenv("MOCK_DATASETS", "100"))            # number of KITs offered by each provider
+PAYLOAD_SIZE = int(os.getenv("MOCK_PAYLOAD_BYTES", "1048576")) # size of each KIT payload
+OBJECTS = int(os.getenv("MOCK_OBJECTS", "100"))              # number of assets, policies, ... in the list endpoints
+EDR_EXISTS = os.getenv("MOCK_EDR_EXISTS", "true").casefold() == "true" # false forces a negotiation on every transfer
+BASE = os.getenv("MOCK_BASE_URL", "http://127.0.0.1:8100")
+PUSH_DURATION = float(os.getenv("MOCK_PUSH_MS", "500")) / 1000 # time until a push transfer process is COMPLETED
+
+app = FastAPI(title="Mock Dataspace")
+payload = os.urandom(PAYLOAD_SIZE)
+PAYLOAD_ETAG = f'"{hashlib.sha256(payload).hexdigest()[:16]}"'
+STARTED_AT = formatdate(usegmt=True) # Last-Modified of the payload
+push_transfers = {} # transfer process id -> start time
+negotiated = set() # assets whose EDR is returned once after a negotiation (MOCK_EDR_EXISTS=false)
+
+
+#####################################################
+#                 Mock Data                         #
+#####################################################
+def participant_id(i):
+    return f"BPNL{i:012d}"
+
+def kit_name(i, j):
+    return f"kit-{i}-{j}"
+
+def policy(i, j):
+    return {
+        "@id": f"offer-{i}-{j}",
+        "@type": "odrl:Offer",
+        "odrl:permission": [],
+        "odrl:prohibition": [],
+        "odrl:obligation": []
+    }
+
+# a KIT as it appears in the federated catalog
+def federated_dataset(i, j):
+    return {
+        "@id": kit_name(i, j),
+        "@type": "dcat:Dataset",
+        "kit_name": kit_name(i, j),
+        "kit_type": "basic",
+        "asset_type": "http",
+        "version": f"1.{j % 10}",
+        "description": f"Benchmark KIT {j} of provider {i}",
+        "offerType": "data",
+        "tag": "benchmark",
+        "semantic_model": {"category": f"cat-{j % 7}", "size": j},
+        "odrl:hasPolicy": [policy(i, j)],
+        "dcat:distribution": [{"@type": "dcat:Distribution", "dct:format": {"@id": "HttpData-PULL"}}]
+    }
+
+# a KIT as it appears in a connector catalog (management API)
+def catalog_dataset(i, j):
+    return {
+        "@id": kit_name(i, j),
+        "@type": "dcat:Dataset",
+        "id": kit_name(i, j),
+        "edc:kit_name": kit_name(i, j),
+        "edc:kit_type": "basic",
+        "edc:asset_type": "http",
+        "edc:version": f"1.{j % 10}",
+        "hasPolicy": [policy(i, j)],
+        "distribution": []
+    }
+
+federated_catalog = [
+    {
+        "@id": f"catalog-{i}",
+        "@type": "dcat:Catalog",
+        "dspace:participantId": participant_id(i),
+        "originator": f"{BASE}/participants/{i}/api/dsp",
+        "dcat:dataset": [federated_dataset(i, j) for j in range(DATASETS)]
+    }
+    for i in range(PARTICIPANTS)
+]
+
+def object_list(kind):
+    return [{"@id": f"{kind}-{k}", "@type": kind, "properties": {"name": f"{kind} {k}"}} for k in range(OBJECTS)]
+
+
+#####################################################
+#                 Mock Endpoints                    #
+#####################################################
+@app.post("/token")
+async def _token():
+    await asyncio.sleep(LATENCY)
+    return {"access_token": "mock-token", "expires_in": 300, "token_type": "Bearer"}
+
+@app.get("/federated/catalog")
+async def _federated_catalog():
+    await asyncio.sleep(CATALOG_LATENCY)
+    return federated_catalog
+
+@app.post("/management/catalog/request")
+async def _catalog(request: Request):
+    body = await request.json()
+    await asyncio.sleep(CATALOG_LATENCY)
+    provider = body.get("counterPartyId", "")
+    i = int(provider[4:]) if provider.startswith("BPNL") and provider[4:].isdigit() else 0
+    return {
+        "@id": f"catalog-{i}",
+        "@type": "dcat:Catalog",
+        "participantId": provider,
+        "dataset": [catalog_dataset(i, j) for j in range(DATASETS)]
+    }
+
+# post EDC events to the callback addresses of a request after `delay` seconds
+def send_callbacks(body, events, delay):
+    addresses = body.get("callbackAddresses") or []
+    async def send():
+        await asyncio.sleep(delay)
+        async with httpx.AsyncClient() as client:
+            for address in addresses:
+                try:
+                    await client.post(address["uri"], json=events)
+                except httpx.HTTPError:
+                    pass
+    if addresses:
+        asyncio.create_task(send())
+
+@app.post("/management/edrs")
+async def _negotiate(request: Request):
+    body = await request.json()
+    await asyncio.sleep(LATENCY)
+    asset_id = ((body.get("policy") or {}).get("odrl:target") or {}).get("@id", "unknown")
+    negotiated.add(asset_id)
+    send_callbacks(body, [
+        {"type": "ContractNegotiationFinalized", "payload": {"contractNegotiationId": f"negotiation-{asset_id}",
+                                                             "contractAgreement": {"@id": f"agreement-{asset_id}"}}},
+        {"type": "TransferProcessStarted", "payload": {"transferProcessId": f"tp-{asset_id}", "assetId": asset_id}},
+    ], LATENCY)
+    return {"@id": f"negotiation-{asset_id}", "@type": "IdResponse"}
+
+@app.get("/management/contractnegotiations/{negotiation_id}")
+async def _negotiation(negotiation_id: str):
+    await asyncio.sleep(LATENCY)
+    asset_id = negotiation_id.removeprefix("negotiation-")
+    return {"@id": negotiation_id, "@type": "ContractNegotiation", "state": "FINALIZED",
+            "contractAgreementId": f"agreement-{asset_id}"}
+
+@app.post("/management/edrs/request")
+async def _edrs(request: Request):
+    body = await request.json()
+    await asyncio.sleep(LATENCY)
+    filters = body.get("filterExpression") or [{}]
+    asset_id = filters[0].get("operandRight", "unknown")
+    if not EDR_EXISTS and asset_id not in negotiated:
+        return []
+    negotiated.discard(asset_id)
+    return [{"@id": f"edr-{asset_id}", "transferProcessId": f"tp-{asset_id}", "assetId": asset_id,
+             "agreementId": f"agreement-{asset_id}"}]
+
+@app.get("/management/edrs/{transfer_id}/dataaddress")
+async def _data_address(transfer_id: str):
+    await asyncio.sleep(LATENCY)
+    asset_id = transfer_id.removeprefix("tp-")
+    return {"endpoint": f"{BASE}/public/{asset_id}", "authorization": "mock-edr-token"}
+
+@app.api_route("/public/{asset_id}", methods=["GET", "POST"])
+async def _data_plane(asset_id: str, request: Request):
+    await asyncio.sleep(DATAPLANE_LATENCY)
+    headers = {"ETag": PAYLOAD_ETAG, "Last-Modified": STARTED_AT}
+    if request.headers.get("if-none-match") == PAYLOAD_ETAG:
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/octet-stream", headers=headers)
+
+@app.post("/management/transferprocesses")
+async def _start_transfer(request: Request):
+    body = await request.json()
+    await asyncio.sleep(LATENCY)
+    transfer_id = f"tp-push-{len(push_transfers)}"
+    push_transfers[transfer_id] = time.monotonic()
+    send_callbacks(body, [{"type": "TransferProcessCompleted", "payload": {"transferProcessId": transfer_id}}], PUSH_DURATION)
+    return {"@id": transfer_id, "@type": "IdResponse"}
+
+@app.get("/management/transferprocesses/{transfer_id}")
+async def _transfer_process(transfer_id: str):
+    await asyncio.sleep(LATENCY)
+    if transfer_id not in push_transfers:
+        return Response(status_code=404)
+    state = "COMPLETED" if time.monotonic() - push_transfers[transfer_id] >= PUSH_DURATION else "STARTED"
+    return {"@id": transfer_id, "@type": "TransferProcess", "state": state, "type": "PROVIDER_PUSH"}
+
+@app.post("/management/{kind}/request")
+async def _list_objects(kind: str):
+    await asyncio.sleep(LATENCY)
+    return JSONResponse(object_list(kind))
+
+@app.post("/management/{kind}/{id}/terminate")
+async def _terminate(kind: str, id: str):
+    await asyncio.sleep(LATENCY)
+    return Response(status_code=204)
+
+@app.api_route("/management/{kind}/{id}", methods=["GET", "PUT", "DELETE", "POST"])
+async def _object(kind: str, id: str, request: Request):
+    await asyncio.sleep(LATENCY)
+    if request.method == "DELETE":
+        return Response(status_code=204)
+    return {"@id": id, "@type": kind, "properties": {"name": id}}
+
+@app.api_route("/management/{kind}", methods=["POST", "PUT"])
+async def _create_object(kind: str, request: Request):
+    body = await request.json()
+    await asyncio.sleep(LATENCY)
+    return {"@id": body.get("@id", f"{kind}-new"), "@type": "IdResponse"}
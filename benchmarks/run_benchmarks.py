@@ -0,0 +1,338 @@
+"""
+Benchmark the Edge-Connector against a local mock dataspace (benchmarks/mock_dataspace.py).
+
+Both the mock dataspace and the Edge-Connector are started as local processes, so the
+benchmark runs fully offline. Results are printed and saved as JSON, so that two
+releases can be compared with --compare.
+
+Example:
+    python benchmarks/run_benchmarks.py --label v0.1.0 --requests 200 --concurrency 10
+    python benchmarks/run_benchmarks.py --label v0.2.0 --compare benchmarks/results/v0.1.0.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote
+import httpx
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+SCENARIOS = [
+    "federatedcatalog_search",
+    "download_kit",
+    "read_content_kit",
+    "run_compositekit",
+    "list_assets",
+    "list_policies",
+    "list_contracts",
+    "list_agreements",
+    "list_negotiations",
+    "list_edrs",
+]
+
+
+#####################################################
+#                 Process Handling                  #
+#####################################################
+# environment of the Edge-Connector: every dataspace URL points to the mock dataspace
+def connector_env(mock_url, args):
+    management = f"{mock_url}/management"
+    env = os.environ.copy()
+    env.update({
+        "DATASPACE": args.dataspace.upper(),
+        "API-KEY": "benchmark",
+        "CONNECTOR_NAME": "benchmark-conn",
+        "STANDARDISATION": "KIT",
+        "DOMAIN": "ROX",
+        "BASE_URL": mock_url,
+        "TOKEN_URL": f"{mock_url}/token",
+        "ASSET_READ_URL": f"{management}/assets/request",
+        "ASSET_READ_BY_ID_URL": f"{management}/assets/{{id}}",
+        "ASSET_CREATE_URL": f"{management}/assets",
+        "ASSET_EDIT_URL": f"{management}/assets",
+        "ASSET_DELETE_BY_ID_URL": f"{management}/assets/{{id}}",
+        "POLICY_READ_URL": f"{management}/policydefinitions/request",
+        "POLICY_READ_BY_ID_URL": f"{management}/policydefinitions/{{id}}",
+        "CONTRACT_READ_URL": f"{management}/contractdefinitions/request",
+        "CONTRACT_CREATE_URL": f"{management}/contractdefinitions",
+        "CONTRACT_DELETE_BY_ID_URL": f"{management}/contractdefinitions/{{id}}",
+        "NEGOTIATION_READ_URL": f"{management}/contractnegotiations/request",
+        "NEGOTIATION_DELETE_BY_ID_URL": f"{management}/contractnegotiations/{{id}}/terminate",
+        "AGREEMENT_READ_URL": f"{management}/contractagreements/request",
+        "EDR_NEGOTIATION_URL": f"{management}/edrs",
+        "EDR_READ_URL": f"{management}/edrs/request",
+        "EDR_DATA_ADDRESS_URL": f"{management}/edrs/{{transfer_id}}/dataaddress",
+        "CATALOG_READ": f"{management}/catalog/request",
+        "CATALOG_FIND_KIT": f"{management}/catalog/dataset/request",
+        "FEDERATED_CAT_URL": f"{mock_url}/federated/catalog",
+        "AWS_ASSET_CREATE_URL": f"{management}/assets",
+        "TRANSFER_PROCESS_URL": f"{management}/transferprocesses",
+        "TRANSFER_PROCESS_BY_ID_URL": f"{management}/transferprocesses/{{id}}",
+        "NEGOTIATION_BY_ID_URL": f"{management}/contractnegotiations/{{id}}",
+    })
+    return env
+
+# environment of the mock dataspace
+def mock_env(mock_url, args):
+    env = os.environ.copy()
+    env.update({
+        "MOCK_BASE_URL": mock_url,
+        "MOCK_LATENCY_MS": str(args.latency_ms),
+        "MOCK_CATALOG_LATENCY_MS": str(args.catalog_latency_ms),
+        "MOCK_DATAPLANE_LATENCY_MS": str(args.dataplane_latency_ms),
+        "MOCK_PARTICIPANTS": str(args.participants),
+        "MOCK_DATASETS": str(args.datasets),
+        "MOCK_PAYLOAD_BYTES": str(args.payload_bytes),
+        "MOCK_OBJECTS": str(args.objects),
+        "MOCK_EDR_EXISTS": "false" if args.negotiate else "true",
+    })
+    return env
+
+def start_server(app, app_dir, port, env, cwd, log_path, workers=1):
+    log = open(log_path, "w")
+    cmd = [sys.executable, "-m", "uvicorn", app, "--app-dir", str(app_dir),
+           "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "--workers", str(workers)]
+    return subprocess.Popen(cmd, env=env, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+
+def wait_until_ready(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server for {url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server for {url} did not start within {timeout}s")
+
+
+#####################################################
+#                 Scenarios                         #
+#####################################################
+# return (method, path, json body) of the n-th request of a scenario
+def build_request(scenario, n, args, mock_url):
+    i = n % args.participants
+    j = n % args.datasets
+    kit = {
+        "provider_id": f"BPNL{i:012d}",
+        "connector_url": f"{mock_url}/participants/{i}/api/dsp",
+        "kit_name": f"kit-{i}-{j}",
+    }
+    if scenario == "federatedcatalog_search":
+        query = f"tag=='benchmark' and category=='cat-{n % 7}'"
+        return "GET", f"/federatedcatalog/{quote(query)}", None
+    if scenario == "download_kit":
+        return "POST", "/download/kit", kit | {"overwrite": True}
+    if scenario == "read_content_kit":
+        return "POST", "/read-content/kit", kit
+    if scenario == "run_compositekit":
+        stage = [kit | {"kit_name": f"kit-{i}-{(j + k) % args.datasets}", "action": "download"}
+                 for k in range(args.composite_kits)]
+        canvas = {"metadata": {"kit_name": f"benchmark-canvas-{n}"}, "sequence": {"1": stage}}
+        return "POST", "/run/compositekit", canvas
+    if scenario.startswith("list_"):
+        return "GET", f"/{scenario[5:]}?page=0&limit={args.objects}", None
+    raise ValueError(f"Unknown scenario {scenario}")
+
+# a request fails with an error status, or with "success": false in its JSON body (e.g., /download/kit)
+def succeeded(response):
+    if response.status_code >= 400:
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return True
+    return not (isinstance(body, dict) and body.get("success") is False)
+
+async def run_scenario(client, scenario, args, mock_url):
+    latencies = []
+    errors = 0
+    counter = iter(range(args.warmup + args.requests))
+
+    async def worker():
+        nonlocal errors
+        for n in counter:
+            method, path, body = build_request(scenario, n, args, mock_url)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                ok = succeeded(response)
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - started
+            if n < args.warmup: # warm-up requests are not measured
+                continue
+            latencies.append(elapsed)
+            errors += 0 if ok else 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    wall = time.perf_counter() - started
+    return summarize(scenario, latencies, errors, wall)
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+def summarize(scenario, latencies, errors, wall):
+    ms = [v * 1000 for v in latencies]
+    return {
+        "scenario": scenario,
+        "requests": len(ms),
+        "errors": errors,
+        "throughput_rps": len(ms) / wall if wall else 0.0,
+        "mean_ms": statistics.fmean(ms) if ms else None,
+        "p50_ms": percentile(ms, 50),
+        "p90_ms": percentile(ms, 90),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": max(ms) if ms else None,
+    }
+
+
+#####################################################
+#                 Reporting                         #
+#####################################################
+def fmt(value):
+    return "-" if value is None else f"{value:9.1f}"
+
+def print_results(results):
+    print(f"{'scenario':<26}{'reqs':>6}{'errors':>7}{'rps':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for r in results:
+        print(f"{r['scenario']:<26}{r['requests']:>6}{r['errors']:>7}{fmt(r['throughput_rps'])} "
+              f"{fmt(r['p50_ms'])}{fmt(r['p90_ms'])}{fmt(r['p99_ms'])}{fmt(r['max_ms'])}")
+
+def print_comparison(baseline, results):
+    old = {r["scenario"]: r for r in baseline["results"]}
+    print(f"\nComparison with {baseline['label']} (negative latency change is better):")
+    print(f"{'scenario':<26}{'rps change':>12}{'p50 change':>12}{'p99 change':>12}")
+    for r in results:
+        b = old.get(r["scenario"])
+        if b is None:
+            continue
+        def change(key):
+            if not b.get(key) or r.get(key) is None:
+                return "-"
+            return f"{(r[key] - b[key]) / b[key] * 100:+.1f}%"
+        print(f"{r['scenario']:<26}{change('throughput_rps'):>12}{change('p50_ms'):>12}{change('p99_ms'):>12}")
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+#####################################################
+#                 Main                              #
+#####################################################
+async def run(args):
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    connector_url = f"http://127.0.0.1:{args.port}"
+    workdir = Path(tempfile.mkdtemp(prefix="edge-connector-bench-"))
+    if args.cert_dir: # DLR mode needs tls.crt/tls.key next to the Edge-Connector
+        for name in ("tls.crt", "tls.key"):
+            shutil.copy(Path(args.cert_dir) / name, workdir / name)
+
+    mock = start_server("mock_dataspace:app", BENCH_DIR, args.mock_port, mock_env(mock_url, args), workdir, workdir / "mock.log")
+    connector = start_server("main:app", REPO_DIR, args.port, connector_env(mock_url, args), workdir, workdir / "connector.log",
+                             workers=args.workers)
+    try:
+        wait_until_ready(f"{mock_url}/docs", mock)
+        wait_until_ready(f"{connector_url}/", connector)
+        results = []
+        timeout = httpx.Timeout(args.timeout)
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=connector_url, timeout=timeout, limits=limits) as client:
+            for scenario in args.scenarios:
+                print(f"Running {scenario} ...")
+                results.append(await run_scenario(client, scenario, args, mock_url))
+    finally:
+        for process in (connector, mock):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"Working directory kept at {workdir}")
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the Edge-Connector against a local mock dataspace")
+    parser.add_argument("--label", default=datetime.now().strftime("%Y%m%d-%H%M%S"), help="name of the result file")
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=60.0, help="client timeout in seconds")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="mock management API latency")
+    parser.add_argument("--catalog-latency-ms", type=float, default=50.0, help="mock catalog latency")
+    parser.add_argument("--dataplane-latency-ms", type=float, default=20.0, help="mock data plane latency")
+    parser.add_argument("--participants", type=int, default=10, help="providers in the federated catalog")
+    parser.add_argument("--datasets", type=int, default=100, help="KITs per provider")
+    parser.add_argument("--payload-bytes", type=int, default=1024 * 1024, help="size of each KIT payload")
+    parser.add_argument("--objects", type=int, default=100, help="objects returned by the list endpoints")
+    parser.add_argument("--composite-kits", type=int, default=3, help="KITs per composite canvas")
+    parser.add_argument("--negotiate", action="store_true", help="force a contract negotiation on every transfer")
+    parser.add_argument("--dataspace", default="tsi", choices=["tsi", "dlr"])
+    parser.add_argument("--cert-dir", help="directory with tls.crt/tls.key (required for --dataspace dlr)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes of the Edge-Connector under test")
+    parser.add_argument("--port", type=int, default=8101, help="port of the Edge-Connector under test")
+    parser.add_argument("--mock-port", type=int, default=8100, help="port of the mock dataspace")
+    parser.add_argument("--compare", help="result JSON of a previous run to compare with")
+    parser.add_argument("--keep-workdir", action="store_true", help="keep the KIT-Workspace and server logs")
+    args = parser.parse_args()
+    if args.dataspace == "dlr" and not args.cert_dir:
+        parser.error("--dataspace dlr requires --cert-dir")
+    return args
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run(args))
+    print_results(results)
+
+    report = {
+        "label": args.label,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "label")},
+        "results": results,
+    }
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    result_path = RESULTS_DIR / f"{args.label}.json"
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"\nResults saved to {result_path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print_comparison(json.load(f), results)
+
+    # the latency of failing requests says nothing about the endpoint
+    failed = [r["scenario"] for r in results if r["errors"]]
+    if failed:
+        print(f"\nFAILED: requests of {', '.join(failed)} returned errors, their results are not valid", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
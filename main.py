@@ -1,20 +1,36 @@
-from fastapi import FastAPI, File, UploadFile, Form, status
+from fastapi import FastAPI, File, UploadFile, Form, Request, Response, status
 from src.utils import *
 from src.schemas import *
+from src.fastjson import FastJSONResponse
+from src.lifecycle import start_services, stop_services, is_ready, warmup_state
+from src.crawler import crawler_status
+from src.changefeed import event_stream
+from src.transfers import start_push_batch, push_batch_status, push_batches_status
+from src.callbacks import receive_event, callback_status, callback_authorized
+from src.settings import (get_settings, publish_settings, current_identity, use_identity, known_identities,
+                          is_valid_identity, identity_directory, default_identity)
+from contextlib import asynccontextmanager
 import uvicorn
-from dotenv import load_dotenv
-import os
 from pathlib import Path
-import zipfile
 
 #####################################################
 #                 Global Variables                  #
 #####################################################
+get_settings() # load the .env variables into the settings snapshot
+
+@asynccontextmanager
+# Purpose: warm up (token, pooled connections, catalog index) at startup and clean up at shutdown
+async def lifespan(app: FastAPI):
+    await start_services()
+    yield
+    await stop_services()
+
 app = FastAPI(
     title="KIT-GUI",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=FastJSONResponse, # orjson-based if orjson is installed
+    lifespan=lifespan
 )
-load_dotenv() # load all .env variables
 
 #####################################################
 #                Frontend Connection                #
@@ -33,6 +49,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+#####################################################
+#                Dataspace Overload                 #
+#####################################################
+@app.exception_handler(DataspaceUnavailable)
+# Purpose: a dataspace call was rejected (open circuit or full queue), the client may retry later
+async def _dataspace_unavailable(request: Request, exc: DataspaceUnavailable):
+    return FastJSONResponse({"detail": str(exc)}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={"Retry-After": str(exc.retry_after)})
+
+#####################################################
+#                Request Tracing                    #
+#####################################################
+from src.tracing import start_span
+@app.middleware("http")
+# Purpose: open a root span per request (continues the caller's traceparent if given)
+async def _trace_request(request: Request, call_next):
+    with start_span(f"{request.method} {request.url.path}", traceparent=request.headers.get("traceparent")) as span:
+        response = await call_next(request)
+        if span is not None:
+            span.set_attribute("http.status_code", response.status_code)
+            response.headers["traceparent"] = span.traceparent()
+    return response
+
+#####################################################
+#                Request Profiling                  #
+#####################################################
+from src.profiling import should_profile, profile_call, arm_profiler, armed_routes, list_profiles, profiling_enabled
+@app.middleware("http")
+# Purpose: profile the request if the route is armed or the X-Edge-Profile header is set (PROFILING=true only)
+async def _profile_request(request: Request, call_next):
+    if should_profile(request.url.path, request.headers.get("X-Edge-Profile")):
+        return await profile_call(f"{request.method} {request.url.path}", lambda: call_next(request))
+    return await call_next(request)
+
+#####################################################
+#                Connector Identity                 #
+#####################################################
+@app.middleware("http")
+# Purpose: serve the request as the connector identity given in the X-Connector-Id header (default identity otherwise)
+#          /register also accepts a new identity, which is created by registering its certificates
+async def _select_connector(request: Request, call_next):
+    identity = request.headers.get("X-Connector-Id")
+    if not identity:
+        return await call_next(request)
+    if not is_valid_identity(identity) or (identity not in known_identities() and request.url.path != "/register"):
+        return FastJSONResponse({"detail": f"Unknown connector identity {identity}"}, status_code=status.HTTP_404_NOT_FOUND)
+    with use_identity(identity):
+        return await call_next(request)
+
 #####################################################
 #                Global Variables                   #
 #####################################################
@@ -46,23 +111,28 @@ def root():
     return {"message": "Edge Connector Started"}
 
 @app.post("/register")
-# Purpose: To receive certificate files from the user
+# Purpose: To receive certificate files from the user (for the connector identity of the request)
 def _register_certificates(
         conn_name: str = Form(...),
         tls_crt: UploadFile = File(...),
         tls_key: UploadFile = File(...)
     ):
+    identity = current_identity.get()
+    directory = Path(identity_directory(identity))
+    directory.mkdir(parents=True, exist_ok=True)
+    env_path = directory / ".env"
     
     # save the certificate files
-    with open("tls.crt", "wb") as buffer:
+    with open(directory / "tls.crt", "wb") as buffer:
         buffer.write(tls_crt.file.read())
-    with open("tls.key", "wb") as buffer:
+    with open(directory / "tls.key", "wb") as buffer:
         buffer.write(tls_key.file.read())
 
     # read .env file and update the CONNECTOR_NAME value
     buffered_lines = []
     update = False
-    with open(".env", "r", encoding="utf-8") as f:
+    env_path.touch(exist_ok=True) # a new identity starts with an empty .env (the default .env is inherited)
+    with open(env_path, "r", encoding="utf-8") as f:
         for line in f:
             raw = line
             stripped = raw.lstrip()
@@ -85,13 +155,16 @@ def _register_certificates(
         buffered_lines.append(f"CONNECTOR_NAME={conn_name}\n")
 
     # write back all the variables
-    with open(".env", "w") as f:
+    with open(env_path, "w") as f:
         f.writelines(buffered_lines)
 
-    # update the value
-    load_dotenv(override=True)
-    os.environ["CONNECTOR_NAME"] = conn_name
-    return {"message": "Certificates registered"}
+    # swap in the new settings in all workers (the URLs depending on CONNECTOR_NAME are rebuilt)
+    # and drop the tokens and EDRs obtained with the previous certificate
+    publish_settings(identity, CONNECTOR_NAME=conn_name)
+    clear_token_cache(identity)
+    clear_edr_cache(identity)
+    invalidate_management_cache(identity=identity) # a new CONNECTOR_NAME is another connector
+    return {"message": "Certificates registered", "connector_id": identity}
 
 
 #####################################################
@@ -100,20 +173,20 @@ def _register_certificates(
 @app.get("/livecheck")
 # Purpose: check the edge-connector authentication to the dataspace
 async def _livecheck():
+    settings = get_settings()
+    adapter = settings.adapter
     # for DLR dataspace, the liveness is checked by retreiving a token from the dlr dataspace
-    if os.getenv('DATASPACE').casefold() == 'DLR'.casefold():
-        crt_exists = os.path.isfile("tls.crt")
-        key_exists = os.path.isfile("tls.key")
-        if crt_exists and key_exists:
-            data = await get_token_header()
+    if adapter is not None and adapter.livecheck == 'token':
+        if settings.has_certificate():
+            data = await get_token_header(force=True) # always check with a new token
             print(f'data is {data}')
             if len(data["Authorization"]) > 10: # check if there is token received
                 return {"online": True}
         return {"online": False}
     # for T-System dataspace, the liveness is checked by reading an asset
-    elif os.getenv('DATASPACE').casefold() == 'TSI'.casefold(): 
+    elif adapter is not None and adapter.livecheck == 'asset':
         try:
-            data = await get_objects('asset', 1, 0)
+            data = await get_objects('asset', 1, 0, cached=False)
             return {"online": True}
         except (httpx.RequestError, httpx.HTTPStatusError):
             return {"online": False}
@@ -121,10 +194,27 @@ async def _livecheck():
     else:
         return {"online": False}
 
+@app.get("/connectors")
+# Purpose: list the connector identities served by this edge-connector (select one with the X-Connector-Id header)
+def _get_connectors():
+    return [
+        {"connector_id": identity, "connector_name": get_settings(identity).connector_name,
+         "dataspace": get_settings(identity).dataspace, "default": identity == default_identity}
+        for identity in known_identities()
+    ]
+
+@app.get("/readiness")
+# Purpose: report whether the edge-connector is warm (token, pooled connections and catalog index ready)
+#          unlike /livecheck, this does not contact the dataspace
+def _readiness():
+    ready = is_ready()
+    content = {"ready": ready, "warmup": warmup_state, "catalog": catalog_status()}
+    return FastJSONResponse(content, status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
 @app.get("/policies")
 # Purpose: To return all available policies 
 async def _get_policies(page: int=0, limit: int=100):
-    return await get_objects('policy', limit, page)
+    return FastJSONResponse(await get_objects('policy', limit, page))
 
 @app.get("/policy/{id}")
 # Purpose: To get the policy definition of the given id
@@ -134,12 +224,12 @@ async def _get_policy(id: str):
 @app.get("/assets")
 # Purpose: return all the assets the current user created
 async def _get_assets(page: int=0, limit: int=100):
-    return await get_objects('asset', limit, page)
+    return FastJSONResponse(await get_objects('asset', limit, page))
 
 @app.get("/contracts")
 # Purpose: return all the contracts I defined
 async def _get_contracts(page: int=0, limit: int=100):
-    return await get_objects('contract', limit, page)
+    return FastJSONResponse(await get_objects('contract', limit, page))
 
 @app.get("/assets/{id}")
 # Purpose: return the specific asset detail
@@ -156,6 +246,21 @@ async def _delete_asset(id: str):
 async def _delete_contract(id: str):
     return await delete_contract(id)
 
+@app.post("/delete/assets")
+# Purpose: To delete many assets (by ids or QuerySpec filter), the contract definitions offering them are deleted first
+async def _delete_assets(input: BulkDeleteData):
+    return await delete_objects("asset", **input.model_dump())
+
+@app.post("/delete/contracts")
+# Purpose: To delete many contract definitions (by ids or QuerySpec filter)
+async def _delete_contracts(input: BulkDeleteData):
+    return await delete_objects("contract", **input.model_dump())
+
+@app.post("/delete/negotiations")
+# Purpose: To terminate many contract negotiations (by ids or QuerySpec filter)
+async def _delete_negotiations(input: BulkDeleteData):
+    return await delete_objects("negotiation", **input.model_dump())
+
 @app.post("/kit/basic/create/http") # DEPRECATED
 @app.post("/create/basickit")
 # Purpose: To create a basic KIT as a HTTP type asset
@@ -163,14 +268,8 @@ async def _create_basic_kit(input: BasicKitData):
     data = input.model_dump()
     access_info = data["access_info"]
 
-    # create the KIT Metadata 
-    kit_metadata = data["general_info"] | data['additional_info'] 
-    kit_metadata['semantic_model'] = data["semantic_model"]
-    kit_metadata['asset_type'] = access_info['asset_type']
-
-    # overwrite the domain and standard values based on the .env file
-    kit_metadata['standardisation'] = os.getenv('STANDARDISATION')
-    kit_metadata['DOMAIN'] = os.getenv('DOMAIN')
+    # create the KIT Metadata (domain and standard values are based on the .env file)
+    kit_metadata = build_kit_metadata(data)
     
     if access_info['asset_type'].casefold() == "http".casefold():
         return await create_http_asset(kit_metadata, access_info)
@@ -185,22 +284,18 @@ async def _create_composite_kit(input: CompositeKitData):
     data = input.model_dump()
     access_info = data["access_info"]
     
-    # create the KIT Metadata
-    if 'components' in data: # Flattening
-        kit_metadata = data["general_info"] | data['additional_info'] | {"components": data["components"]}
-    else:
-        kit_metadata = data["general_info"] | data['additional_info']
-    kit_metadata['asset_type'] = access_info['asset_type']
-    kit_metadata['semantic_model'] = data["semantic_model"]
-
-    # overwrite the domain and standard values based on the .env file
-    kit_metadata['standardisation'] = os.getenv('STANDARDISATION')
-    kit_metadata['DOMAIN'] = os.getenv('DOMAIN')
+    # create the KIT Metadata (components are flattened, domain and standard values are based on the .env file)
+    kit_metadata = build_kit_metadata(data)
     
     if access_info['asset_type'].casefold() == "http".casefold():
         return await create_http_asset(kit_metadata, access_info)
     return {}
 
+@app.post("/create/kits")
+# Purpose: To publish many KITs at once: the assets and their contract definitions are created concurrently
+async def _create_kits(input: BulkKitData):
+    return await publish_kits(input.model_dump()["kits"], input.concurrency)
+
 @app.post("/kit/basic/create/aws")
 # Purpose: To create a basic KIT as a amazons3 type asset
 async def _create_basic_kit_amazon_asset(input: CompositeKitData):
@@ -226,12 +321,23 @@ async def _create_contract(input: createContract):
 @app.get("/federatedcatalog")
 # Purpose: return federated catalog
 async def _forwarding_data():
-    return await get_federated_catalog()
+    return await stream_federated_catalog()
 
 @app.get("/federatedcatalog/{query}")
 # Purpose: To filter all offered kits based on the query
 async def _search_kits(query: str):
-    return await search_by_query(query)
+    result = await search_by_query(query)
+    return FastJSONResponse(result, headers=catalog_headers())
+
+@app.get("/events")
+# Purpose: push the added, removed and changed KITs of the federated catalog and of our assets (Server-Sent Events)
+async def _change_events(request: Request, topics: str = "catalog,assets"):
+    topic_set = {t.strip() for t in topics.split(",")} & {"catalog", "assets"}
+    if not topic_set:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Unknown topics, use catalog and/or assets")
+    last_event_id = request.headers.get("Last-Event-ID") or None
+    return StreamingResponse(event_stream(topic_set, last_event_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.put("/asset")
 # Purpose: To edit the asset information
@@ -240,23 +346,47 @@ async def _edit_asset(input: editAssetData):
 
 @app.get("/provider/{provider_id}/offers/{asset_id}")
 # Purpose: get all offers linked to an asset id 
-async def _kit_contracts(provider_id: str, asset_id: str):
-    return await get_target_offer_by_id(provider_id, asset_id)
+async def _kit_contracts(provider_id: str, asset_id: str, http_response: Response):
+    offer = await get_target_offer_by_id(provider_id, asset_id)
+    http_response.headers.update(catalog_headers())
+    return offer
 
 @app.post("/catalog")
+# Purpose: return the KIT catalog of a provider (served from the catalog crawler if fresh)
 async def _kit_catalog(input: CatalogRequestData):
     if input.kit_name is None:
-        return await get_catalog(input.provider_id, input.connector_url)
+        return await get_catalog_cached(input.provider_id, input.connector_url)
     else:
-        return await get_catalog(input.provider_id, input.connector_url, input.kit_name)
+        return await get_catalog_cached(input.provider_id, input.connector_url, input.kit_name)
+
+@app.get("/crawler")
+# Purpose: return the status of the catalog crawler per provider
+async def _crawler_status():
+    return crawler_status()
+
+@app.get("/workspace")
+# Purpose: return the usage of the KIT-Workspace blob store (deduplicated KIT files)
+async def _workspace_status():
+    return await asyncio.to_thread(workspace_status)
+
+@app.get("/workspace/kits")
+# Purpose: list the KITs stored in the KIT-Workspace (KIT inventory), most recently saved first
+async def _local_kits(page: int=0, limit: int=100, provider_id: str | None=None, kit_type: str | None=None):
+    return await asyncio.to_thread(list_local_kits, page, limit, provider_id, kit_type)
+
+@app.get("/resilience")
+# Purpose: return the limits, circuit breakers and retry budget of the dataspace calls
+async def _resilience_status():
+    return resilience_status()
 
 @app.post("/download/kit")
 # Purpose: any KIT data will be saved as a file in the local memory. 
 #          If the KIT is a service endpoint, then the response is saved as a JSON file.
-async def _kit_download(input: KitAccessRequest):
+async def _kit_download(input: KitAccessRequest, http_response: Response):
     request_data = input.model_dump()
     # retrieve the kit metadata
     metadata = await get_target_offer_by_id(request_data['provider_id'], request_data['kit_name'])
+    http_response.headers.update(catalog_headers())
     if not metadata:
         return {"success": False, "message": "KIT cannot be found"}
     metadata.pop("dcat:distribution", None)
@@ -281,10 +411,11 @@ async def _kit_download(input: KitAccessRequest):
 @app.post("/read-content/kit")
 # Purpose: any KIT data will be returned as the response to the user request
 #          This endpoint is essentially identical to save-to-file, but without saving into a file
-async def _kit_read(input: KitAccessRequest):
+async def _kit_read(input: KitAccessRequest, http_response: Response):
     request_data = input.model_dump()
     # retrieve the kit metadata
     metadata = await get_target_offer_by_id(request_data['provider_id'], request_data['kit_name'])
+    http_response.headers.update(catalog_headers())
     if not metadata:
         return {"success": False, "message": "KIT cannot be found"}
     metadata.pop("dcat:distribution", None)
@@ -301,19 +432,42 @@ async def _kit_read(input: KitAccessRequest):
     # trigger the downloading process based on the asset type
     if metadata['asset_type'].casefold() == 'http'.casefold(): # http type case
         success, response = await http_transfer(request_data, policy, metadata, save_to_file=False, prefix = '')
-        return {"success": success, "message": "Read-content execution completed", "metadata": metadata, "response": response}
+        if response is None:
+            return {"success": False, "message": "KIT data cannot be transferred", "metadata": metadata}
+        return {"success": success and response.is_success, "message": "Read-content execution completed", "metadata": metadata,
+                "status_code": response.status_code, "response": response_content(response)}
     else: # TODO: aws, azure, etc. cases
         return {"success": False, "message": f"Unknown asset type {metadata['asset_type']}"}
 
-#TODO:
 @app.post("/send-to-else/kit")
-# Purpose: basic kit transfer
-async def _negotiate(input: KitAccessRequest):
-    return {"message": "Not yet implemented"}
+# Purpose: any KIT data will be sent by the provider to the given endpoint (HTTP push)
+#          The data does not pass this connector nor the local memory
+async def _negotiate(input: SendToRequest, http_response: Response):
+    request_data = input.model_dump()
+    # retrieve the kit metadata
+    metadata = await get_target_offer_by_id(request_data['provider_id'], request_data['kit_name'])
+    http_response.headers.update(catalog_headers())
+    if not metadata:
+        return {"success": False, "message": "KIT cannot be found"}
+    metadata.pop("dcat:distribution", None)
+    
+    # check that required information is provided 
+    if 'asset_type' not in metadata:
+        return {"success": False, "message": "Invalid KIT format: asset_type information is missing"}
+    
+    # extract the policy info from the kit metadata
+    policy = metadata.pop('odrl:hasPolicy')[0] # TODO: currently we fetch the first policy
+
+    # trigger the push transfer based on the asset type
+    if metadata['asset_type'].casefold() == 'http'.casefold(): # http type case
+        success, transfer = await push_transfer(request_data, policy, request_data['endpoint_url'])
+        return {"success": success, "message": "Send-to execution started", "metadata": metadata, "transfer": transfer}
+    else: # TODO: aws, azure, etc. cases
+        return {"success": False, "message": f"Unknown asset type {metadata['asset_type']}"}
 
 @app.post("/http/transfer_2url")
 async def _transfer(input: httpTransfer2url):
-    if input.assert_type == 'http':
+    if input.asset_type == 'http':
         return await http_transfer_2url(input.originator, input.agreement_id, input.endpoint_url)
     else:
         raise HTTPException(
@@ -321,6 +475,55 @@ async def _transfer(input: httpTransfer2url):
             detail="Asset type other than http is not implemented"
         )
 
+@app.post("/http/transfers_2url")
+# Purpose: start many push transfers (e.g., one agreement to many endpoints) at once and follow them in the background
+async def _push_transfers(input: PushTransferData):
+    if any(t.asset_type != 'http' for t in input.transfers):
+        raise HTTPException(
+            status_code = 422,
+            detail="Asset type other than http is not implemented"
+        )
+    batch = start_push_batch([t.model_dump() for t in input.transfers], input.concurrency, input.timeout)
+    return batch.status(details=False)
+
+@app.get("/http/transfers_2url")
+# Purpose: return the progress of the recent push transfer batches
+async def _push_transfer_batches():
+    return push_batches_status()
+
+@app.get("/http/transfers_2url/{batch_id}")
+# Purpose: return the progress of a push transfer batch and its transfers, waiting up to `wait` seconds for it to finish
+async def _push_transfer_batch(batch_id: str, wait: float = 0):
+    status = await push_batch_status(batch_id, min(wait, 60))
+    if status is None:
+        raise HTTPException(
+            status_code = 404,
+            detail="Push transfer batch not found"
+        )
+    return status
+
+@app.post("/callbacks/edc")
+# Purpose: receive the negotiation and transfer events of the EDC (CALLBACK_URL) and resume the requests waiting for them
+#          the events must carry the token of CALLBACK_URL, connector_id is the identity whose request they are about
+async def _edc_callback(request: Request, token: str = "", connector_id: str = default_identity):
+    if connector_id not in known_identities() or not callback_authorized(connector_id, token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid callback token")
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The events are not valid JSON")
+    events = body if isinstance(body, list) else [body]
+    with use_identity(connector_id):
+        for event in events:
+            if isinstance(event, dict):
+                await receive_event(event)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@app.get("/callbacks/edc")
+# Purpose: return whether EDC callbacks are used, the number of events received and of waiting requests
+async def _edc_callback_status():
+    return callback_status()
+
 @app.post("/run/compositekit")
 async def _compositekit_runner(input: CanvasData):
     canvas = input.model_dump()
@@ -346,58 +549,44 @@ async def _compositekit_runner(input: CanvasData):
 @app.get("/run/compositekit/{provider_id}/{kit_name}")
 # Purpose: Access all KITs inside a composite KIT alrady saved in the local memory
 async def _compositekit_handler(provider_id: str, kit_name: str):
-    # find the locally saved kit with the matching kit_name
-    kit_workspace_path = Path.cwd() / "KIT-Workspace"
+    # find the locally saved kit with the matching kit_name (KIT inventory)
     folder_to_find = f'{provider_id}-{kit_name}'
-    kit_folder_path = kit_workspace_path / folder_to_find
-    canvas_path = kit_folder_path / 'canvas'
+    kit = await asyncio.to_thread(find_local_kit, '', provider_id, kit_name)
 
     # check if the kit is located in the local memory
-    if not kit_folder_path.is_dir():
+    if kit is None:
         raise HTTPException( 
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail="Specified KIT folder is not found"
         )
-    
-    # check if metadata is also saved in the folder
-    metadata_file = kit_folder_path / "metadata.json"
-    if not metadata_file.is_file():
-        raise HTTPException( 
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="The KIT metadata is not found or in an invalid format"
-        )
+    kit_folder_path = kit['path']
     
     # retrieve the metadata and check the required information is present
-    with metadata_file.open("r", encoding="utf-8") as f:
-        metadata = json.load(f)
+    metadata = kit['metadata']
     if 'kit_type' not in metadata or metadata['kit_type'] != 'composite': # check the kit type is 'composite'
         raise HTTPException( 
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail="The KIT found is not a composite KIT"
         )
-    if not canvas_path.is_file(): # check there is a valid canvas file
+    compression = kit['compression']
+    canvas_path = kit_folder_path / kit['canvas'] if kit['canvas'] is not None else None # canvas, canvas.zst or canvas.gz
+    if canvas_path is not None and compression is not None:
+        canvas_path = canvas_path.with_name(canvas_path.name + suffixes[compression])
+    if canvas_path is None or not canvas_path.is_file(): # check there is a valid canvas file
         raise HTTPException( 
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail="Canvas file not found or not a file"
         )
 
-    # If the canvas file is a zip file, unzip it
-    if zipfile.is_zipfile(canvas_path):
-        zip_path = kit_folder_path / 'canvas.zip'
-        canvas_path.rename(zip_path) # rename the zip file so that the extracted canvas file do not conflict with the same name
-        with zipfile.ZipFile(zip_path, 'r') as z:
-            z.extractall(kit_folder_path)
+    # Read the canvas file (a JSON file, or the canvas inside a zip file), parsed once per file version
+    canvas = await asyncio.to_thread(load_canvas, canvas_path, compression)
     
-    # check if the canvas file exists
-    if not canvas_path.is_file():
+    # check if the canvas exists (zip files)
+    if canvas is None:
         raise HTTPException( 
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail="Canvas file not found"
         )
-
-    # Read the canvas file
-    with canvas_path.open('r', encoding='utf-8') as f:
-        canvas = json.load(f)
     
     # add provider_id information in the metadata for processing
     metadata['provider_id'] = provider_id
@@ -416,12 +605,12 @@ async def _get_negotiations(page: int=0, limit: int=100):
         "operator": "=",
         "operandRight": "FINALIZED"
     }]
-    return await get_objects('negotiation', limit, page, filter)
+    return FastJSONResponse(await get_objects('negotiation', limit, page, filter))
 
 @app.get("/agreements")
 # Purpose: To show all the objects ready-for-transfer
 async def _get_agreements(page: int=0, limit: int=100):
-    return await get_objects('agreement', limit, page)
+    return FastJSONResponse(await get_objects('agreement', limit, page))
 
 @app.delete("/negotiation/{neg_id}")
 # Purpose: To terminates the contract negotiation
@@ -431,7 +620,21 @@ async def _delete_negotiation(neg_id: str):
 @app.get("/edrs")
 # Purpose: To return all edrs
 async def _get_edrs(page: int=0, limit: int=100):
-    return await get_objects('edrs', limit, page)
+    return FastJSONResponse(await get_objects('edr', limit, page))
+
+@app.post("/admin/profile")
+# Purpose: To profile the next N requests to the given route (results in KIT-Workspace/profiles)
+def _arm_profiler(input: ProfileRequest):
+    if not profiling_enabled():
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Profiling is disabled (set PROFILING=true)")
+    return {"armed": arm_profiler(input.route, input.count)}
+
+@app.get("/admin/profile")
+# Purpose: To return the armed routes and the profiles written so far
+def _get_profiles():
+    if not profiling_enabled():
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Profiling is disabled (set PROFILING=true)")
+    return {"armed": dict(armed_routes), "profiles": list_profiles()}
 
 #####################################################
 #            Plugin Routers                         #
@@ -439,4 +642,8 @@ async def _get_edrs(page: int=0, limit: int=100):
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8001, reload=True)
+    workers = get_settings().workers
+    if workers > 1: # production mode: the workers share tokens, EDRs and catalogs through the store
+        uvicorn.run("main:app", host="0.0.0.0", port=8001, workers=workers)
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8001, reload=True)
@@ -0,0 +1,131 @@
+import time
+import asyncio
+import secrets
+from urllib.parse import urlsplit, urlunsplit, parse_qs, urlencode
+from src.settings import get_settings, current_identity, default_identity
+from src.store import get_store
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# EDC callbacks: with CALLBACK_URL (e.g., http://edge-box:8001/callbacks/edc?token=<secret>), the negotiations and transfers
+# started by this connector ask the EDC to post their state changes (events) to it. The token is a shared secret: events
+# without it are rejected, and a CALLBACK_URL without a token leaves the callbacks disabled. The connector identity is
+# added to the callback address (connector_id), the events of each identity are kept apart.
+# The waiters are resolved by the negotiation id, transfer process id or asset id of the event, so a transfer goes on
+# as soon as its agreement is finalized. The last event of each id is kept in the shared store for a while: for the
+# waiters of the other workers and for events arriving before their waiter. Polling the management API remains the
+# fallback (no CALLBACK_URL, or no event in time).
+callback_events = ("contract.negotiation", "transfer.process")
+event_ttl = 600 # seconds an event is kept
+store_check = 0.5 # seconds between the checks of the shared store (events received by other workers)
+waiters = {} # (identity, kind, id) -> futures of the waiting requests
+callback_state = {"received": 0, "last_event": None}
+
+
+#####################################################
+#                 Utility Functions                 #
+#####################################################
+# shared secret of the callbacks (token query parameter of CALLBACK_URL), None if there is none
+def callback_token(settings):
+    if not settings.callback_url:
+        return None
+    return parse_qs(urlsplit(settings.callback_url).query).get("token", [None])[0] or None
+
+def callbacks_enabled():
+    return callback_token(get_settings()) is not None
+
+# whether an event posted for the identity carries its callback token (compared in constant time)
+def callback_authorized(identity, token):
+    expected = callback_token(get_settings(identity))
+    return expected is not None and secrets.compare_digest(token.encode(), expected.encode())
+
+# callbackAddresses of a negotiation or transfer request of the current identity (empty without callbacks)
+def callback_addresses():
+    if not callbacks_enabled():
+        return []
+    url = urlsplit(get_settings().callback_url)
+    query = parse_qs(url.query)
+    if current_identity.get() != default_identity:
+        query["connector_id"] = [current_identity.get()]
+    uri = urlunsplit(url._replace(query=urlencode(query, doseq=True)))
+    return [{"uri": uri, "events": list(callback_events), "transactional": False}]
+
+def event_key(kind, id):
+    return f"callback:{current_identity.get()}:{kind}:{id}"
+
+# the (kind, id) pairs an EDC event is about
+def event_subjects(event):
+    type = event.get("type") or ""
+    payload = event.get("payload") or {}
+    subjects = []
+    if type.startswith("ContractNegotiation"):
+        negotiation_id = payload.get("contractNegotiationId") or payload.get("id")
+        if negotiation_id:
+            subjects.append(("negotiation", negotiation_id))
+    elif type.startswith("TransferProcess"):
+        transfer_id = payload.get("transferProcessId") or payload.get("id")
+        if transfer_id:
+            subjects.append(("transfer", transfer_id))
+        if payload.get("assetId"): # the EDR of the asset is available once its transfer is started
+            subjects.append(("asset", payload["assetId"]))
+    return subjects
+
+# state of a transfer process from its event, e.g., TransferProcessCompleted -> COMPLETED
+def event_state(event):
+    return (event.get("type") or "").removeprefix("TransferProcess").removeprefix("ContractNegotiation").upper() or None
+
+
+#####################################################
+#                 Events                            #
+#####################################################
+# record an EDC event of the current identity and resolve its waiters, return the (kind, id) pairs it was about
+async def receive_event(event):
+    subjects = event_subjects(event)
+    event = event | {"received_at": time.time()}
+    store = get_store()
+    identity = current_identity.get()
+    for kind, id in subjects:
+        await store.aset(event_key(kind, id), event, ttl=event_ttl)
+        for future in waiters.pop((identity, kind, id), ()):
+            if not future.done():
+                future.set_result(event)
+    callback_state["received"] += 1
+    callback_state["last_event"] = event.get("type")
+    return subjects
+
+# wait up to timeout seconds for an event about one of the subjects ((kind, id) pairs), received after `since`
+# and of one of the types (any type if None); return the event, or None if there was none in time
+async def wait_for_event(subjects, timeout, since=0, types=None):
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + timeout
+    identity = current_identity.get()
+    while True:
+        for kind, id in subjects:
+            event = await get_store().aget(event_key(kind, id))
+            if event is not None and event["received_at"] > since and (types is None or event.get("type") in types):
+                return event
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        future = loop.create_future()
+        for kind, id in subjects:
+            waiters.setdefault((identity, kind, id), set()).add(future)
+        try:
+            await asyncio.wait_for(future, min(remaining, store_check))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for kind, id in subjects:
+                futures = waiters.get((identity, kind, id))
+                if futures is not None:
+                    futures.discard(future)
+                    if not futures:
+                        del waiters[(identity, kind, id)]
+
+def callback_status():
+    url = get_settings().callback_url
+    return {"enabled": callbacks_enabled(), # the URL is shown without its token
+            "url": urlunsplit(urlsplit(url)._replace(query="")) if url else None,
+            "waiting": len(waiters)} | callback_state
@@ -0,0 +1,181 @@
+import json
+import time
+import base64
+import asyncio
+import hashlib
+from pathlib import Path
+from collections import deque
+from urllib.parse import urlsplit, urlunsplit, unquote
+import httpx
+from src.settings import get_settings, default_identity
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# CASSETTE_MODE=off|record|replay
+#   record: all dataspace requests are recorded (sanitised) into CASSETTE_PATH
+#   replay: dataspace requests are served from CASSETTE_PATH, nothing goes to the network
+# CASSETTE_TIMING=real|fast: replay with the recorded response times or as fast as possible
+REDACTED = "REDACTED"
+sensitive_headers = {"authorization", "x-api-key", "cookie", "set-cookie", "proxy-authorization"}
+sensitive_fields = {"access_token", "refresh_token", "id_token", "authorization", "client_secret",
+                    "password", "secretaccesskey", "accesskeyid", "api-key", "apikey"}
+sensitive_parameters = sensitive_fields | {"token"} # query parameters, e.g., the callback token in callbackAddresses
+replay_transport = None # the replay transport is shared by all clients (loaded once)
+
+
+#####################################################
+#                 Utility Functions                 #
+#####################################################
+def cassette_mode():
+    return get_settings(default_identity).cassette_mode
+
+def cassette_path():
+    return Path(get_settings(default_identity).cassette_path)
+
+# return the transport to be used by dataspace clients, None if cassettes are disabled
+# options: connection options of the client (see transport_options in src/utils.py)
+def cassette_transport(**options):
+    global replay_transport
+    mode = cassette_mode()
+    if mode == "record":
+        return RecordingTransport(httpx.AsyncHTTPTransport(**options), cassette_path())
+    if mode == "replay":
+        if replay_transport is None:
+            replay_transport = ReplayTransport(cassette_path(), real_timing=(get_settings(default_identity).cassette_timing == "real"))
+        return replay_transport
+    return None
+
+# replace credentials in a (nested) JSON value, also in the query of the URLs it contains
+def sanitize_json(value):
+    if isinstance(value, dict):
+        return {k: REDACTED if k.casefold() in sensitive_fields else sanitize_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [sanitize_json(v) for v in value]
+    if isinstance(value, str) and "://" in value and "?" in value:
+        return sanitize_url(value)
+    return value
+
+# replace the values of the credential query parameters, the rest of the URL is kept as it is
+def sanitize_url(url):
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = "&".join(
+        f"{name}={REDACTED}" if unquote(name).casefold() in sensitive_parameters else parameter
+        for parameter in parts.query.split("&")
+        for name in [parameter.split("=", 1)[0]]
+    )
+    return urlunsplit(parts._replace(query=query))
+
+def sanitize_headers(headers):
+    return {k: REDACTED if k.casefold() in sensitive_headers else v for k, v in headers.items()}
+
+# encode a body for the cassette: JSON as-is, text as string, everything else as base64
+def encode_body(content, content_type):
+    if not content:
+        return {"encoding": "empty"}
+    if "json" in (content_type or ""):
+        try:
+            return {"encoding": "json", "data": sanitize_json(json.loads(content))}
+        except ValueError:
+            pass
+    if "form-urlencoded" in (content_type or ""):
+        return {"encoding": "form", "data": REDACTED} # token requests carry credentials
+    try:
+        return {"encoding": "text", "data": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"encoding": "base64", "data": base64.b64encode(content).decode("ascii")}
+
+def decode_body(body):
+    if body["encoding"] == "empty":
+        return b""
+    if body["encoding"] == "json":
+        return json.dumps(body["data"]).encode("utf-8")
+    if body["encoding"] == "base64":
+        return base64.b64decode(body["data"])
+    return body["data"].encode("utf-8")
+
+# key used to match a replayed request with a recorded one
+def request_key(method, url, body):
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{method} {url} {digest}"
+
+
+#####################################################
+#                 Transports                        #
+#####################################################
+# forwards requests to the network and records the sanitised exchange
+class RecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport, path):
+        self.transport = transport
+        self.path = path
+
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        content = await response.aread()
+        elapsed = time.perf_counter() - started
+
+        # the body is decoded by httpx, so the encoding headers are not recorded
+        headers = {k: v for k, v in response.headers.items() if k.casefold() not in ("content-encoding", "content-length", "transfer-encoding")}
+        record = {
+            "method": request.method,
+            "url": sanitize_url(str(request.url)),
+            "request_headers": sanitize_headers(request.headers),
+            "request_body": encode_body(request.content, request.headers.get("content-type")),
+            "status": response.status_code,
+            "response_headers": sanitize_headers(headers),
+            "response_body": encode_body(response.content, response.headers.get("content-type")),
+            "elapsed": elapsed
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        return httpx.Response(response.status_code, headers=headers, content=content,
+                              request=request, extensions=response.extensions)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+# serves recorded responses; repeated requests cycle through the matching recordings
+class ReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, path, real_timing=True):
+        self.real_timing = real_timing
+        self.by_key = {}     # method + url + body -> recordings
+        self.by_url = {}     # method + url -> recordings (fallback if the body differs)
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                key = request_key(record["method"], record["url"], record["request_body"])
+                self.by_key.setdefault(key, deque()).append(record)
+                self.by_url.setdefault(f"{record['method']} {record['url']}", deque()).append(record)
+        print(f"Cassette loaded: {sum(len(v) for v in self.by_key.values())} recordings from {path}")
+
+    def find(self, request):
+        body = encode_body(request.content, request.headers.get("content-type"))
+        url = sanitize_url(str(request.url)) # as recorded
+        for book, key in ((self.by_key, request_key(request.method, url, body)),
+                          (self.by_url, f"{request.method} {url}")):
+            recordings = book.get(key)
+            if recordings:
+                recordings.rotate(-1) # cycle, so that benchmarks can repeat the same requests
+                return recordings[-1]
+        return None
+
+    async def handle_async_request(self, request):
+        record = self.find(request)
+        if record is None:
+            print(f"Cassette has no recording for {request.method} {request.url}")
+            return httpx.Response(404, json={"error": "no recording in cassette"}, request=request)
+        if self.real_timing:
+            await asyncio.sleep(record["elapsed"])
+        return httpx.Response(record["status"], headers=record["response_headers"],
+                              content=decode_body(record["response_body"]), request=request)
+
+    async def aclose(self):
+        pass # shared by all clients, never closed
@@ -0,0 +1,350 @@
+import os
+import json
+import mmap
+import time
+import codecs
+from pathlib import Path
+from collections.abc import Sequence
+from src.fastjson import dumps, loads
+
+# ijson is optional: if installed (pip install ijson), it is used for the incremental parsing
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# dataset fields that are never used by the Edge-Connector and are dropped from the crawled provider offers
+unused_dataset_fields = {"dcat:distribution"}
+# dataset fields that are excluded from the search (semantic_model is flattened instead)
+unsearchable_fields = {"@id", "@type", "odrl:hasPolicy", "dcat:distribution", "semantic_model"}
+
+
+#####################################################
+#                 Federated Catalog Index           #
+#####################################################
+# Lookup and search index over the datasets of the federated catalog.
+# Catalogs are added one at a time while the federated catalog is streamed in,
+# so the full catalog JSON is never materialised. Once built, the index is served from its snapshot
+# (see map_snapshot): only the search fields stay in memory, the datasets are read when they are used.
+# The search covers all datasets and returns them unchanged; the lookups only cover the KITs (with a kit_name).
+class CatalogIndex:
+    def __init__(self):
+        self.participants = {}   # participantId -> originator (in catalog order)
+        self.datasets = []       # (participantId, dataset) in catalog order
+        self.kits = {}           # (participantId, kit_name) -> position of the KIT in datasets
+        self.search_records = [] # (position in datasets, casefolded search fields)
+        self.created_at = time.time()
+        self.source = "dataspace" # or "snapshot" if loaded from disk
+
+    def __len__(self):
+        return len(self.kits)
+
+    # add one catalog of the federated catalog
+    def add_catalog(self, catalog):
+        participant_id = catalog.get("dspace:participantId")
+        originator = catalog.get("originator")
+        if participant_id is None:
+            return
+        self.participants.setdefault(participant_id, originator)
+
+        datasets = catalog.get("dcat:dataset") or []
+        if not isinstance(datasets, list): # cast datasets into an array
+            datasets = [datasets]
+        for dataset in datasets:
+            if isinstance(dataset, dict):
+                self.add_dataset(participant_id, dataset)
+
+    def add_dataset(self, participant_id, dataset):
+        position = len(self.datasets)
+        self.datasets.append((participant_id, dataset))
+        self.search_records.append((position, search_fields(participant_id, dataset)))
+        # TODO: have better filtering out of the assets not meeting the KIT format
+        if dataset.get("kit_name") is not None:
+            self.kits.setdefault((participant_id, dataset["kit_name"]), position) # the first offer wins, as in the linear search
+
+    # (participantId, kit_name, KIT dataset) of each KIT
+    def kit_offers(self):
+        for (participant_id, kit_name), position in self.kits.items():
+            yield participant_id, kit_name, self.datasets[position][1]
+
+    # return a copy of the KIT offered by the provider with its participantId, originator and policy, otherwise, return an empty dict
+    def get_offer(self, participant_id, kit_name):
+        position = self.kits.get((participant_id, kit_name))
+        if position is None:
+            return {}
+        kit = dict(self.datasets[position][1])
+        kit["participantId"] = participant_id
+        kit["originator"] = self.participants[participant_id]
+        kit["policy"] = kit.get("odrl:hasPolicy")
+        return kit
+
+    # return the datasets matching the predicate, grouped per participant like the federated catalog
+    def search(self, predicate):
+        result = {p: [] for p in self.participants}
+        for position, record in self.search_records:
+            if predicate(record):
+                participant_id, dataset = self.datasets[position]
+                result[participant_id].append(dataset)
+        return [
+            {"dspace:participantId": p, "originator": self.participants[p], "dcat:dataset": kits}
+            for p, kits in result.items()
+        ]
+
+# fields of a dataset used for the search query (keys are casefolded)
+def search_fields(participant_id, dataset):
+    semantic_model = dataset.get("semantic_model")
+    fields = {k: v for k, v in dataset.items() if k not in unsearchable_fields}
+    if isinstance(semantic_model, dict):
+        fields.update(semantic_model)
+    fields = {k.casefold(): v for k, v in fields.items()}
+    fields["bpn"] = participant_id
+    return fields
+
+
+#####################################################
+#                 Catalog Snapshot                  #
+#####################################################
+# The last good index is persisted as a compact snapshot file:
+#   line 1: JSON header (created_at, participants, participant, kit_name and byte range of each dataset)
+#   rest:   the datasets as concatenated JSON documents
+# The snapshot is memory-mapped on load and the datasets are only decoded when accessed.
+def save_snapshot(index, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    records = []
+    offsets = []
+    position = 0
+    for participant_id, dataset in index.datasets:
+        data = dumps(dataset)
+        offsets.append([participant_id, dataset.get("kit_name"), position, len(data)])
+        records.append(data)
+        position += len(data)
+    header = {
+        "format": 2,
+        "created_at": index.created_at,
+        "participants": index.participants,
+        "datasets": offsets
+    }
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(dumps(header) + b"\n")
+        for data in records:
+            f.write(data)
+    os.replace(tmp_path, path) # atomic, readers never see a half-written snapshot
+
+# return the index stored in the snapshot file, None if there is no valid snapshot
+# records: the search fields of the datasets if they are known already (otherwise, built on the first search)
+def load_snapshot(path, records=None):
+    path = Path(path)
+    if not path.is_file() or path.stat().st_size == 0:
+        return None
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    end = mapped.find(b"\n")
+    if end < 0:
+        return None
+    header = loads(mapped[:end])
+    if header.get("format") != 2: # older snapshots are rebuilt from the dataspace
+        return None
+    return MappedCatalogIndex(mapped, end + 1, header, records)
+
+# save the index and return it served from the snapshot, so the datasets are not kept in memory
+def map_snapshot(index, path):
+    save_snapshot(index, path)
+    mapped = load_snapshot(path, records=index.search_records)
+    mapped.source = index.source
+    return mapped
+
+# lazily decoded (participantId, dataset) of a memory-mapped snapshot
+class MappedDatasets(Sequence):
+    def __init__(self, mapped, start, offsets):
+        self.mapped = mapped
+        self.ranges = [(p, start + offset, length) for p, _, offset, length in offsets]
+
+    def __getitem__(self, position):
+        participant_id, offset, length = self.ranges[position]
+        return participant_id, loads(self.mapped[offset:offset + length])
+
+    def __len__(self):
+        return len(self.ranges)
+
+class MappedCatalogIndex(CatalogIndex):
+    def __init__(self, mapped, start, header, records=None):
+        self.participants = header["participants"]
+        self.datasets = MappedDatasets(mapped, start, header["datasets"])
+        self.kits = {}
+        for position, (participant_id, kit_name, _, _) in enumerate(header["datasets"]):
+            if kit_name is not None:
+                self.kits.setdefault((participant_id, kit_name), position)
+        self.created_at = header["created_at"]
+        self.source = "snapshot"
+        self.records = records
+
+    # the search fields are only built when the snapshot is searched for the first time
+    @property
+    def search_records(self):
+        if self.records is None:
+            self.records = [
+                (position, search_fields(participant_id, dataset))
+                for position, (participant_id, dataset) in enumerate(self.datasets)
+            ]
+        return self.records
+
+
+#####################################################
+#                 Incremental Parsing               #
+#####################################################
+# yield the items of a top-level JSON array from an async iterator of byte chunks
+# peak memory is bounded by the largest single item, not by the whole document
+async def iter_json_array(chunks):
+    if ijson is not None:
+        async for item in ijson.items_async(AsyncChunkReader(chunks), "item", use_float=True):
+            yield item
+        return
+
+    parser = JSONArrayParser()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in chunks:
+        for item in parser.feed(utf8.decode(chunk)):
+            yield item
+        if parser.done:
+            return
+    for item in parser.feed(utf8.decode(b"", final=True), final=True):
+        yield item
+    if not parser.done:
+        raise ValueError("The federated catalog is not a complete JSON array")
+
+# incremental parser of the items of a top-level JSON array (standard library only)
+class JSONArrayParser:
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.started = False
+        self.done = False
+        self.retry_at = 0 # an incomplete item is only re-parsed after the buffer has doubled
+
+    # add text and return the items completed by it
+    def feed(self, text, final=False):
+        self.buffer += text
+        if self.done or (len(self.buffer) < self.retry_at and not final):
+            return []
+        items = []
+        pos = 0
+        while True:
+            pos = self.skip_separators(pos)
+            if pos >= len(self.buffer):
+                break
+            if not self.started:
+                if self.buffer[pos] != "[":
+                    raise ValueError("The federated catalog is not a JSON array")
+                self.started = True
+                pos += 1
+                continue
+            if self.buffer[pos] == "]":
+                self.done = True
+                break
+            try:
+                item, end = self.decoder.raw_decode(self.buffer, pos)
+            except json.JSONDecodeError:
+                self.retry_at = 2 * (len(self.buffer) - pos)
+                break
+            self.retry_at = 0
+            pos = end
+            items.append(item)
+        self.buffer = self.buffer[pos:]
+        return items
+
+    def skip_separators(self, pos):
+        separators = " \t\r\n," if self.started else " \t\r\n"
+        while pos < len(self.buffer) and self.buffer[pos] in separators:
+            pos += 1
+        return pos
+
+# file-like adapter for ijson.items_async
+class AsyncChunkReader:
+    def __init__(self, chunks):
+        self.chunks = chunks.__aiter__()
+        self.buffer = b""
+
+    async def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += await self.chunks.__anext__()
+            except StopAsyncIteration:
+                break
+        if size < 0:
+            data, self.buffer = self.buffer, b""
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+# build the index from the raw federated catalog chunks
+async def build_catalog_index(chunks):
+    index = CatalogIndex()
+    async for catalog in iter_json_array(chunks):
+        if isinstance(catalog, dict):
+            index.add_catalog(catalog)
+    return index
+
+
+#####################################################
+#                 Provider Offer Index              #
+#####################################################
+# KIT catalogs fetched directly from the providers (see src/crawler.py)
+class ProviderCatalogs:
+    def __init__(self):
+        self.catalogs = {} # provider_id -> (fetched_at, connector_url, catalog)
+        self.offers = {}   # (provider_id, kit_name) -> KIT offer in the federated catalog format
+
+    def update(self, provider_id, connector_url, catalog, fetched_at=None):
+        for key in [k for k in self.offers if k[0] == provider_id]:
+            del self.offers[key]
+        for dataset in catalog.get("dataset") or []:
+            offer = catalog_dataset_to_offer(provider_id, connector_url, dataset)
+            self.offers.setdefault((provider_id, offer["kit_name"]), offer)
+        self.catalogs[provider_id] = (fetched_at or time.time(), connector_url, catalog)
+
+    def age(self, provider_id):
+        if provider_id not in self.catalogs:
+            return None
+        return time.time() - self.catalogs[provider_id][0]
+
+    def fetched_at(self, provider_id):
+        return self.catalogs[provider_id][0] if provider_id in self.catalogs else None
+
+    def is_fresh(self, provider_id, max_age):
+        age = self.age(provider_id)
+        return age is not None and age < max_age
+
+    # return a copy of the provider catalog (only the given KIT if kit_name is set), None if unknown
+    def get_catalog(self, provider_id, kit_name=None):
+        if provider_id not in self.catalogs:
+            return None
+        catalog = dict(self.catalogs[provider_id][2])
+        datasets = catalog.get("dataset") or []
+        catalog["dataset"] = [d for d in datasets if kit_name is None or d.get("id") == kit_name]
+        return catalog
+
+    # return a copy of the KIT offer, otherwise, return an empty dict
+    def get_offer(self, provider_id, kit_name):
+        offer = self.offers.get((provider_id, kit_name))
+        return dict(offer) if offer is not None else {}
+
+# convert a dataset of a connector catalog into the format of the federated catalog
+def catalog_dataset_to_offer(provider_id, connector_url, dataset):
+    offer = {(k[4:] if k.startswith("edc:") else k): v for k, v in dataset.items()}
+    if "odrl:hasPolicy" not in offer and "hasPolicy" in offer:
+        offer["odrl:hasPolicy"] = offer.pop("hasPolicy")
+    for k in unused_dataset_fields | {"distribution"}:
+        offer.pop(k, None)
+    offer.setdefault("kit_name", offer.get("id") or offer.get("@id"))
+    offer["participantId"] = provider_id
+    offer["originator"] = connector_url
+    offer["policy"] = offer.get("odrl:hasPolicy")
+    return offer
+
+provider_catalogs = ProviderCatalogs() # shared by the crawler and the lookups
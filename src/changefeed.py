@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import deque
+from src.utils import get_catalog_index, get_objects
+from src.tracing import start_background_task
+from src.fastjson import dumps
+from src.settings import get_settings, default_identity, current_identity, use_identity
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# Successive snapshots of the federated catalog and of our assets are diffed and the
+# deltas are pushed to the subscribers of the /events endpoint (Server-Sent Events).
+# The snapshots are only taken while at least one client is subscribed.
+# The catalog is shared by all connector identities, the assets are tracked per identity.
+# The events and their history are kept per worker: the event ids carry the feed_epoch of the worker,
+# so a client reconnecting to another worker (WORKERS > 1) or after a restart is asked to resync.
+subscribers = {}        # queue of a connected client -> its connector identity
+history = deque(maxlen=200) # recent events, replayed to clients reconnecting with Last-Event-ID
+snapshots = {}          # (topic, identity) -> {key: (kit_name, version, fingerprint)}
+catalog_created_at = None # created_at of the catalog index of the last catalog snapshot
+feed_epoch = f"{os.getpid()}-{int(time.time())}"
+event_counter = 0
+poller_task = None
+
+
+#####################################################
+#                 Snapshots                         #
+#####################################################
+def fingerprint(value):
+    return hashlib.sha1(dumps(value)).hexdigest()
+
+# (kit_name, version, fingerprint) per KIT of the federated catalog
+def catalog_snapshot(index):
+    return {
+        f"{participant_id}/{kit_name}": (kit_name, offer.get("version"), fingerprint(offer))
+        for participant_id, kit_name, offer in index.kit_offers()
+    }
+
+# (kit_name, version, fingerprint) per asset of our connector
+async def asset_snapshot():
+    snapshot = {}
+    page, limit = 0, 500
+    while True:
+        assets = await get_objects('asset', limit, page)
+        for asset in assets:
+            properties = asset.get("properties", {})
+            kit_name = properties.get("kit_name", asset.get("@id"))
+            snapshot[asset.get("@id")] = (kit_name, properties.get("version"), fingerprint(asset))
+        if len(assets) < limit:
+            return snapshot
+        page += 1
+
+# compare two snapshots and return the added, removed and changed entries
+def diff_snapshots(old, new):
+    def entry(key, value):
+        return {"key": key, "kit_name": value[0], "version": value[1]}
+    added = [entry(k, v) for k, v in new.items() if k not in old]
+    removed = [entry(k, v) for k, v in old.items() if k not in new]
+    changed = [entry(k, v) | {"previous_version": old[k][1]} for k, v in new.items() if k in old and old[k][2] != v[2]]
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+#####################################################
+#                 Publishing                        #
+#####################################################
+# identity is None for events of all identities
+def publish(topic, data, identity=None):
+    global event_counter
+    event_counter += 1
+    event = (event_counter, topic, data, identity)
+    history.append(event)
+    for queue, subscriber_identity in list(subscribers.items()):
+        if identity is not None and identity != subscriber_identity:
+            continue
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull: # too slow client: disconnect it, it will reconnect and catch up
+            subscribers.pop(queue, None)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+# take a new snapshot of the topic and publish the delta to the previous one
+async def update_topic(topic, snapshot, identity=None):
+    previous = snapshots.get((topic, identity))
+    snapshots[(topic, identity)] = snapshot
+    if previous is None:
+        return
+    delta = diff_snapshots(previous, snapshot)
+    if delta["added"] or delta["removed"] or delta["changed"]:
+        publish(topic, delta, identity)
+
+async def poll_changes():
+    global catalog_created_at
+    while subscribers:
+        try:
+            index = await get_catalog_index()
+            if index.created_at != catalog_created_at: # the snapshot only changes with a new index
+                await update_topic("catalog", catalog_snapshot(index))
+                catalog_created_at = index.created_at
+        except Exception as exc:
+            print(f"Change feed: catalog snapshot failed: {exc!r}")
+        for identity in set(subscribers.values()):
+            try:
+                with use_identity(identity):
+                    await update_topic("assets", await asset_snapshot(), identity)
+            except Exception as exc:
+                print(f"Change feed: asset snapshot of {identity} failed: {exc!r}")
+        await asyncio.sleep(get_settings(default_identity).changefeed_interval)
+
+def ensure_poller():
+    global poller_task
+    if poller_task is None or poller_task.done():
+        poller_task = start_background_task(poll_changes())
+
+async def stop_poller():
+    if poller_task is not None:
+        poller_task.cancel()
+        await asyncio.gather(poller_task, return_exceptions=True)
+
+
+#####################################################
+#                 Server-Sent Events                #
+#####################################################
+def format_event(event_id, topic, data, identity=None):
+    return f"id: {feed_epoch}:{event_id}\nevent: {topic}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# number of the event of this worker with the given id, None if it is not one of ours
+def parse_event_id(value):
+    epoch, _, number = value.rpartition(":")
+    return int(number) if epoch == feed_epoch and number.isdigit() else None
+
+# async generator of SSE messages for one client (of the current connector identity)
+# last_event_id: Last-Event-ID header of a reconnecting client
+async def event_stream(topics, last_event_id=None):
+    identity = current_identity.get()
+    queue = asyncio.Queue(maxsize=100)
+    subscribers[queue] = identity
+    ensure_poller()
+    try:
+        # replay missed events, or ask the client to re-fetch the full documents
+        if last_event_id is not None:
+            last_number = parse_event_id(last_event_id)
+            # from another worker or before a restart, or too old
+            if last_number is None or (history and history[0][0] > last_number + 1):
+                yield format_event(event_counter, "resync", {"topics": sorted(topics)})
+            else:
+                missed = [e for e in history if e[0] > last_number and e[1] in topics and e[3] in (None, identity)]
+                for event in missed:
+                    yield format_event(*event)
+        else:
+            yield format_event(event_counter, "ready", {"topics": sorted(topics)})
+
+        keepalive = get_settings(default_identity).changefeed_keepalive
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None: # disconnected for being too slow
+                return
+            if event[1] in topics:
+                yield format_event(*event)
+    finally:
+        subscribers.pop(queue, None)
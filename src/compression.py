@@ -0,0 +1,75 @@
+import zlib
+import gzip
+from src.settings import get_settings, default_identity
+
+# zstandard and brotli are optional (pip install zstandard brotli): if installed, providers may send
+# zstd/br encoded KITs, and the KIT-Workspace can be stored zstd compressed (WORKSPACE_COMPRESSION=zstd)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+suffixes = {"zstd": ".zst", "gzip": ".gz"} # compression of a workspace file -> file name suffix
+# the first bytes of data that is compressed already (zip, gzip, zstd, 7z, png, jpeg) is stored as is
+compressed_magics = (b"PK\x03\x04", b"\x1f\x8b", b"\x28\xb5\x2f\xfd", b"7z\xbc\xaf", b"\x89PNG", b"\xff\xd8\xff")
+
+
+#####################################################
+#                 Transfers                         #
+#####################################################
+# content encodings the data plane may use, decoded while the KIT streams in (by httpx)
+# None if they are httpx's default (gzip, deflate) anyway
+def accepted_encodings():
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    return ", ".join(encodings + ["gzip", "deflate"]) if encodings else None
+
+
+#####################################################
+#                 Workspace Files                   #
+#####################################################
+# compression of new workspace files (WORKSPACE_COMPRESSION=off|zstd|gzip), None if off
+# zstd falls back to gzip if zstandard is not installed
+def workspace_compression():
+    mode = get_settings(default_identity).workspace_compression
+    if mode == "zstd" and zstandard is None:
+        return "gzip"
+    return mode if mode in suffixes else None
+
+def is_compressed(first_chunk):
+    return first_chunk.startswith(compressed_magics)
+
+# streaming compressor with compress(chunk) and flush()
+def compressor(compression):
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    return zlib.compressobj(6, zlib.DEFLATED, 31) # gzip container
+
+# open a workspace file for reading, compressed files are decompressed while they are read
+def open_workspace_file(path, compression=None):
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd compressed KIT files (pip install zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+# find a workspace file stored as is or compressed, return (path, compression) or (None, None)
+def find_workspace_file(folder, filename):
+    for compression, suffix in ((None, ""), *suffixes.items()):
+        path = folder / f"{filename}{suffix}"
+        if path.is_file():
+            return path, compression
+    return None, None
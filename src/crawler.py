@@ -0,0 +1,119 @@
+import json
+import time
+import random
+import asyncio
+from pathlib import Path
+from src.utils import get_catalog
+from src.catalog import provider_catalogs
+from src.settings import get_settings, default_identity
+from src.store import get_store
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# The crawler fetches the KIT catalogs of the providers listed in CATALOG_PROVIDERS_FILE
+# (default providers.json), e.g., [{"provider_id": "BPNL...", "connector_url": "https://.../api/v1/dsp"}]
+# and merges them into the local offer index (src/catalog.py).
+crawler_tasks = []
+crawler_state = {} # provider_id -> crawl status of the provider
+global_semaphore = None # limits the number of catalog requests in flight over all providers
+provider_semaphores = {} # provider_id -> limits the number of catalog requests in flight per provider
+
+
+#####################################################
+#                 Utility Functions                 #
+#####################################################
+# read the list of (provider_id, connector_url) pairs to crawl
+def load_providers():
+    path = Path(get_settings(default_identity).providers_file)
+    if not path.is_file():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        providers = json.load(f)
+    return [p for p in providers if p.get("provider_id") and p.get("connector_url")]
+
+# exponential backoff with jitter, capped by CRAWLER_MAX_BACKOFF
+def backoff_delay(failures):
+    settings = get_settings(default_identity)
+    return random.uniform(0.5, 1.0) * min(settings.crawler_max_backoff, settings.crawler_backoff * 2 ** (failures - 1))
+
+
+#####################################################
+#                 Crawling                          #
+#####################################################
+# take over the catalog another worker crawled; None if no worker has crawled the provider yet
+async def adopt_shared_catalog(provider_id, connector_url):
+    shared = await get_store().aget(f"provider-catalog:{provider_id}")
+    if shared is None:
+        return None
+    if shared["fetched_at"] > (provider_catalogs.fetched_at(provider_id) or 0):
+        provider_catalogs.update(provider_id, connector_url, shared["catalog"], fetched_at=shared["fetched_at"])
+        crawler_state[provider_id].update(failures=0, last_error=None, last_success=shared["fetched_at"],
+                                          kits=len(shared["catalog"].get("dataset") or []))
+    return True
+
+# fetch the catalog of one provider and merge it into the offer index
+# with several workers, each provider is crawled by one worker per interval and shared with the others
+async def crawl_once(provider_id, connector_url):
+    state = crawler_state[provider_id]
+    settings = get_settings(default_identity)
+    timeout = settings.crawler_timeout
+    if not await get_store().aclaim(f"lease:crawl:{provider_id}", settings.crawler_interval + timeout):
+        return await adopt_shared_catalog(provider_id, connector_url)
+    async with global_semaphore, provider_semaphores[provider_id]:
+        started = time.perf_counter()
+        try:
+            catalog = await asyncio.wait_for(get_catalog(provider_id, connector_url), timeout)
+        except Exception as exc:
+            state["failures"] += 1
+            state["last_error"] = repr(exc) if not isinstance(exc, asyncio.TimeoutError) else f"timeout after {timeout}s"
+            print(f"Catalog crawl of {provider_id} failed ({state['failures']}x): {state['last_error']}")
+            return False
+        provider_catalogs.update(provider_id, connector_url, catalog)
+        await get_store().aset(f"provider-catalog:{provider_id}", {"fetched_at": provider_catalogs.fetched_at(provider_id), "catalog": catalog})
+        state["failures"] = 0
+        state["last_error"] = None
+        state["last_success"] = time.time()
+        state["duration"] = time.perf_counter() - started
+        state["kits"] = len(catalog.get("dataset") or [])
+        return True
+
+# crawl one provider forever; failures are retried with backoff without affecting other providers
+async def crawl_provider(provider_id, connector_url):
+    while True:
+        success = await crawl_once(provider_id, connector_url)
+        state = crawler_state[provider_id]
+        if success is None: # another worker is crawling the provider, check again soon
+            delay = get_settings(default_identity).crawler_backoff
+        else:
+            delay = get_settings(default_identity).crawler_interval if success else backoff_delay(state["failures"])
+        state["next_run"] = time.time() + delay
+        await asyncio.sleep(delay)
+
+async def start_crawler():
+    global global_semaphore
+    providers = load_providers()
+    if not providers:
+        return
+    settings = get_settings(default_identity)
+    global_semaphore = asyncio.Semaphore(settings.crawler_concurrency)
+    per_provider = settings.crawler_provider_concurrency
+    for p in providers:
+        provider_id, connector_url = p["provider_id"], p["connector_url"]
+        provider_semaphores.setdefault(provider_id, asyncio.Semaphore(per_provider))
+        crawler_state.setdefault(provider_id, {
+            "connector_url": connector_url, "failures": 0, "last_error": None,
+            "last_success": None, "duration": None, "kits": 0, "next_run": None
+        })
+        crawler_tasks.append(asyncio.create_task(crawl_provider(provider_id, connector_url)))
+    print(f"Catalog crawler started for {len(providers)} provider(s)")
+
+async def stop_crawler():
+    for task in crawler_tasks:
+        task.cancel()
+    await asyncio.gather(*crawler_tasks, return_exceptions=True)
+    crawler_tasks.clear()
+
+def crawler_status():
+    return {provider_id: state | {"age": provider_catalogs.age(provider_id)} for provider_id, state in crawler_state.items()}
@@ -0,0 +1,50 @@
+import json
+from fastapi.responses import JSONResponse
+
+# orjson is optional: if installed (pip install orjson), it is used for all JSON handling
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+#####################################################
+#                 Utility Functions                 #
+#####################################################
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# serialise into UTF-8 bytes (unknown types are converted with str)
+def dumps(value):
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError: # e.g., integers larger than 64 bits
+            pass
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+# parse the body of an httpx response only once, following calls return the same object
+def response_json(response):
+    parsed = getattr(response, "parsed_json", None)
+    if parsed is None:
+        parsed = loads(response.content)
+        response.parsed_json = parsed
+    return parsed
+
+# the body of an httpx response as JSON, or as text if it is not JSON
+def response_content(response):
+    try:
+        return response_json(response)
+    except ValueError:
+        return response.text
+
+
+#####################################################
+#                 Response Class                    #
+#####################################################
+# Returning this response directly from an endpoint also skips FastAPI's jsonable_encoder
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content)
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+from src.store import get_store
+from src.fastjson import dumps, loads
+from src.compression import find_workspace_file
+from src.workspace import workspace_root, blob_path
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# The KIT inventory is the manifest of the KIT-Workspace: one row per KIT folder (<prefix>/<bpn>-<asset_id>),
+# written whenever http_transfer saves a KIT, so that local KITs are listed and found without walking
+# or probing the workspace. It lives in the shared store database (table kits).
+# KIT folders saved before the inventory existed are indexed at startup (and on a lookup miss).
+inventory_store = None # the store whose database has the kits table
+inventory_columns = ("folder", "prefix", "provider_id", "kit_name", "version", "kit_type", "filename", "compression",
+                     "size", "stored_size", "digest", "etag", "last_modified", "canvas", "metadata", "updated_at")
+
+
+#####################################################
+#                 Utility Functions                 #
+#####################################################
+def inventory():
+    global inventory_store
+    store = get_store()
+    if store is not inventory_store:
+        store.execute(
+            "CREATE TABLE IF NOT EXISTS kits (folder TEXT PRIMARY KEY, prefix TEXT, provider_id TEXT, kit_name TEXT, "
+            "version TEXT, kit_type TEXT, filename TEXT, compression TEXT, size INTEGER, stored_size INTEGER, "
+            "digest TEXT, etag TEXT, last_modified TEXT, canvas TEXT, metadata BLOB, updated_at REAL)"
+        )
+        store.execute("CREATE INDEX IF NOT EXISTS kits_provider ON kits (provider_id, kit_name)")
+        inventory_store = store
+    return store
+
+def kit_folder_name(prefix, bpn, asset_id):
+    return f"{prefix}/{bpn}-{asset_id}" if prefix else f"{bpn}-{asset_id}"
+
+def inventory_row(prefix, bpn, asset_id, metadata, validators, stored_size=None):
+    validators = validators or {}
+    metadata = {key: value for key, value in metadata.items() if key != "transfer"}
+    kit_type = metadata.get("kit_type")
+    filename = validators.get("filename")
+    canvas = None
+    if kit_type is not None and kit_type.casefold() == "composite" and filename is not None:
+        canvas = filename
+    return (kit_folder_name(prefix, bpn, asset_id), prefix, bpn, asset_id, metadata.get("version"), kit_type, filename,
+            validators.get("compression"), validators.get("size"), stored_size, validators.get("digest"),
+            validators.get("etag"), validators.get("last_modified"), canvas, dumps(metadata), time.time())
+
+def entry_from_row(row):
+    entry = dict(zip(inventory_columns, row))
+    entry["metadata"] = loads(entry["metadata"])
+    return entry
+
+def save_row(row):
+    inventory().execute(
+        f"INSERT OR REPLACE INTO kits ({', '.join(inventory_columns)}) VALUES ({', '.join('?' * len(inventory_columns))})", row
+    )
+
+# record a KIT folder written by save_kit_file (replaces an older entry of the folder)
+def record_kit(prefix, bpn, asset_id, metadata, validators, stored_size=None):
+    save_row(inventory_row(prefix, bpn, asset_id, metadata, validators, stored_size))
+
+def forget_kit(prefix, bpn, asset_id):
+    inventory().execute("DELETE FROM kits WHERE folder = ?", (kit_folder_name(prefix, bpn, asset_id),))
+
+# the inventory entry of a local KIT (metadata parsed, folder as a path), None if it is not stored locally
+def find_local_kit(prefix, bpn, asset_id):
+    rows = inventory().execute(f"SELECT {', '.join(inventory_columns)} FROM kits WHERE folder = ?",
+                               (kit_folder_name(prefix, bpn, asset_id),))
+    if rows:
+        entry = entry_from_row(rows[0])
+    else: # saved before the inventory existed
+        entry = index_kit_folder(prefix, bpn, asset_id)
+        if entry is None:
+            return None
+    entry["path"] = workspace_root / entry["folder"]
+    if not entry["path"].is_dir(): # removed from the workspace by hand
+        forget_kit(prefix, bpn, asset_id)
+        return None
+    return entry
+
+# file names of the blobs used by the KIT folders (never evicted from the blob store)
+def referenced_blobs():
+    referenced = set()
+    for folder, digest, compression in inventory().execute("SELECT folder, digest, compression FROM kits WHERE digest IS NOT NULL"):
+        if (workspace_root / folder).is_dir():
+            referenced.add(blob_path(digest, compression).name)
+        else: # removed from the workspace by hand
+            inventory().execute("DELETE FROM kits WHERE folder = ?", (folder,))
+    return referenced
+
+# page through the local KITs, most recently saved first
+def list_local_kits(page=0, limit=100, provider_id=None, kit_type=None):
+    conditions, parameters = [], []
+    if provider_id is not None:
+        conditions.append("provider_id = ?")
+        parameters.append(provider_id)
+    if kit_type is not None:
+        conditions.append("kit_type = ?")
+        parameters.append(kit_type)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    total = inventory().execute(f"SELECT COUNT(*) FROM kits{where}", parameters)[0][0]
+    rows = inventory().execute(
+        f"SELECT {', '.join(inventory_columns)} FROM kits{where} ORDER BY updated_at DESC, folder LIMIT ? OFFSET ?",
+        (*parameters, limit, page * limit)
+    )
+    return {"total": total, "page": page, "limit": limit, "kits": [entry_from_row(row) for row in rows]}
+
+
+#####################################################
+#                 Indexing                          #
+#####################################################
+# index a KIT folder from its metadata.json, None if it is not a KIT folder
+def index_kit_folder(prefix, bpn, asset_id):
+    folder = workspace_root / kit_folder_name(prefix, bpn, asset_id)
+    try:
+        metadata = json.loads((folder / "metadata.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(metadata, dict):
+        return None
+    validators = metadata.get("transfer") or {}
+    stored_size = None
+    if validators.get("filename") is None and str(metadata.get("kit_type", "")).casefold() == "composite":
+        path, compression = find_workspace_file(folder, "canvas")
+        if path is not None:
+            validators = validators | {"filename": "canvas", "compression": compression}
+    if validators.get("filename") is not None:
+        path, _ = find_workspace_file(folder, validators["filename"])
+        if path is not None:
+            stored_size = path.stat().st_size
+    row = inventory_row(prefix, bpn, asset_id, metadata, validators, stored_size)
+    save_row(row)
+    return entry_from_row(row)
+
+# index the KIT folders of the workspace that are not in the inventory yet (KITs saved by older versions)
+def index_workspace():
+    if not workspace_root.is_dir():
+        return 0
+    known = {row[0] for row in inventory().execute("SELECT folder FROM kits")}
+    indexed = 0
+    for root, folders, files in os.walk(workspace_root):
+        folders[:] = [name for name in folders if not name.startswith(".") and name != "cache"]
+        if "metadata.json" not in files or root == str(workspace_root):
+            continue
+        relative = os.path.relpath(root, workspace_root).replace(os.sep, "/")
+        if relative in known:
+            continue
+        prefix, _, name = relative.rpartition("/")
+        bpn, _, asset_id = name.partition("-")
+        if asset_id and index_kit_folder(prefix, bpn, asset_id) is not None:
+            indexed += 1
+    return indexed
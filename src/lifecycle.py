@@ -0,0 +1,118 @@
+import time
+import asyncio
+from src.utils import (get_token_header, open_client_pool, close_client_pool, load_catalog_snapshot,
+                       refresh_catalog_quietly, refresh_catalog_in_background, catalog_status)
+from src.inventory import index_workspace
+from src.crawler import start_crawler, stop_crawler
+from src.changefeed import stop_poller
+from src.transfers import stop_push_batches
+from src.settings import (get_settings, default_identity, known_identities, use_identity, sync_settings,
+                          settings_sync_interval)
+from src.store import get_store, close_store
+from src import utils
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# warm-up state reported by /readiness
+warmup_state = {
+    "started_at": None,
+    "token": False,    # a dataspace token was minted (or not needed)
+    "pool": False,     # the pooled dataspace connections are open
+    "catalog": False,  # the federated catalog index is available
+    "inventory": False, # KIT folders saved before the KIT inventory existed are indexed
+    "finished_at": None,
+    "errors": {}
+}
+warmup_task = None
+settings_task = None
+
+
+#####################################################
+#                 Warm-up                           #
+#####################################################
+# mint the tokens of all connector identities
+async def warm_token():
+    for identity in known_identities():
+        settings = get_settings(identity)
+        if settings.adapter is not None and settings.adapter.needs_certificate and not settings.has_certificate():
+            raise RuntimeError(f"tls.crt/tls.key of {identity} are not registered yet")
+        with use_identity(identity):
+            header = await get_token_header()
+        if header is None or header.get("Authorization") == "Bearer None":
+            raise RuntimeError(f"no token received for {identity}")
+
+# open the pool connections by a first request to the federated catalog and build the index
+async def warm_catalog():
+    await refresh_catalog_quietly()
+    if not catalog_status()["available"]:
+        raise RuntimeError(catalog_status()["last_error"] or "federated catalog unavailable")
+
+# index the KIT folders missing from the KIT inventory
+async def warm_inventory():
+    indexed = await asyncio.to_thread(index_workspace)
+    if indexed:
+        print(f"KIT inventory: {indexed} KIT folder(s) indexed")
+
+# retry each warm-up step until it succeeds (WARMUP_RETRY seconds between attempts)
+async def warm_up():
+    retry = get_settings(default_identity).warmup_retry
+    steps = {"token": warm_token, "catalog": warm_catalog, "inventory": warm_inventory}
+    while True:
+        for name, step in steps.items():
+            if warmup_state[name]:
+                continue
+            try:
+                await step()
+                warmup_state[name] = True
+                warmup_state["errors"].pop(name, None)
+            except Exception as exc:
+                warmup_state["errors"][name] = repr(exc)
+                print(f"Warm-up of {name} failed: {exc!r}")
+        if all(warmup_state[name] for name in steps):
+            warmup_state["finished_at"] = time.time()
+            print(f"Warm-up finished in {warmup_state['finished_at'] - warmup_state['started_at']:.1f}s")
+            return
+        await asyncio.sleep(retry)
+
+# pick up the settings published by the other workers (e.g., CONNECTOR_NAME by /register)
+async def sync_settings_forever():
+    while True:
+        await asyncio.sleep(settings_sync_interval)
+        await get_store().call(sync_settings)
+
+def is_ready():
+    return warmup_state["pool"] and warmup_state["token"] and catalog_status()["available"]
+
+
+#####################################################
+#                 Startup and Shutdown              #
+#####################################################
+async def start_services():
+    global warmup_task, settings_task
+    warmup_state["started_at"] = time.time()
+    get_store() # the shared store is opened here, not on import
+    sync_settings()
+    settings_task = asyncio.create_task(sync_settings_forever())
+    open_client_pool()
+    warmup_state["pool"] = True
+    if load_catalog_snapshot() is not None: # serve the last good catalog right away
+        warmup_state["catalog"] = True
+        refresh_catalog_in_background()
+    warmup_task = asyncio.create_task(warm_up())
+    await start_crawler() # no-op if no providers are configured
+
+async def stop_services():
+    for task in (warmup_task, settings_task):
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    if utils.catalog_refresh_task is not None:
+        utils.catalog_refresh_task.cancel()
+        await asyncio.gather(utils.catalog_refresh_task, return_exceptions=True)
+    await stop_crawler()
+    await stop_poller()
+    await stop_push_batches()
+    await close_client_pool()
+    close_store()
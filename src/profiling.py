@@ -0,0 +1,133 @@
+import re
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from collections import Counter
+from src.settings import get_settings, default_identity
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# PROFILING=true enables the admin endpoints and the X-Edge-Profile request header
+profile_dir = Path("KIT-Workspace") / "profiles"
+armed_routes = {} # route template -> number of upcoming requests to profile
+profile_lock = threading.Lock() # only one cProfile session can be active at a time
+
+
+#####################################################
+#                 Utility Functions                 #
+#####################################################
+def profiling_enabled():
+    return get_settings(default_identity).profiling
+
+# convert a route template (e.g., /federatedcatalog/{query}) into a regex
+def route_regex(route):
+    parts = re.split(r"(\{[^}]+\})", route.rstrip("/") or "/")
+    pattern = "".join("[^/]+" if p.startswith("{") else re.escape(p) for p in parts)
+    return re.compile(rf"^{pattern}/?$")
+
+# arm the profiler for the next `count` requests to the given route
+def arm_profiler(route, count):
+    if count <= 0:
+        armed_routes.pop(route, None)
+    else:
+        armed_routes[route] = count
+    return dict(armed_routes)
+
+# check whether the request should be profiled, consuming one armed slot if so
+def should_profile(path, header_value=None):
+    if not profiling_enabled():
+        return False
+    if header_value and header_value.strip().casefold() in ("1", "true", "yes", "on"):
+        return True
+    for route, remaining in list(armed_routes.items()):
+        if route_regex(route).match(path):
+            if remaining <= 1:
+                armed_routes.pop(route, None)
+            else:
+                armed_routes[route] = remaining - 1
+            return True
+    return False
+
+# list the profile files written so far (newest first)
+def list_profiles():
+    if not profile_dir.is_dir():
+        return []
+    files = sorted(profile_dir.iterdir(), key=lambda p: p.stat().st_mtime, reverse=True)
+    return [f.name for f in files if f.is_file()]
+
+
+#####################################################
+#                 Stack Sampler                     #
+#####################################################
+# samples the stack of one thread (the event loop thread) in the background
+# and aggregates it into the collapsed-stack format used by flamegraph tools
+class StackSampler(threading.Thread):
+    def __init__(self, thread_id, interval=0.005):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+#####################################################
+#                 Request Profiling                 #
+#####################################################
+# run the awaitable produced by `call` under cProfile and the stack sampler
+# NOTE: the event loop is shared, so concurrent requests appear in the profile too
+async def profile_call(name, call):
+    if not profile_lock.acquire(blocking=False): # another profile is running, skip this one
+        return await call()
+
+    interval = get_settings(default_identity).profiling_interval_ms / 1000
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident(), interval)
+    started = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        return await call()
+    finally:
+        profiler.disable()
+        sampler.stop()
+        profile_lock.release()
+        elapsed = time.perf_counter() - started
+        write_profile(name, profiler, sampler, elapsed)
+
+def write_profile(name, profiler, sampler, elapsed):
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "root"
+    base = profile_dir / f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{slug}"
+
+    profiler.dump_stats(f"{base}.prof") # for snakeviz, pstats, etc.
+    with open(f"{base}.collapsed", "w", encoding="utf-8") as f: # for flamegraph.pl, speedscope, etc.
+        f.write(sampler.collapsed())
+    with open(f"{base}.txt", "w", encoding="utf-8") as f: # human readable summary
+        f.write(f"{name} took {elapsed:.3f}s\n\n")
+        stats = pstats.Stats(profiler, stream=f)
+        stats.sort_stats("cumulative").print_stats(50)
+    print(f"Profile of {name} ({elapsed:.3f}s) written to {base}.*")
@@ -0,0 +1,382 @@
+import time
+import random
+import asyncio
+from collections import deque
+import httpx
+from src.settings import get_settings, default_identity
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# Every dataspace request made through src/utils.py passes the ResilientTransport:
+# - the request is classified (token, management, catalog, negotiation, dataplane) by its URL,
+#   each class has its own concurrency limit, waiting queue and timeout (OPERATION_LIMITS),
+#   which also raises the httpx timeouts of its requests (5s by default),
+# - each host has a circuit breaker: after BREAKER_THRESHOLD consecutive failures, requests to the host
+#   fail fast for BREAKER_COOLDOWN seconds, then a single probe request decides whether it is closed again,
+# - idempotent requests are retried with jittered backoff, as long as the retry budget allows it,
+# - catalog reads are hedged: if the response is late, a second request is sent and the first response wins
+#   (not the streamed federated catalog, a second request would download it again).
+# The state is kept per worker and shared by all connector identities.
+operation_classes = { # URL names of the settings -> operation class, all other URLs of the settings are "management"
+    "TOKEN_URL": "token",
+    "FEDERATED_CAT_URL": "catalog",
+    "CATALOG_READ": "catalog",
+    "CATALOG_FIND_KIT": "catalog",
+    "NEGOTIATION_READ_URL": "negotiation",
+    "NEGOTIATION_BY_ID_URL": "negotiation",
+    "NEGOTIATION_DELETE_BY_ID_URL": "negotiation",
+    "EDR_NEGOTIATION_URL": "negotiation",
+    "EDR_READ_URL": "negotiation",
+    "EDR_DATA_ADDRESS_URL": "negotiation",
+    "TRANSFER_PROCESS_URL": "negotiation",
+    "TRANSFER_PROCESS_BY_ID_URL": "negotiation",
+}
+hedged_classes = {"catalog"}
+unhedged_urls = {"FEDERATED_CAT_URL"} # URL names of the settings that are never hedged
+idempotent_methods = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+retry_statuses = {429, 502, 503, 504}
+backoff_base = 0.1 # seconds, doubled per attempt (full jitter)
+backoff_cap = 2.0
+max_retry_after = 5.0 # a longer Retry-After is not waited for, the response is returned
+limiters = {}  # operation class -> OperationLimiter
+breakers = {}  # host -> CircuitBreaker
+retry_budget = None
+classifiers = {} # identity -> (settings, [(url prefix, URL name, operation class)], longest prefix first)
+
+
+#####################################################
+#                 Errors                            #
+#####################################################
+# the request was not sent: the circuit of the host is open or the queue of its operation class is full
+class DataspaceUnavailable(httpx.TransportError):
+    def __init__(self, message, retry_after=1, request=None):
+        super().__init__(message, request=request)
+        self.retry_after = retry_after
+
+
+#####################################################
+#                 Limits, Breakers, Budget          #
+#####################################################
+class OperationLimiter:
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit.concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.hedged = 0
+        self.latencies = deque(maxlen=100) # seconds to the response headers
+
+    def full(self):
+        return self.semaphore.locked()
+
+    async def acquire(self, request):
+        if self.semaphore.locked():
+            if self.waiting >= self.limit.queue:
+                self.rejected += 1
+                raise DataspaceUnavailable(f"Too many {self.name} requests queued", request=request)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.limit.timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise DataspaceUnavailable(f"No free {self.name} slot within {self.limit.timeout}s", request=request)
+            finally:
+                self.waiting -= 1
+        else:
+            await self.semaphore.acquire()
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self.semaphore.release()
+
+    # p95 of the recent latencies (at least 50 ms), 1 s until enough requests were seen
+    def hedge_delay(self):
+        if len(self.latencies) < 20:
+            return 1.0
+        return max(0.05, sorted(self.latencies)[int(len(self.latencies) * 0.95)])
+
+    def status(self):
+        return {"concurrency": self.limit.concurrency, "queue": self.limit.queue, "timeout": self.limit.timeout,
+                "in_flight": self.in_flight, "waiting": self.waiting, "rejected": self.rejected, "hedged": self.hedged}
+
+class CircuitBreaker:
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    # raise if requests to the host must fail fast; in the half-open state, one probe request is let through
+    # return True for the probe request
+    def check(self, request):
+        state = self.state
+        if state == "open" or (state == "half-open" and self.probing):
+            retry_after = max(1, int(self.cooldown - (time.monotonic() - self.opened_at)))
+            raise DataspaceUnavailable(f"Circuit open for {request.url.host}", retry_after, request=request)
+        if state == "half-open":
+            self.probing = True
+            return True
+        return False
+
+    # the probe ended without an outcome (rejected by the limiter, cancelled): let the next request probe
+    def abandon_probe(self):
+        self.probing = False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                print(f"Circuit opened after {self.failures} failure(s)")
+            self.opened_at = time.monotonic() # a failed probe opens the circuit again
+
+    def status(self):
+        return {"state": self.state, "failures": self.failures}
+
+# every request deposits `ratio` tokens (up to `capacity`), every retry or hedged request takes one
+class RetryBudget:
+    def __init__(self, ratio, capacity=10):
+        self.ratio = ratio
+        self.capacity = capacity
+        self.balance = capacity
+        self.exhausted = 0
+
+    def deposit(self):
+        self.balance = min(self.capacity, self.balance + self.ratio)
+
+    def withdraw(self):
+        if self.balance >= 1:
+            self.balance -= 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def status(self):
+        return {"ratio": self.ratio, "balance": round(self.balance, 2), "exhausted": self.exhausted}
+
+
+#####################################################
+#                 Utility Functions                 #
+#####################################################
+def resilience_enabled():
+    return get_settings(default_identity).resilience
+
+def get_limiter(name):
+    if name not in limiters:
+        limits = get_settings(default_identity).operation_limits
+        limiters[name] = OperationLimiter(name, limits.get(name, limits["management"]))
+    return limiters[name]
+
+def get_breaker(host):
+    if host not in breakers:
+        settings = get_settings(default_identity)
+        breakers[host] = CircuitBreaker(settings.breaker_threshold, settings.breaker_cooldown)
+    return breakers[host]
+
+def get_retry_budget():
+    global retry_budget
+    if retry_budget is None:
+        retry_budget = RetryBudget(get_settings(default_identity).retry_budget)
+    return retry_budget
+
+# operation class and URL name of a request, by the longest matching URL of the settings of the current identity
+def classify(request):
+    try:
+        settings = get_settings()
+    except KeyError: # identity not loaded yet
+        settings = get_settings(default_identity)
+    cached = classifiers.get(settings.identity)
+    if cached is None or cached[0] is not settings:
+        prefixes = []
+        for name, template in settings.urls.items():
+            prefix = template.parts[0].split("?")[0]
+            prefixes.append((prefix, name, operation_classes.get(name, "management")))
+        prefixes.sort(key=lambda p: len(p[0]), reverse=True)
+        cached = classifiers[settings.identity] = (settings, prefixes)
+    url = str(request.url.copy_with(query=None))
+    for prefix, url_name, name in cached[1]:
+        if prefix and url.startswith(prefix):
+            return name, url_name
+    return "dataplane", None # EDR endpoints of the providers
+
+# httpx timeouts of a request raised to the timeout of its operation class (no timeout stays no timeout)
+def class_timeouts(request, timeout):
+    timeouts = dict(request.extensions.get("timeout") or {})
+    for key in ("read", "write", "pool"):
+        if timeouts.get(key, 0) is not None and timeouts.get(key, 0) < timeout:
+            timeouts[key] = timeout
+    return timeouts
+
+# reads can be repeated safely: QuerySpec and catalog queries are POSTs to .../request
+def is_idempotent(request, name):
+    return (request.method in idempotent_methods or name == "token"
+            or (request.method == "POST" and request.url.path.rstrip("/").endswith("/request")))
+
+def backoff(attempt):
+    return random.uniform(0, min(backoff_cap, backoff_base * 2 ** attempt))
+
+def retry_after(response):
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except ValueError:
+        return 0
+
+def resilience_status():
+    return {
+        "enabled": resilience_enabled(),
+        "operations": {name: limiter.status() for name, limiter in limiters.items()},
+        "circuits": {host: breaker.status() for host, breaker in breakers.items()},
+        "retry_budget": get_retry_budget().status(),
+    }
+
+
+#####################################################
+#                 Transport                         #
+#####################################################
+# releases the slot of the operation class once the response is closed
+class ReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        if self.release is not None:
+            self.release()
+            self.release = None
+        await self.stream.aclose()
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        settings = get_settings(default_identity)
+        name, url_name = classify(request)
+        limiter = get_limiter(name)
+        request.extensions["timeout"] = class_timeouts(request, limiter.limit.timeout)
+        breaker = get_breaker(request.url.netloc.decode("ascii"))
+        budget = get_retry_budget()
+        idempotent = is_idempotent(request, name)
+        if idempotent:
+            await request.aread() # the body can be sent again
+        hedge_delay = settings.hedge_delay
+        hedged = idempotent and name in hedged_classes and url_name not in unhedged_urls and hedge_delay != 0
+        budget.deposit()
+
+        attempt = 0
+        while True:
+            last_attempt = not idempotent or attempt + 1 >= settings.retry_attempts
+            try:
+                if hedged:
+                    response = await self.send_hedged(request, limiter, breaker, budget, hedge_delay or limiter.hedge_delay())
+                else:
+                    response = await self.send_once(request, limiter, breaker)
+            except DataspaceUnavailable:
+                raise
+            except httpx.TransportError:
+                if last_attempt or not budget.withdraw():
+                    raise
+                await asyncio.sleep(backoff(attempt))
+                attempt += 1
+                continue
+            if response.status_code in retry_statuses and not last_attempt and retry_after(response) <= max_retry_after:
+                if budget.withdraw():
+                    await response.aclose()
+                    await asyncio.sleep(max(retry_after(response), backoff(attempt)))
+                    attempt += 1
+                    continue
+            return response
+
+    async def send_once(self, request, limiter, breaker):
+        probe = breaker.check(request)
+        settled = False # the breaker got the outcome of the request
+        try:
+            await limiter.acquire(request)
+            started = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(self.transport.handle_async_request(request), limiter.limit.timeout)
+            except asyncio.TimeoutError:
+                limiter.release()
+                settled = True
+                breaker.failure()
+                raise httpx.ReadTimeout(f"No response from {request.url.host} within {limiter.limit.timeout}s", request=request)
+            except httpx.TransportError:
+                limiter.release()
+                settled = True
+                breaker.failure()
+                raise
+            except BaseException:
+                limiter.release()
+                raise
+            settled = True
+            if response.status_code >= 500:
+                breaker.failure()
+            else:
+                breaker.success()
+                limiter.latencies.append(time.perf_counter() - started)
+        finally:
+            if probe and not settled:
+                breaker.abandon_probe()
+        if response.is_closed: # body already loaded (e.g., cassette responses)
+            limiter.release()
+        else:
+            response.stream = ReleasingStream(response.stream, limiter.release)
+        return response
+
+    # send a second request if the first has no response after `delay` seconds, the first response wins
+    async def send_hedged(self, request, limiter, breaker, budget, delay):
+        tasks = [asyncio.ensure_future(self.send_once(request, limiter, breaker))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or limiter.full() or not budget.withdraw():
+                return await tasks[0]
+            limiter.hedged += 1
+            tasks.append(asyncio.ensure_future(self.send_once(request, limiter, breaker)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = None
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task.result()
+                    else: # both answered at once
+                        await task.result().aclose()
+                if winner is not None:
+                    return winner
+            raise error
+        finally:
+            for task in tasks: # close the losing request
+                if not task.done():
+                    task.cancel()
+                    task.add_done_callback(close_response)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+def close_response(task):
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(task.result().aclose())
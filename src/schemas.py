@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Literal, Any, List
 
 # class createAwsBasicKIT(BaseModel): 
@@ -69,6 +69,34 @@ class CompositeKitData(BaseModel):
     semantic_model: dict | None = None
     additional_info: AdditionalData | None = None
 
+class BulkKitItem(BaseModel):
+    kit: BasicKitData | CompositeKitData
+    policy_id: str | None = None   # if given, a contract definition is created for the KIT
+    contract_id: str | None = None # default: <kit_name>-contract
+
+class BulkKitData(BaseModel):
+    kits: List[BulkKitItem] = Field(..., min_length=1, max_length=5000)
+    concurrency: int = Field(8, ge=1, le=64) # dataspace calls in flight
+
+class QueryCriterion(BaseModel): # criterion of an EDC QuerySpec filter expression
+    operandLeft: str
+    operator: str = "="
+    operandRight: Any = None
+
+class BulkDeleteData(BaseModel):
+    ids: List[str] | None = Field(None, min_length=1)
+    filter: List[QueryCriterion] | None = Field(None, min_length=1) # used if no ids are given
+    concurrency: int = Field(8, ge=1, le=64) # dataspace calls in flight
+    rate: float | None = Field(None, gt=0)   # delete requests per second
+    cascade: bool = True    # assets: delete the contract definitions offering only them first
+    dry_run: bool = False   # only return the objects that would be deleted
+
+    @model_validator(mode="after")
+    def check_selection(self):
+        if self.ids is None and self.filter is None:
+            raise ValueError("either ids or filter must be given")
+        return self
+
 class KitAccessRequest(BaseModel):
     provider_id: str = Field(..., min_length=1)
     connector_url: str = Field(..., min_length=1)
@@ -76,6 +104,9 @@ class KitAccessRequest(BaseModel):
     request_body: dict | None = None
     overwrite: bool | None = None
 
+class SendToRequest(KitAccessRequest):
+    endpoint_url: str = Field(..., min_length=1) # the provider pushes the KIT data to this endpoint
+
 class CatalogRequestData(BaseModel):
     provider_id: str
     connector_url: str
@@ -113,6 +144,16 @@ class httpTransfer2url(BaseModel):
     originator: str = Field(..., min_length=1)
     agreement_id: str = Field(..., min_length=1)
     endpoint_url: str = Field(..., min_length=1)
+    asset_type: str = "http"
+
+class PushTransferData(BaseModel):
+    transfers: List[httpTransfer2url] = Field(..., min_length=1, max_length=1000)
+    concurrency: int = Field(8, ge=1, le=64) # transfer processes started at the same time
+    timeout: float = Field(600, gt=0) # seconds until an unfinished transfer is reported as timed out
+
+class ProfileRequest(BaseModel):
+    route: str = Field(..., min_length=1) # e.g., /federatedcatalog/{query}
+    count: int = Field(1, ge=0, le=1000) # number of upcoming requests to profile (0 disarms)
 
 
 # class createCompositeKIT(BaseModel):
@@ -0,0 +1,382 @@
+import os
+import re
+import contextvars
+from pathlib import Path
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from dotenv import dotenv_values
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# The configuration is read once into an immutable Settings snapshot per connector identity.
+# Request handlers call get_settings() instead of os.getenv(); /register builds new snapshots
+# with reload_settings() and swaps them in a single assignment, so a request sees either the
+# old or the new configuration, never a mix of both.
+#
+# One process can serve several connector identities: the default identity is configured by
+# .env and tls.crt/tls.key in the working directory, every sub-directory of CONNECTORS_DIR
+# (default connectors/) with its own .env (and tls.crt/tls.key) is an additional identity.
+# The identity of a request is selected with the X-Connector-Id header (see current_identity).
+env_file = ".env"
+default_identity = "default"
+identity_pattern = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,63}")
+current_identity = contextvars.ContextVar("current_identity", default=default_identity)
+overrides = {} # identity -> values set at runtime (e.g., CONNECTOR_NAME by /register), take precedence over everything
+identities = {} # identity -> Settings, replaced as a whole on reload
+# with several workers, /register publishes the overrides in the shared store (src/store.py)
+# and the other workers pick them up within settings_sync_interval seconds (sync_settings, run by src/lifecycle.py)
+settings_generation = 0 # generation of the shared settings loaded by this worker
+settings_sync_interval = 1.0
+
+# dataspace URLs used by the Edge-Connector ({id} and {transfer_id} are filled in per request)
+url_names = (
+    "TOKEN_URL", "ASSET_READ_URL", "ASSET_READ_BY_ID_URL", "ASSET_CREATE_URL", "ASSET_EDIT_URL",
+    "ASSET_DELETE_BY_ID_URL", "POLICY_READ_URL", "POLICY_READ_BY_ID_URL", "CONTRACT_READ_URL",
+    "CONTRACT_CREATE_URL", "CONTRACT_DELETE_BY_ID_URL", "NEGOTIATION_READ_URL", "NEGOTIATION_DELETE_BY_ID_URL",
+    "AGREEMENT_READ_URL", "EDR_NEGOTIATION_URL", "EDR_READ_URL", "EDR_DATA_ADDRESS_URL", "CATALOG_READ",
+    "CATALOG_FIND_KIT", "FEDERATED_CAT_URL", "AWS_ASSET_CREATE_URL", "TRANSFER_PROCESS_URL",
+    "TRANSFER_PROCESS_BY_ID_URL", "NEGOTIATION_BY_ID_URL"
+)
+
+
+#####################################################
+#                 Dataspace Adapters                #
+#####################################################
+# how the Edge-Connector authenticates to and checks the liveness of each dataspace
+@dataclass(frozen=True)
+class DataspaceAdapter:
+    name: str
+    auth: str        # "oauth": token minted with the client certificate, "api-key": static X-Api-Key header
+    livecheck: str   # "token": a new token can be minted, "asset": an asset can be read
+    needs_certificate: bool
+
+adapters = MappingProxyType({
+    "dlr": DataspaceAdapter("dlr", auth="oauth", livecheck="token", needs_certificate=True),
+    "tsi": DataspaceAdapter("tsi", auth="api-key", livecheck="asset", needs_certificate=False),
+})
+
+
+#####################################################
+#                 Operation Limits                  #
+#####################################################
+# limits of each class of dataspace operations (see src/resilience.py)
+@dataclass(frozen=True)
+class OperationLimit:
+    concurrency: int # requests in flight
+    queue: int       # requests waiting for a free slot, further requests are rejected
+    timeout: float   # seconds to wait for a slot and again for the response headers
+
+default_operation_limits = MappingProxyType({
+    "token": OperationLimit(concurrency=2, queue=32, timeout=15),
+    "management": OperationLimit(concurrency=16, queue=64, timeout=30),
+    "catalog": OperationLimit(concurrency=8, queue=64, timeout=60),
+    "negotiation": OperationLimit(concurrency=8, queue=64, timeout=30),
+    "dataplane": OperationLimit(concurrency=8, queue=64, timeout=120),
+})
+
+# OPERATION_LIMITS=management=16/64/30,catalog=4/32/60 (concurrency/queue/timeout), other classes keep their defaults
+def parse_operation_limits(value):
+    limits = dict(default_operation_limits)
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        name, _, numbers = item.partition("=")
+        concurrency, queue, timeout = numbers.split("/")
+        limits[name.strip()] = OperationLimit(int(concurrency), int(queue), float(timeout))
+    return MappingProxyType(limits)
+
+
+#####################################################
+#                 URL Templates                     #
+#####################################################
+# URL with {name} placeholders, split once into literal parts and placeholder names
+class UrlTemplate:
+    def __init__(self, template):
+        self.template = template
+        self.parts = re.split(r"\{(\w+)\}", template) # literal, name, literal, name, ..., literal
+
+    def format(self, **params):
+        parts = self.parts.copy()
+        for i in range(1, len(parts), 2):
+            parts[i] = str(params[parts[i]])
+        return "".join(parts)
+
+    def __repr__(self):
+        return f"UrlTemplate({self.template!r})"
+
+
+#####################################################
+#                 Settings                          #
+#####################################################
+@dataclass(frozen=True)
+class Settings:
+    identity: str                    # connector identity, see current_identity
+    directory: str                   # directory of the .env and certificate files of the identity
+    dataspace: str                   # casefolded, e.g., "dlr" or "tsi"
+    adapter: DataspaceAdapter | None # None for an unknown dataspace
+    connector_name: str | None
+    base_url: str | None
+    api_key: str | None
+    standardisation: str | None
+    domain: str | None
+    urls: MappingProxyType = field(repr=False)
+    # tokens and the federated catalog
+    token_expiry_margin: float = 30
+    catalog_ttl: float = 60
+    catalog_snapshot: str = "KIT-Workspace/cache/catalog.snapshot"
+    # catalog crawler
+    providers_file: str = "providers.json"
+    crawler_interval: float = 300
+    crawler_timeout: float = 30
+    crawler_concurrency: int = 8
+    crawler_provider_concurrency: int = 1
+    crawler_backoff: float = 10
+    crawler_max_backoff: float = 1800
+    crawler_max_age: float = 900
+    # change feed and warm-up
+    changefeed_interval: float = 30
+    changefeed_keepalive: float = 15
+    warmup_retry: float = 30
+    # tracing, profiling and cassettes
+    tracing: str = "off"
+    trace_file: str = "KIT-Workspace/traces/traces.jsonl"
+    trace_otlp_url: str = "http://localhost:4318/v1/traces"
+    trace_service_name: str = "edge-connector"
+    profiling: bool = False
+    profiling_interval_ms: float = 5
+    cassette_mode: str = "off"
+    cassette_path: str = "KIT-Workspace/cassettes/dataspace.jsonl"
+    cassette_timing: str = "real"
+    # deployment
+    workers: int = 1
+    store_path: str = "KIT-Workspace/cache/shared.db"
+    edr_cache_ttl: float = 300
+    management_cache_ttl: float = 30
+    catalog_refresh_lease: float = 120
+    connectors_dir: str = "connectors"
+    callback_url: str | None = None # where the EDC posts negotiation/transfer events (POST /callbacks/edc?token=...), None: polling only
+    callback_timeout: float = 10    # seconds to wait for an event before falling back to polling
+    # resilience of dataspace calls
+    resilience: bool = True
+    operation_limits: MappingProxyType = field(default=default_operation_limits, repr=False)
+    breaker_threshold: int = 5       # consecutive failures of a host before its circuit opens
+    breaker_cooldown: float = 30     # seconds before an open circuit lets a probe request through
+    retry_attempts: int = 3          # attempts of an idempotent request
+    retry_budget: float = 0.2        # retries (and hedged requests) per request, on average
+    hedge_delay: float | None = None # seconds before a catalog read is hedged, None: adaptive, 0: never
+    # KIT-Workspace
+    workspace_quota: int = 2 * 1024 ** 3 # bytes of the blob store, unreferenced blobs are evicted beyond it (0: no limit)
+    workspace_compression: str = "off"   # off | zstd | gzip, compression of new KIT files
+    # composite KITs
+    stage_output_limit: int = 64 * 1024 ** 2 # bytes of data read by "read" KITs and kept in memory for the later stages of a run
+
+    # client certificate of the identity (DLR dataspace)
+    @property
+    def cert(self):
+        return (str(Path(self.directory) / "tls.crt"), str(Path(self.directory) / "tls.key"))
+
+    def has_certificate(self):
+        return all(Path(path).is_file() for path in self.cert)
+
+    # return the dataspace URL with the placeholders filled in
+    def url(self, name, **params):
+        template = self.urls.get(name)
+        if template is None:
+            raise ValueError(f"{name} is not configured")
+        return template.format(**params)
+
+    @classmethod
+    def from_environment(cls, identity, directory, env):
+        def text(name, default=None):
+            value = env.get(name)
+            return value.strip() if value and value.strip() else default
+        def number(name, default, cast=float):
+            return cast(text(name) or default)
+        def flag(name, default="false"):
+            return (text(name) or default).casefold() in ("1", "true", "yes", "on")
+        def size(name, default): # bytes, with an optional K, M or G suffix
+            value = (text(name) or str(default)).upper().removesuffix("B")
+            factor = 1024 ** ("KMG".index(value[-1]) + 1) if value[-1:] in ("K", "M", "G") else 1
+            return int(float(value.rstrip("KMG")) * factor)
+
+        base_url = text("BASE_URL")
+        connector_name = text("CONNECTOR_NAME")
+        management = f"{base_url}/connectors/{connector_name}/cp/management/v3"
+        derived = { # URLs that were not configurable so far
+            "AWS_ASSET_CREATE_URL": f"{management}/assets",
+            "TRANSFER_PROCESS_URL": f"{management}/transferprocesses",
+            "TRANSFER_PROCESS_BY_ID_URL": f"{management}/transferprocesses/{{id}}",
+            "NEGOTIATION_BY_ID_URL": f"{management}/contractnegotiations/{{id}}",
+        }
+        urls = {}
+        for name in url_names:
+            value = text(name, derived.get(name))
+            if value is not None:
+                urls[name] = UrlTemplate(value)
+
+        dataspace = (text("DATASPACE") or "").casefold()
+        return cls(
+            identity=identity,
+            directory=directory,
+            dataspace=dataspace,
+            adapter=adapters.get(dataspace),
+            connector_name=connector_name,
+            base_url=base_url,
+            api_key=text("API-KEY"),
+            standardisation=text("STANDARDISATION"),
+            domain=text("DOMAIN"),
+            urls=MappingProxyType(urls),
+            token_expiry_margin=number("TOKEN_EXPIRY_MARGIN", 30),
+            catalog_ttl=number("CATALOG_TTL", 60),
+            catalog_snapshot=text("CATALOG_SNAPSHOT", "KIT-Workspace/cache/catalog.snapshot"),
+            providers_file=text("CATALOG_PROVIDERS_FILE", "providers.json"),
+            crawler_interval=number("CRAWLER_INTERVAL", 300),
+            crawler_timeout=number("CRAWLER_TIMEOUT", 30),
+            crawler_concurrency=number("CRAWLER_CONCURRENCY", 8, int),
+            crawler_provider_concurrency=number("CRAWLER_PROVIDER_CONCURRENCY", 1, int),
+            crawler_backoff=number("CRAWLER_BACKOFF", 10),
+            crawler_max_backoff=number("CRAWLER_MAX_BACKOFF", 1800),
+            crawler_max_age=number("CRAWLER_MAX_AGE", 900),
+            changefeed_interval=number("CHANGEFEED_INTERVAL", 30),
+            changefeed_keepalive=number("CHANGEFEED_KEEPALIVE", 15),
+            warmup_retry=number("WARMUP_RETRY", 30),
+            tracing=(text("TRACING") or "off").casefold(),
+            trace_file=text("TRACE_FILE", "KIT-Workspace/traces/traces.jsonl"),
+            trace_otlp_url=text("TRACE_OTLP_URL", "http://localhost:4318/v1/traces"),
+            trace_service_name=text("TRACE_SERVICE_NAME", "edge-connector"),
+            profiling=flag("PROFILING"),
+            profiling_interval_ms=number("PROFILING_INTERVAL_MS", 5),
+            cassette_mode=(text("CASSETTE_MODE") or "off").casefold(),
+            cassette_path=text("CASSETTE_PATH", "KIT-Workspace/cassettes/dataspace.jsonl"),
+            cassette_timing=(text("CASSETTE_TIMING") or "real").casefold(),
+            workers=number("WORKERS", 1, int),
+            store_path=text("STORE_PATH", "KIT-Workspace/cache/shared.db"),
+            edr_cache_ttl=number("EDR_CACHE_TTL", 300),
+            management_cache_ttl=number("MANAGEMENT_CACHE_TTL", 30),
+            catalog_refresh_lease=number("CATALOG_REFRESH_LEASE", 120),
+            connectors_dir=text("CONNECTORS_DIR", "connectors"),
+            callback_url=text("CALLBACK_URL"),
+            callback_timeout=number("CALLBACK_TIMEOUT", 10),
+            resilience=flag("RESILIENCE", "true"),
+            operation_limits=parse_operation_limits(text("OPERATION_LIMITS")),
+            breaker_threshold=number("BREAKER_THRESHOLD", 5, int),
+            breaker_cooldown=number("BREAKER_COOLDOWN", 30),
+            retry_attempts=number("RETRY_ATTEMPTS", 3, int),
+            retry_budget=number("RETRY_BUDGET", 0.2),
+            hedge_delay=number("HEDGE_DELAY", None) if text("HEDGE_DELAY") else None,
+            workspace_quota=size("WORKSPACE_QUOTA", 2 * 1024 ** 3),
+            workspace_compression=(text("WORKSPACE_COMPRESSION") or "off").casefold(),
+            stage_output_limit=size("STAGE_OUTPUT_LIMIT", 64 * 1024 ** 2),
+        )
+
+
+#####################################################
+#                 Loading                           #
+#####################################################
+# replace ${NAME} and ${NAME:-default} by the values known so far
+def expand_variables(value, env):
+    def replace(match):
+        return env.get(match.group(1)) or match.group(2) or ""
+    return re.sub(r"\$\{(\w+)(?::-([^}]*))?\}", replace, value)
+
+# directory of the .env and certificate files of an identity
+def identity_directory(identity, connectors_dir=None):
+    if identity == default_identity:
+        return "."
+    if connectors_dir is None:
+        connectors_dir = get_settings(default_identity).connectors_dir
+    return str(Path(connectors_dir) / identity)
+
+def is_valid_identity(identity):
+    return identity == default_identity or identity_pattern.fullmatch(identity) is not None
+
+# identities configured in the connectors directory
+def discover_identities(connectors_dir):
+    path = Path(connectors_dir)
+    if not path.is_dir():
+        return []
+    return sorted(d.name for d in path.iterdir()
+                  if d.is_dir() and (d / ".env").is_file() and is_valid_identity(d.name) and d.name != default_identity)
+
+# merge the .env files, the process environment and the runtime overrides, in increasing precedence:
+#   .env < process environment < .env of the identity < runtime overrides of the identity
+# as with load_dotenv(), variables of the process environment are not overwritten by .env,
+# the .env of an identity only lists what differs from the default (e.g., CONNECTOR_NAME, API-KEY)
+def read_environment(identity=default_identity, directory="."):
+    file_values = {k: v for k, v in dotenv_values(env_file, interpolate=False).items() if k not in os.environ}
+    if identity != default_identity:
+        file_values.update(dotenv_values(Path(directory) / ".env", interpolate=False))
+    runtime = overrides.get(identity, {})
+    values = {**os.environ, **file_values, **runtime}
+    # ${NAME} is expanded with the final values, e.g., the URLs get the CONNECTOR_NAME of the identity
+    expandable = [k for k, v in file_values.items() if v is not None and k not in runtime]
+    for _ in range(5): # nested references are resolved over several passes
+        expanded = {k: expand_variables(values[k], values) for k in expandable}
+        if all(values[k] == v for k, v in expanded.items()):
+            break
+        values.update(expanded)
+    return values
+
+def load_settings():
+    default = Settings.from_environment(default_identity, ".", read_environment())
+    loaded = {default_identity: default}
+    for identity in discover_identities(default.connectors_dir):
+        directory = identity_directory(identity, default.connectors_dir)
+        loaded[identity] = Settings.from_environment(identity, directory, read_environment(identity, directory))
+    return loaded
+
+# rebuild the settings of all identities (after a .env was changed) and swap them in atomically
+def reload_settings(identity=default_identity, **runtime_values):
+    global identities
+    if runtime_values:
+        overrides.setdefault(identity, {}).update(runtime_values)
+    identities = load_settings()
+    return identities.get(identity)
+
+# rebuild the settings and publish the overrides to the other workers (used by /register)
+def publish_settings(identity=default_identity, **runtime_values):
+    global settings_generation
+    from src.store import get_store
+    overrides.setdefault(identity, {}).update(runtime_values)
+    store = get_store()
+    store.set("settings:overrides", overrides)
+    settings_generation = store.incr("settings:generation")
+    return reload_settings(identity)
+
+# reload the settings if another worker published new overrides
+def sync_settings():
+    global settings_generation
+    from src.store import get_store
+    try:
+        store = get_store()
+        generation = store.get("settings:generation", 0)
+        if generation != settings_generation:
+            settings_generation = generation
+            for identity, values in store.get("settings:overrides", {}).items():
+                overrides.setdefault(identity, {}).update(values)
+            reload_settings()
+    except Exception as exc: # keep serving with the current settings
+        print(f"Settings could not be synchronised: {exc!r}")
+
+# return the settings of the identity (default: the identity selected for the current request)
+def get_settings(identity=None):
+    if not identities:
+        reload_settings()
+    return identities[identity or current_identity.get()]
+
+def known_identities():
+    if not identities:
+        reload_settings()
+    return list(identities)
+
+# run the enclosed code as the given connector identity
+@contextmanager
+def use_identity(identity):
+    token = current_identity.set(identity)
+    try:
+        yield
+    finally:
+        current_identity.reset(token)
@@ -0,0 +1,191 @@
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+from src.fastjson import dumps, loads
+from src.settings import get_settings, default_identity
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# State shared by all workers of the Edge-Connector (tokens, EDRs, leases, settings generation)
+# lives in a small SQLite database (STORE_PATH, default KIT-Workspace/cache/shared.db).
+# Every worker keeps its own connection; WAL mode lets readers and the writer run concurrently.
+# The async variants (aget, aset, ...) run the SQLite calls in a thread, so the event loop never waits for the database.
+# With a single worker (WORKERS=1), the key-value state is kept in memory (LocalStore), only the tables of
+# execute() (KIT inventory, blob usage) are in the database.
+shared_store = None
+worker_id = f"{os.getpid()}" # owner of the leases taken by this worker
+
+
+#####################################################
+#                 Shared Store                      #
+#####################################################
+# key-value store with expiry, values are JSON documents
+class SharedStore:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+
+    def get(self, key, default=None):
+        with self.lock:
+            row = self.db.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return loads(row[0])
+
+    # ttl in seconds, None never expires
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                            (key, dumps(value), expires_at))
+
+    def delete(self, key):
+        with self.lock:
+            self.db.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    # delete all keys starting with the prefix
+    def delete_prefix(self, prefix):
+        with self.lock:
+            self.db.execute("DELETE FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    # atomically increase an integer and return the new value
+    def incr(self, key):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+                value = (loads(row[0]) if row is not None else 0) + 1
+                self.db.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, NULL)", (key, dumps(value)))
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return value
+
+    # take a lease for ttl seconds; True if this worker holds it (also if it already held it)
+    def claim(self, key, ttl):
+        now = time.time()
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE kv.expires_at <= ? OR kv.value = excluded.value",
+                (key, dumps(worker_id), now + ttl, now)
+            )
+            return cursor.rowcount == 1
+
+    def release(self, key):
+        with self.lock:
+            self.db.execute("DELETE FROM kv WHERE key = ? AND value = ?", (key, dumps(worker_id)))
+
+    # run statements on the other tables of the database (e.g., the KIT inventory), return the rows
+    def execute(self, sql, parameters=()):
+        with self.lock:
+            return self.db.execute(sql, parameters).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    # run a function using the store without blocking the event loop
+    async def call(self, function, *args):
+        return await asyncio.to_thread(function, *args)
+
+    async def aget(self, key, default=None):
+        return await self.call(self.get, key, default)
+
+    async def aset(self, key, value, ttl=None):
+        return await self.call(self.set, key, value, ttl)
+
+    async def adelete(self, key):
+        return await self.call(self.delete, key)
+
+    async def aincr(self, key):
+        return await self.call(self.incr, key)
+
+    async def aclaim(self, key, ttl):
+        return await self.call(self.claim, key, ttl)
+
+    async def arelease(self, key):
+        return await self.call(self.release, key)
+
+# key-value state of a single worker in memory (values are stored serialised: each get returns a copy, as above)
+class LocalStore(SharedStore):
+    purge_every = 1000 # sets between the removals of the expired entries
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.values = {} # key -> (serialised value, expires_at)
+        self.values_lock = threading.Lock()
+        self.sets = 0
+
+    def get(self, key, default=None):
+        entry = self.values.get(key)
+        if entry is None or (entry[1] is not None and entry[1] <= time.time()):
+            return default
+        return loads(entry[0])
+
+    def set(self, key, value, ttl=None):
+        entry = (dumps(value), time.time() + ttl if ttl is not None else None)
+        with self.values_lock:
+            self.values[key] = entry
+            self.sets += 1
+            if self.sets % self.purge_every == 0:
+                now = time.time()
+                for k in [k for k, (_, expires_at) in self.values.items() if expires_at is not None and expires_at <= now]:
+                    del self.values[k]
+
+    def delete(self, key):
+        with self.values_lock:
+            self.values.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self.values_lock:
+            for key in [key for key in self.values if key.startswith(prefix)]:
+                del self.values[key]
+
+    def incr(self, key):
+        with self.values_lock:
+            value = self.get(key, 0) + 1
+            self.values[key] = (dumps(value), None)
+        return value
+
+    def claim(self, key, ttl):
+        with self.values_lock:
+            holder = self.get(key)
+            if holder is not None and holder != worker_id:
+                return False
+            self.values[key] = (dumps(worker_id), time.time() + ttl)
+            return True
+
+    def release(self, key):
+        with self.values_lock:
+            if self.get(key) == worker_id:
+                del self.values[key]
+
+    # nothing to wait for
+    async def call(self, function, *args):
+        return function(*args)
+
+def get_store():
+    global shared_store
+    if shared_store is None:
+        settings = get_settings(default_identity)
+        shared_store = (SharedStore if settings.workers > 1 else LocalStore)(settings.store_path)
+    return shared_store
+
+def close_store():
+    global shared_store
+    if shared_store is not None:
+        shared_store.close()
+        shared_store = None
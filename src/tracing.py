@@ -0,0 +1,257 @@
+import json
+import time
+import secrets
+import asyncio
+import inspect
+import functools
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from src.settings import get_settings, default_identity
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# TRACING=off|file|otlp decides whether and where finished traces are exported
+#   file: one JSON line per span in TRACE_FILE (default KIT-Workspace/traces/traces.jsonl)
+#   otlp: OTLP/HTTP JSON posted to TRACE_OTLP_URL (default http://localhost:4318/v1/traces)
+current_span = contextvars.ContextVar("current_span", default=None)
+# trace_id -> (monotonic time of the first span, finished spans of the trace waiting for their local root), oldest first
+# spans finishing after their root (e.g., of tasks the request did not wait for) are exported once they are too old
+pending_spans = OrderedDict()
+pending_max_age = 300     # seconds
+pending_max_traces = 1000
+background_exports = set() # keep references to running OTLP exports
+file_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-file") # appends to TRACE_FILE in order, off the event loop
+
+
+#####################################################
+#                 Span Definition                   #
+#####################################################
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes, remote_parent=False):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.remote_parent = remote_parent # True if the parent lives in another process
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    # a span is a local root if no parent span exists in this process
+    @property
+    def is_local_root(self):
+        return self.parent_id is None or self.remote_parent
+
+    @property
+    def duration(self):
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    # W3C trace context header value for outbound requests
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "duration": self.duration,
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+#####################################################
+#                 Utility Functions                 #
+#####################################################
+def tracing_mode():
+    return get_settings(default_identity).tracing
+
+# parse a W3C traceparent header, otherwise, return None
+def parse_traceparent(value):
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2]
+
+# open a span as a child of the current span (or of the given traceparent)
+@contextmanager
+def start_span(name, traceparent=None, **attributes):
+    if tracing_mode() == "off":
+        yield None
+        return
+
+    parent = current_span.get()
+    remote = parse_traceparent(traceparent) if parent is None else None
+    if parent is not None:
+        span = Span(name, parent.trace_id, parent.span_id, attributes)
+    elif remote is not None:
+        span = Span(name, remote[0], remote[1], attributes, remote_parent=True)
+    else:
+        span = Span(name, secrets.token_hex(16), None, attributes)
+
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.status = "error"
+        span.set_attribute("error", repr(exc))
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        current_span.reset(token)
+        finish_span(span)
+
+# add an attribute to the currently active span (no-op if tracing is off)
+def set_span_attribute(key, value):
+    span = current_span.get()
+    if span is not None:
+        span.set_attribute(key, value)
+
+# decorator to trace an async function; the listed arguments are recorded as span attributes
+def traced(name, *arg_names):
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if tracing_mode() == "off":
+                return await func(*args, **kwargs)
+            bound = signature.bind_partial(*args, **kwargs)
+            attributes = {k: bound.arguments[k] for k in arg_names if k in bound.arguments}
+            with start_span(name, **attributes):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# start a task that outlives the request: it runs outside of the current trace (the spans of the task form their own
+# trace, a child of the request span would never be exported once the request span is finished)
+def start_background_task(coro):
+    context = contextvars.copy_context() # keeps the connector identity
+    context.run(current_span.set, None)
+    return asyncio.create_task(coro, context=context)
+
+# httpx event hook: propagate the trace id to the outbound request
+async def inject_trace_headers(request):
+    span = current_span.get()
+    if span is not None:
+        request.headers["traceparent"] = span.traceparent()
+        span.set_attribute("http.url", str(request.url))
+
+
+#####################################################
+#                 Span Export                       #
+#####################################################
+def finish_span(span):
+    if span.trace_id not in pending_spans:
+        pending_spans[span.trace_id] = (time.monotonic(), [])
+    pending_spans[span.trace_id][1].append(span)
+    if not span.is_local_root:
+        evict_pending_spans()
+        return
+    spans = pending_spans.pop(span.trace_id)[1]
+    print_trace_summary(span, spans)
+    export_spans(spans)
+
+# export the oldest pending spans without their root
+def evict_pending_spans():
+    now = time.monotonic()
+    while pending_spans:
+        trace_id, (first_at, spans) = next(iter(pending_spans.items()))
+        if now - first_at < pending_max_age and len(pending_spans) <= pending_max_traces:
+            return
+        del pending_spans[trace_id]
+        export_spans(spans)
+
+def export_spans(spans):
+    mode = tracing_mode()
+    if mode == "file":
+        export_to_file(spans)
+    elif mode == "otlp":
+        try:
+            task = asyncio.get_running_loop().create_task(export_to_otlp(spans))
+            background_exports.add(task)
+            task.add_done_callback(background_exports.discard)
+        except RuntimeError: # no running event loop
+            asyncio.run(export_to_otlp(spans))
+
+# print which direct child of the root dominated the wall time
+def print_trace_summary(root, spans):
+    children = [s for s in spans if s.parent_id == root.span_id]
+    if not children:
+        return
+    slowest = max(children, key=lambda s: s.duration)
+    print(f"Trace {root.trace_id}: {root.name} took {root.duration:.3f}s, "
+          f"slowest step {slowest.name} {slowest.attributes} took {slowest.duration:.3f}s")
+
+def export_to_file(spans):
+    file_writer.submit(write_spans, Path(get_settings(default_identity).trace_file), spans)
+
+def write_spans(path, spans):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+    except OSError as exc:
+        print(f"Trace export to {path} failed: {exc}")
+
+# convert the spans into the OTLP/HTTP JSON format
+def to_otlp(spans):
+    def attribute(key, value):
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1, # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [attribute(k, v) for k, v in span.attributes.items()],
+            "status": {"code": 2 if span.status == "error" else 1}
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        otlp_spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", get_settings(default_identity).trace_service_name)]},
+            "scopeSpans": [{"scope": {"name": "edge-connector"}, "spans": otlp_spans}]
+        }]
+    }
+
+async def export_to_otlp(spans):
+    url = get_settings(default_identity).trace_otlp_url
+    try:
+        async with httpx.AsyncClient(timeout=5) as client:
+            response = await client.post(url, json=to_otlp(spans))
+            response.raise_for_status()
+    except httpx.HTTPError as exc:
+        print(f"Trace export to {url} failed: {exc}")
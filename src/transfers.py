@@ -0,0 +1,179 @@
+import time
+import uuid
+import asyncio
+from collections import Counter, OrderedDict
+from src.utils import get_token_header, start_push_transfer, get_transfer_process, describe_error
+from src.tracing import start_span, start_background_task
+from src.settings import get_settings, default_identity
+from src.callbacks import callbacks_enabled, wait_for_event, event_state
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# Push transfers: a batch starts many HttpData-PUSH transfer processes (the providers send the data to the destinations)
+# and follows each of them through the transferprocesses endpoint until it is finished.
+# The state is polled adaptively: soon after a change, then less often (up to poll_max) while it stays the same.
+# With EDC callbacks (CALLBACK_URL), the events of the transfer update its state right away and polling is the fallback.
+push_batches = OrderedDict() # batch id -> PushBatch, oldest first
+max_batches = 100 # finished batches beyond this are forgotten
+poll_min = 0.25 # seconds
+poll_max = 5.0
+final_states = {"COMPLETED", "TERMINATED", "DEPROVISIONED"}
+failed_states = {"TERMINATED"}
+
+
+#####################################################
+#                 Push Transfers                    #
+#####################################################
+class PushTransfer:
+    def __init__(self, originator, agreement_id, endpoint_url):
+        self.originator = originator
+        self.agreement_id = agreement_id
+        self.endpoint_url = endpoint_url
+        self.transfer_id = None
+        self.state = "PENDING" # not started yet
+        self.error = None
+        self.polls = 0
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    @property
+    def failed(self):
+        return self.error is not None or self.state in failed_states
+
+    def status(self):
+        return {"endpoint_url": self.endpoint_url, "agreement_id": self.agreement_id, "transfer_id": self.transfer_id,
+                "state": self.state, "error": self.error, "polls": self.polls,
+                "duration": (self.finished_at or time.time()) - self.started_at if self.started_at else None}
+
+class PushBatch:
+    def __init__(self, transfers, concurrency, timeout):
+        self.id = uuid.uuid4().hex
+        self.transfers = transfers
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = asyncio.Event()
+        self.task = None
+
+    def status(self, details=True):
+        states = Counter(t.state for t in self.transfers)
+        finished = sum(t.finished for t in self.transfers)
+        failed = sum(t.finished and t.failed for t in self.transfers)
+        status = {
+            "id": self.id,
+            "total": len(self.transfers),
+            "finished": finished,
+            "completed": finished - failed,
+            "failed": failed,
+            "progress": finished / len(self.transfers),
+            "done": self.done.is_set(),
+            "states": dict(states),
+            "created_at": self.created_at,
+            "duration": (self.finished_at or time.time()) - self.created_at,
+        }
+        if details:
+            status["transfers"] = [t.status() for t in self.transfers]
+        return status
+
+# start one transfer process and follow its state until it is finished
+# the token header is fetched for every request (from the token cache): a batch may outlive a token
+async def run_push_transfer(batch, transfer):
+    async with batch.semaphore: # only the start requests are limited, the polling is cheap
+        transfer.started_at = time.time()
+        try:
+            token_header = await get_token_header()
+            transfer.transfer_id = await start_push_transfer(transfer.originator, transfer.agreement_id, transfer.endpoint_url, token_header)
+            transfer.state = "REQUESTED"
+        except Exception as exc:
+            transfer.error = describe_error(exc)
+            transfer.finished_at = time.time()
+            return
+
+    deadline = time.monotonic() + batch.timeout
+    delay = poll_min
+    since = transfer.started_at
+    while time.monotonic() < deadline:
+        wait = min(delay, max(0, deadline - time.monotonic()))
+        event = None
+        if callbacks_enabled(): # the state is polled only if no event arrives within CALLBACK_TIMEOUT
+            wait = min(max(wait, get_settings(default_identity).callback_timeout), max(0, deadline - time.monotonic()))
+            event = await wait_for_event([("transfer", transfer.transfer_id)], wait, since)
+        else:
+            await asyncio.sleep(wait)
+        if event is not None: # state change reported by the EDC
+            since = event["received_at"]
+            process = event.get("payload") or {}
+            state = event_state(event) or transfer.state
+        else:
+            try:
+                process = await get_transfer_process(transfer.transfer_id, await get_token_header())
+                state = process.get("state") or process.get("edc:state") or transfer.state
+            except Exception as exc: # keep polling, the state endpoint may be briefly unavailable
+                print(f"Transfer {transfer.transfer_id}: state not available ({describe_error(exc)})")
+                state = transfer.state
+            transfer.polls += 1
+        if state != transfer.state:
+            transfer.state = state
+            delay = poll_min
+        else:
+            delay = min(poll_max, delay * 2)
+        if state in final_states:
+            if state in failed_states:
+                transfer.error = process.get("errorDetail") or f"transfer {state.lower()}"
+            transfer.finished_at = time.time()
+            return
+    transfer.error = f"not finished within {batch.timeout}s (last state {transfer.state})"
+    transfer.finished_at = time.time()
+
+async def run_push_batch(batch):
+    with start_span("push_transfers", batch_id=batch.id, transfers=len(batch.transfers)):
+        try:
+            await asyncio.gather(*(run_push_transfer(batch, t) for t in batch.transfers))
+        except Exception as exc:
+            for t in batch.transfers:
+                if not t.finished:
+                    t.error = describe_error(exc)
+                    t.finished_at = time.time()
+        finally:
+            batch.finished_at = time.time()
+            batch.done.set()
+    status = batch.status(details=False)
+    print(f"Push transfers {batch.id}: {status['completed']} completed, {status['failed']} failed")
+
+# start a batch of push transfers in the background, return it
+def start_push_batch(transfers, concurrency=8, timeout=600):
+    batch = PushBatch([PushTransfer(t["originator"], t["agreement_id"], t["endpoint_url"]) for t in transfers], concurrency, timeout)
+    push_batches[batch.id] = batch
+    batch.task = start_background_task(run_push_batch(batch))
+    finished = [batch_id for batch_id, b in push_batches.items() if b.done.is_set()]
+    for batch_id in finished[:max(0, len(finished) - max_batches)]:
+        push_batches.pop(batch_id)
+    return batch
+
+# wait up to `wait` seconds for the batch to finish, return its status (None if it is unknown)
+async def push_batch_status(batch_id, wait=0):
+    batch = push_batches.get(batch_id)
+    if batch is None:
+        return None
+    if wait > 0 and not batch.done.is_set():
+        try:
+            await asyncio.wait_for(asyncio.shield(batch.done.wait()), wait)
+        except asyncio.TimeoutError:
+            pass
+    return batch.status()
+
+def push_batches_status():
+    return [batch.status(details=False) for batch in push_batches.values()]
+
+async def stop_push_batches():
+    tasks = [batch.task for batch in push_batches.values() if batch.task is not None and not batch.task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
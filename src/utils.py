@@ -1,55 +1,218 @@
 import httpx
-import os
 from fastapi import HTTPException
 import re
 import asyncio
+import time
 from dotenv import load_dotenv
 from pathlib import Path
 import json
 from urllib.parse import unquote
 import shutil
+from contextlib import asynccontextmanager, AsyncExitStack
 from fastapi.responses import JSONResponse, StreamingResponse
+from src.tracing import start_span, traced, set_span_attribute, inject_trace_headers, start_background_task
+from src.cassette import cassette_transport
+from src.resilience import ResilientTransport, DataspaceUnavailable, resilience_enabled, resilience_status
+from src.fastjson import response_json, response_content
+from src.catalog import build_catalog_index, provider_catalogs, map_snapshot, load_snapshot
+from src.fastjson import FastJSONResponse
+from src.settings import get_settings, current_identity, default_identity, use_identity
+from src.store import get_store
+from src.callbacks import callbacks_enabled, callback_addresses, wait_for_event, event_state
+from src.inventory import record_kit, find_local_kit, list_local_kits, index_workspace
+from src.compression import suffixes, accepted_encodings
+from src.workspace import (workspace_root, blob_path, find_kit_blob, remember_kit_blob, save_blob, link_blob,
+                           evict_blobs, workspace_status, response_validators, previous_validators, conditional_headers,
+                           load_canvas)
+from starlette.background import BackgroundTask
 
 
 #####################################################
 #                 Global Variables                  #
 #####################################################
-token_url = os.getenv("TOKEN_URL")
-base_url = os.getenv("BASE_URL")
-connector = os.getenv("CONNECTOR_NAME")
-
+catalog_index = None # index of the federated catalog, rebuilt after CATALOG_TTL seconds
+catalog_lock = asyncio.Lock() # only one federated catalog download at a time
+catalog_refresh_task = None # background refresh of a stale catalog index
+catalog_last_error = None # error of the last failed catalog refresh
+token_locks = {} # identity -> lock, only one token request at a time (per worker)
+token_cache = {} # identity -> local copy of the token shared in the store
+client_pool = {} # identity -> shared dataspace client (connection pool), see open_client_pool()
+client_pool_open = False
+cached_management_types = ("asset", "policy", "contract") # see read_through()
+management_reads = {} # cache key -> read in flight
+edr_cache = {} # EDR cache key -> (expires_at, EDR), short-lived local copy of the EDRs in the store
+edr_local_ttl = 5 # seconds a worker reuses an EDR of the store without asking the store again
+# client options that configure the connections: a client with its own transport ignores them,
+# so they are given to the inner transport (verify, cert, proxy, limits, ...)
+transport_options = ("verify", "cert", "trust_env", "http1", "http2", "limits", "proxy")
 #####################################################
 #                 Utility Functions                 #
 #####################################################
 
-# return header for making http requests
-async def get_token_header():
-    # If the edge-connector is interacting with the DLR dataspace
-    if os.getenv('DATASPACE').casefold() == 'dlr':
-        token_url = os.getenv("TOKEN_URL")
+# return a new http client for dataspace requests (propagates the trace id to the dataspace)
+# in the cassette record/replay mode, the requests go through the cassette transport
+# the requests are limited, retried and hedged by the resilient transport (see src/resilience.py)
+def new_dataspace_client(**kwargs):
+    options = {name: kwargs[name] for name in transport_options if name in kwargs}
+    transport = cassette_transport(**options)
+    if resilience_enabled():
+        transport = ResilientTransport(transport or httpx.AsyncHTTPTransport(**options))
+    if transport is not None:
+        kwargs["transport"] = transport
+    return httpx.AsyncClient(event_hooks={"request": [inject_trace_headers]}, **kwargs)
+
+# provide a dataspace client: the pooled client of the connector identity once the pool is open,
+# otherwise, a new client
+# clients with a certificate are never pooled, as the certificate can be replaced by /register
+@asynccontextmanager
+async def dataspace_client(**kwargs):
+    if client_pool_open and not kwargs:
+        identity = current_identity.get()
+        if identity not in client_pool:
+            client_pool[identity] = new_dataspace_client()
+        yield client_pool[identity]
+    else:
+        async with new_dataspace_client(**kwargs) as client:
+            yield client
+
+# keep connections to the dataspace open between requests
+def open_client_pool():
+    global client_pool_open
+    client_pool_open = True
+
+async def close_client_pool():
+    global client_pool_open
+    client_pool_open = False
+    for client in client_pool.values():
+        await client.aclose()
+    client_pool.clear()
+
+# DLR dataspace: OAuth token minted with the client certificate of the connector identity
+# the token is shared by all workers through the store and reused until shortly before it expires
+# (force=True always requests a new one)
+async def oauth_token_header(settings, force=False):
+    identity = settings.identity
+    async with token_locks.setdefault(identity, asyncio.Lock()):
+        if not force:
+            token = await shared_token(identity)
+            if token:
+                return {"Authorization": f"Bearer {token}"}
+        store = get_store()
+        lease = f"lease:token:{identity}"
+        # only one worker mints a token, the others wait for it
+        # (or take over as soon as the lease is released without a token)
+        if not force and not await store.aclaim(lease, 30):
+            for _ in range(40):
+                await asyncio.sleep(0.25)
+                token = await shared_token(identity)
+                if token:
+                    return {"Authorization": f"Bearer {token}"}
+                if await store.aclaim(lease, 30):
+                    break
+
+        token_url = settings.url("TOKEN_URL")
         payload = {
             "client_id": "api-client",
             "grant_type": "password",
             "scope": "openid"
         }
-        async with httpx.AsyncClient(cert=("tls.crt", "tls.key")) as client:
-            print(f"Dataspace API triggered: {token_url}")
-            response = await client.post(token_url, data=payload)
         try:
-            data = response.json()
-            get_token_header.token = data.get("access_token")
-        except ValueError:
-            get_token_header.token = None
-        return {"Authorization": f"Bearer {get_token_header.token}"}
-    # If the edge-connector is interating with the T-System dataspace
-    elif os.getenv('DATASPACE').casefold() == 'tsi':
-        api_key = os.getenv('API-KEY')
-        return {"X-Api-Key": f"{api_key}", 
-                "content-type": "application/json"}
+            try:
+                async with dataspace_client(cert=settings.cert) as client:
+                    print(f"Dataspace API triggered: {token_url}")
+                    response = await client.post(token_url, data=payload)
+                data = response_json(response)
+                token = data.get("access_token")
+                # renew TOKEN_EXPIRY_MARGIN seconds before the token expires
+                lifetime = float(data.get("expires_in") or 0) - settings.token_expiry_margin
+            except ValueError:
+                token, lifetime = None, 0
+            cached = token_cache[identity] = {"token": token, "expires_at": time.time() + lifetime if token else 0}
+            if token and lifetime > 0: # shared before the lease is released: the waiting workers find it
+                await store.aset(f"token:{identity}", cached, ttl=lifetime)
+        finally:
+            await store.arelease(lease)
+        return {"Authorization": f"Bearer {token}"}
+
+# return the valid token of this worker or of the store, otherwise, None
+async def shared_token(identity):
+    cached = token_cache.get(identity)
+    if cached and cached["token"] and time.time() < cached["expires_at"]:
+        return cached["token"]
+    shared = await get_store().aget(f"token:{identity}")
+    if shared and time.time() < shared["expires_at"]:
+        token_cache[identity] = shared
+        return shared["token"]
+    return None
+
+# forget the token of the identity in all workers (e.g., after a new certificate was registered)
+def clear_token_cache(identity):
+    token_cache.pop(identity, None)
+    get_store().delete(f"token:{identity}")
+
+# T-Systems dataspace: static API key
+async def api_key_header(settings, force=False):
+    return {"X-Api-Key": f"{settings.api_key}",
+            "content-type": "application/json"}
+
+token_header_providers = {"oauth": oauth_token_header, "api-key": api_key_header} # see DataspaceAdapter.auth
+
+# return header for making http requests (None for an unknown dataspace)
+@traced("get_token_header")
+async def get_token_header(force=False):
+    settings = get_settings()
+    if settings.adapter is None:
+        return None
+    return await token_header_providers[settings.adapter.auth](settings, force)
+
+#####################################################
+#                 Management Cache                  #
+#####################################################
+# read-through cache of our own assets, policies and contract definitions (per connector identity, shared by all workers)
+# they change only through this edge-connector: our writes drop the entries of the written object type
+# (by increasing its generation), MANAGEMENT_CACHE_TTL seconds is the safety net for changes made elsewhere
+def management_generation_key(type, identity=None):
+    return f"mgmt-gen:{identity or current_identity.get()}:{type}"
+
+def invalidate_management_cache(*types, identity=None):
+    store = get_store()
+    identity = identity or current_identity.get()
+    for type in types or cached_management_types:
+        store.incr(management_generation_key(type, identity)) # also drops the results of reads in flight
+        store.delete_prefix(f"mgmt:{identity}:{type}:")
+
+# return the cached result, otherwise, fetch it once (concurrent identical reads share the request)
+# fetch returns (data, cacheable)
+async def read_through(type, key, fetch):
+    ttl = get_settings().management_cache_ttl
+    if ttl <= 0 or type not in cached_management_types:
+        return (await fetch())[0]
+    store = get_store()
+    generation = await store.aget(management_generation_key(type), 0)
+    cache_key = f"mgmt:{current_identity.get()}:{type}:{generation}:{key}"
+    hit = await store.aget(cache_key)
+    if hit is not None:
+        return hit["data"]
+
+    async def load():
+        data, cacheable = await fetch()
+        if cacheable and await store.aget(management_generation_key(type), 0) == generation: # no write in the meantime
+            await store.aset(cache_key, {"data": data}, ttl=ttl)
+        return data
+
+    task = management_reads.get(cache_key)
+    if task is None:
+        task = asyncio.ensure_future(load())
+        management_reads[cache_key] = task
+        task.add_done_callback(lambda _: management_reads.pop(cache_key, None))
+    return await asyncio.shield(task) # a cancelled reader does not cancel the others
+
 
 # retrieve various objects from dataspace
-async def get_objects(type, limit=100, page=0): 
-    address_book = { # maps the user request to the correct URL in the .env file
+# filter: QuerySpec filter expression (list of criteria), by default, all objects
+# unfiltered pages of assets, policies and contracts are cached (cached=False always asks the dataspace)
+async def get_objects(type, limit=100, page=0, filter=None, cached=True): 
+    address_book = { # maps the user request to the correct URL of the settings
         'asset' : 'ASSET_READ_URL',
         'policy' : 'POLICY_READ_URL',
         'contract' : 'CONTRACT_READ_URL',
@@ -57,19 +220,24 @@ async def get_objects(type, limit=100, page=0):
         'agreement' : 'AGREEMENT_READ_URL',
         'edr' : 'EDR_READ_URL'
     }
+    if cached and filter is None:
+        return await read_through(type, f"list:{limit}:{page}", lambda: fetch_objects(type, address_book[type], limit, page, filter))
+    return (await fetch_objects(type, address_book[type], limit, page, filter))[0]
 
-    url = os.getenv( address_book[type] ) # fetch the correct endpoint URL
+async def fetch_objects(type, url_name, limit, page, filter):
+    url = get_settings().url(url_name) # fetch the correct endpoint URL
     token_header = await get_token_header()
 
-    filter = [] 
-    if type == "asset": # filter out non-kit assets
-        filter = [
-            # {
-            #     "operandLeft": "https://w3id.org/edc/v0.0.1/ns/standardisation",
-            #     "operator": "=",
-            #     "operandRight": "kit" 
-            # }
-        ]
+    if filter is None:
+        filter = [] 
+        if type == "asset": # filter out non-kit assets
+            filter = [
+                # {
+                #     "operandLeft": "https://w3id.org/edc/v0.0.1/ns/standardisation",
+                #     "operator": "=",
+                #     "operandRight": "kit" 
+                # }
+            ]
 
     payload = {
         "@context": {"@vocab": "https://w3id.org/edc/v0.0.1/ns/"},
@@ -80,18 +248,19 @@ async def get_objects(type, limit=100, page=0):
         "sortField": "id",
         "filterExpression": filter
     }
-    async with httpx.AsyncClient() as client:
+    async with dataspace_client() as client:
         print(f"Dataspace API triggered: {url}")
         response = await client.post(url, json=payload, headers=token_header)
         response.raise_for_status()  # optional: raises exception if status >=400
-        print(response.json())
-        return response.json()
+    data = response_json(response) # parsed only once
+    print(f"Dataspace API returned {len(data) if isinstance(data, list) else 1} {type} object(s)")
+    return data, True
     
 
 # create a contract definition
 async def create_contract(contract_id, policy_id, asset_id):
     token_header = await get_token_header()
-    url = os.getenv("CONTRACT_CREATE_URL")
+    url = get_settings().url("CONTRACT_CREATE_URL")
     payload = {
         "@context": {
             "odrl": "http://www.w3.org/ns/odrl/2/"
@@ -105,7 +274,7 @@ async def create_contract(contract_id, policy_id, asset_id):
             "operandRight": asset_id
         }
     }
-    async with httpx.AsyncClient() as client:
+    async with dataspace_client() as client:
         try:
             print(f"Dataspace API triggered: {url}")
             response = await client.post(url, json=payload, headers=token_header)
@@ -116,13 +285,29 @@ async def create_contract(contract_id, policy_id, asset_id):
         except Exception as exc:
             print(f"Unexpected error while creating contract {contract_id}: {exc}")
             raise
-    return response.json()
+    await get_store().call(invalidate_management_cache, "contract")
+    return response_json(response)
+
+
+# build the KIT metadata (the asset properties) from a basic or composite KIT definition
+def build_kit_metadata(data):
+    access_info = data["access_info"]
+    kit_metadata = data["general_info"] | (data["additional_info"] or {})
+    if 'components' in data: # Flattening (composite KITs)
+        kit_metadata["components"] = data["components"]
+    kit_metadata['semantic_model'] = data["semantic_model"]
+    kit_metadata['asset_type'] = access_info['asset_type']
 
+    # overwrite the domain and standard values based on the .env file
+    settings = get_settings()
+    kit_metadata['standardisation'] = settings.standardisation
+    kit_metadata['DOMAIN'] = settings.domain
+    return kit_metadata
 
 # create a KIT as an HTTP asset 
 async def create_http_asset(kit_metadata, access_info):
     # dataspace url and header string
-    url = os.getenv("ASSET_CREATE_URL")
+    url = get_settings().url("ASSET_CREATE_URL")
     token_header = await get_token_header() 
 
     # mapping
@@ -136,7 +321,7 @@ async def create_http_asset(kit_metadata, access_info):
     # build the header (not the header to datasapce)
     proxy_header = {}
     if isinstance(access_info['header'], dict) and access_info['header']:
-        proxy_header = {f'header:{k}': v for k,v in access_info['header']}
+        proxy_header = {f'header:{k}': v for k,v in access_info['header'].items()}
 
     payload = {
         "@context": {},
@@ -145,7 +330,7 @@ async def create_http_asset(kit_metadata, access_info):
         "dataAddress": {
             "@type": "DataAddress",
             "type": "HttpData",
-            "baseUrl": url,
+            "baseUrl": access_info['url'], # the KIT endpoint served through the data plane
             "proxyMethod": proxy_method,  # allow methods other than GET
             "proxyBody": proxy_body     # allow request bodies
             # "header:authorization": "<some-token>"
@@ -155,20 +340,20 @@ async def create_http_asset(kit_metadata, access_info):
     payload['dataAddress'].update(proxy_header)
     
     # create an HTTP asset
-    async with httpx.AsyncClient() as client:
+    async with dataspace_client() as client:
         try:
             print(f"Dataspace API triggered: {url}")
             response = await client.post(url, json=payload, headers=token_header)
             response.raise_for_status()
-            return response.json()
         except httpx.HTTPStatusError as exc:
             # Server returned 4xx/5xx
             raise HTTPException(status_code=exc.response.status_code)
+    await get_store().call(invalidate_management_cache, "asset")
+    return response_json(response)
 
 async def create_aws_asset(asset_name, url, bucket, region, path, username, password, metadata):
     token_header = await get_token_header()
-    connector_name = os.getenv("CONNECTOR_NAME")
-    
+
     payload = {
         "@context": {},
         "@id": asset_name,
@@ -184,96 +369,433 @@ async def create_aws_asset(asset_name, url, bucket, region, path, username, pass
             "secretAccessKey": password
         }
     }
-    ds_url = f"{base_url}/connectors/{connector_name}/cp/management/v3/assets"
+    ds_url = get_settings().url("AWS_ASSET_CREATE_URL")
     # create an aws asset
-    async with httpx.AsyncClient() as client:
+    async with dataspace_client() as client:
         response = await client.post(ds_url, json=payload, headers=token_header)
-    return response.json()
-
-# delete an asset
-async def delete_asset(id):
+    await get_store().call(invalidate_management_cache, "asset")
+    return response_json(response)
+
+# describe why a bulk item failed
+def describe_error(exc):
+    if isinstance(exc, HTTPException):
+        return f"HTTP {exc.status_code}"
+    if isinstance(exc, httpx.HTTPStatusError):
+        return f"HTTP {exc.response.status_code}: {exc.response.text[:200]}"
+    return repr(exc)
+
+# create the asset and (if a policy is given) the contract definition of one KIT
+async def publish_kit(item, semaphore):
+    kit = item["kit"]
+    kit_name = kit["general_info"]["kit_name"]
+    result = {"kit_name": kit_name, "asset": False, "contract": None, "error": None}
+    async with semaphore:
+        try:
+            if kit["access_info"]["asset_type"].casefold() != "http":
+                raise ValueError(f"Unknown asset type {kit['access_info']['asset_type']}")
+            await create_http_asset(build_kit_metadata(kit), kit["access_info"])
+            result["asset"] = True
+            if item.get("policy_id"):
+                contract_id = item.get("contract_id") or f"{kit_name}-contract"
+                await create_contract(contract_id, item["policy_id"], kit_name)
+                result["contract"] = contract_id
+        except Exception as exc:
+            result["error"] = describe_error(exc)
+    return result
+
+# publish many KITs concurrently (at most `concurrency` dataspace calls in flight) and report per KIT
+@traced("publish_kits", "concurrency")
+async def publish_kits(items, concurrency=8):
+    semaphore = asyncio.Semaphore(concurrency)
+    seen = set()
+    tasks = []
+    for item in items:
+        kit_name = item["kit"]["general_info"]["kit_name"]
+        if kit_name in seen: # the dataspace would reject the second asset with the same id
+            tasks.append(asyncio.sleep(0, {"kit_name": kit_name, "asset": False, "contract": None,
+                                           "error": "Duplicate kit_name in the request"}))
+            continue
+        seen.add(kit_name)
+        tasks.append(publish_kit(item, semaphore))
+    results = await asyncio.gather(*tasks)
+    failed = sum(1 for r in results if r["error"] is not None)
+    set_span_attribute("kits", len(results))
+    set_span_attribute("failed", failed)
+    return {"total": len(results), "succeeded": len(results) - failed, "failed": failed, "results": results}
+
+# send the delete request of an asset or contract definition, or the terminate request of a negotiation
+async def send_delete_request(type, id):
     token_header = await get_token_header()
-    template = os.getenv("ASSET_DELETE_BY_ID_URL")
-    url = template.replace("{id}", id)
-    async with httpx.AsyncClient() as client:
+    if type == "negotiation":
+        url = get_settings().url("NEGOTIATION_DELETE_BY_ID_URL", id=id)
+        payload = {
+            "@context": {
+                "@vocab": "https://w3id.org/edc/v0.0.1/ns/"
+            },
+            "@type": "https://w3id.org/edc/v0.0.1/ns/TerminateNegotiation",
+            "@id": id,
+            "reason": "User's request to terminate"
+        }
+        async with dataspace_client() as client:
+            print(f"Dataspace API triggered: {url}")
+            return await client.post(url, json=payload, headers=token_header)
+    url = get_settings().url({"asset": "ASSET_DELETE_BY_ID_URL", "contract": "CONTRACT_DELETE_BY_ID_URL"}[type], id=id)
+    async with dataspace_client() as client:
         print(f"Dataspace API triggered: {url}")
         response = await client.delete(url, headers=token_header)
+    await get_store().call(invalidate_management_cache, type)
+    return response
+
+# start at most `rate` calls per second (None: no limit)
+class RateLimiter:
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = 0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+# return the IDs of all objects matching the QuerySpec filter (paged)
+async def find_object_ids(type, filter, page_size=500):
+    ids = []
+    seen = set()
+    page = 0
+    while True:
+        objects = await get_objects(type, page_size, page, filter)
+        if not isinstance(objects, list):
+            break
+        new_ids = [o["@id"] for o in objects if isinstance(o, dict) and "@id" in o and o["@id"] not in seen]
+        seen.update(new_ids)
+        ids.extend(new_ids)
+        if len(objects) < page_size or not new_ids: # last page (or the upstream ignores the offset)
+            break
+        page += 1
+    return ids
+
+# return the asset IDs selected by the assetsSelector of a contract definition (by ID only)
+def selected_asset_ids(contract):
+    selector = contract.get("assetsSelector") or contract.get("edc:assetsSelector") or []
+    if isinstance(selector, dict):
+        selector = [selector]
+    asset_ids = set()
+    for criterion in selector:
+        left = str(criterion.get("operandLeft", criterion.get("edc:operandLeft", "")))
+        if left.rsplit("/", 1)[-1].rsplit(":", 1)[-1] != "id":
+            continue
+        right = criterion.get("operandRight", criterion.get("edc:operandRight"))
+        asset_ids.update(right if isinstance(right, list) else [right])
+    return asset_ids
+
+# map the given asset IDs to the contract definitions offering only assets among them (deleted with the assets),
+# and return the contract definitions that also offer other assets (kept) with these other asset IDs
+async def find_dependent_contracts(asset_ids):
+    contracts = {}
+    shared = {}
+    page = 0
+    seen = set()
+    while True:
+        objects = await get_objects("contract", 500, page, [])
+        if not isinstance(objects, list) or not objects:
+            break
+        new = [c for c in objects if isinstance(c, dict) and c.get("@id") not in seen]
+        for contract in new:
+            seen.add(contract.get("@id"))
+            selected = selected_asset_ids(contract)
+            if not selected & asset_ids:
+                continue
+            if selected <= asset_ids:
+                for asset_id in selected:
+                    contracts.setdefault(asset_id, []).append(contract["@id"])
+            else:
+                shared[contract["@id"]] = sorted(selected - asset_ids, key=str)
+        if len(objects) < 500 or not new:
+            break
+        page += 1
+    return contracts, shared
+
+# delete (terminate) one object under the concurrency and rate limits; a missing object counts as deleted
+async def delete_one(type, id, semaphore, limiter):
+    result = {"id": id, "deleted": False, "status_code": None, "error": None}
+    async with semaphore:
+        await limiter.wait()
+        try:
+            response = await send_delete_request(type, id)
+            result["status_code"] = response.status_code
+            result["deleted"] = response.is_success or response.status_code == 404
+            if not result["deleted"]:
+                result["error"] = f"HTTP {response.status_code}: {response.text[:200]}"
+        except Exception as exc:
+            result["error"] = describe_error(exc)
+    return result
+
+# delete many assets, contract definitions or negotiations (terminated) concurrently and report per object
+# for assets (cascade=True), the contract definitions offering only deleted assets are deleted first;
+# an asset is only deleted once all of these contract definitions are gone. Contract definitions that also offer
+# other assets are kept and reported (shared_contracts)
+@traced("delete_objects", "type", "concurrency")
+async def delete_objects(type, ids=None, filter=None, concurrency=8, rate=None, cascade=True, dry_run=False):
+    if ids is None:
+        ids = await find_object_ids(type, filter)
+    ids = list(dict.fromkeys(ids))
+    dependents, shared = await find_dependent_contracts(set(ids)) if type == "asset" and cascade else ({}, {})
+    if dry_run:
+        return {"total": len(ids), "ids": ids, "contracts": dependents, "shared_contracts": shared}
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate)
+    report = {"total": len(ids)}
+    if shared:
+        report["shared_contracts"] = shared
+    blocked = {}
+    if dependents:
+        contract_ids = list(dict.fromkeys(c for cs in dependents.values() for c in cs))
+        contract_results = await asyncio.gather(*(delete_one("contract", c, semaphore, limiter) for c in contract_ids))
+        failed_contracts = {r["id"] for r in contract_results if not r["deleted"]}
+        blocked = {a: [c for c in cs if c in failed_contracts] for a, cs in dependents.items()}
+        report["contracts"] = contract_results
+
+    async def delete_item(id):
+        if blocked.get(id):
+            return {"id": id, "deleted": False, "status_code": None,
+                    "error": f"Contract definition(s) {', '.join(blocked[id])} could not be deleted"}
+        return await delete_one(type, id, semaphore, limiter)
+
+    results = await asyncio.gather(*(delete_item(id) for id in ids))
+    failed = sum(1 for r in results if not r["deleted"])
+    set_span_attribute("objects", len(results))
+    set_span_attribute("failed", failed)
+    report.update({"deleted": len(results) - failed, "failed": failed, "results": results})
+    return report
+
+# delete an asset
+async def delete_asset(id):
+    response = await send_delete_request("asset", id)
     if response.status_code == 204 or not response.content.strip():
         return True
     return False
 
 # get an asset by ID
 async def get_asset(id):
-    token_header = await get_token_header()
-    template = os.getenv("ASSET_READ_BY_ID_URL")
-    url = template.replace("{id}", id)
-    async with httpx.AsyncClient() as client:
-        print(f"Dataspace API triggered: {url}")
-        response = await client.get(url, headers=token_header)
-    return response.json()
+    return await read_through("asset", f"id:{id}", lambda: fetch_object("ASSET_READ_BY_ID_URL", id))
 
 # get a policy definition by ID
 async def get_policy(id):
+    return await read_through("policy", f"id:{id}", lambda: fetch_object("POLICY_READ_BY_ID_URL", id))
+
+# only found objects are cached
+async def fetch_object(url_name, id):
     token_header = await get_token_header()
-    template = os.getenv("POLICY_READ_BY_ID_URL")
-    url = template.replace("{id}", id)
-    async with httpx.AsyncClient() as client:
+    url = get_settings().url(url_name, id=id)
+    async with dataspace_client() as client:
         print(f"Dataspace API triggered: {url}")
         response = await client.get(url, headers=token_header)
-    return response.json()
+    return response_json(response), response.is_success
 
 # delete a contract by ID
 async def delete_contract(id):
-    token_header = await get_token_header()
-    template = os.getenv("CONTRACT_DELETE_BY_ID_URL")
-    url = template.replace("{id}", id)
-    async with httpx.AsyncClient() as client:
-        print(f"Dataspace API triggered: {url}")
-        response = await client.delete(url, headers=token_header)
+    response = await send_delete_request("contract", id)
     if response.status_code == 204 or not response.content.strip():
         return True
     return False
 
 # return the federated catalog
+@traced("get_federated_catalog")
 async def get_federated_catalog():
-    url = os.getenv("FEDERATED_CAT_URL") 
-    async with httpx.AsyncClient() as client:
+    url = get_settings(default_identity).url("FEDERATED_CAT_URL")
+    async with dataspace_client() as client:
         print(f"Dataspace API triggered: {url}")
         response = await client.get(url)
         response.raise_for_status()
-    return response.json()
+    return response_json(response)
+
+# forward the federated catalog to the user as it streams in (without parsing it)
+async def stream_federated_catalog():
+    url = get_settings(default_identity).url("FEDERATED_CAT_URL")
+    stack = AsyncExitStack()
+    client = await stack.enter_async_context(dataspace_client())
+    print(f"Dataspace API triggered: {url}")
+    response = None
+    try:
+        response = await client.send(client.build_request("GET", url), stream=True)
+        response.raise_for_status()
+    except httpx.HTTPError as exc:
+        if response is not None:
+            await response.aclose()
+        await stack.aclose()
+        # degraded mode: serve the KITs of the last good catalog
+        if catalog_index is None:
+            load_catalog_snapshot()
+        if catalog_index is None:
+            raise
+        print(f"Federated catalog unavailable ({exc!r}), serving the last good catalog")
+        return FastJSONResponse(catalog_index.search(lambda fields: True), headers=catalog_headers())
+    except Exception:
+        await stack.aclose()
+        raise
+
+    async def close():
+        await response.aclose()
+        await stack.aclose()
+    return StreamingResponse(response.aiter_raw(), media_type="application/json",
+                             headers={k: v for k, v in response.headers.items() if k.casefold() == "content-encoding"},
+                             background=BackgroundTask(close))
+
+# download the federated catalog and index its KITs while it streams in
+# with several workers, only the worker holding the catalog lease downloads it, the others load its snapshot
+# the catalog is shared by all connector identities and downloaded as the default identity
+@traced("refresh_catalog_index")
+async def refresh_catalog_index():
+    global catalog_index
+    settings = get_settings(default_identity)
+    store = get_store()
+    if not await store.aclaim("lease:catalog", settings.catalog_refresh_lease):
+        index = load_newer_snapshot()
+        if index is not None or catalog_index is not None:
+            return index if index is not None else catalog_index
+        # cold start: wait for the snapshot of the other worker, take over if it gives up
+        while True:
+            await asyncio.sleep(0.25)
+            index = load_newer_snapshot()
+            if index is not None:
+                return index
+            if await store.aclaim("lease:catalog", settings.catalog_refresh_lease):
+                break
+    try:
+        url = settings.url("FEDERATED_CAT_URL")
+        with use_identity(default_identity):
+            async with dataspace_client() as client:
+                print(f"Dataspace API triggered: {url}")
+                async with client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    index = await build_catalog_index(response.aiter_bytes())
+        print(f"Federated catalog indexed: {len(index)} KITs of {len(index.participants)} participants")
+        try: # persist the last good catalog for warm starts, degraded mode and the other workers, serve it from there
+            index = await asyncio.to_thread(map_snapshot, index, catalog_snapshot_path())
+        except (OSError, ValueError) as exc: # keep the index in memory
+            print(f"Catalog snapshot could not be saved: {exc!r}")
+        catalog_index = index
+    finally:
+        await store.arelease("lease:catalog")
+    return index
+
+# load the snapshot if another worker saved a newer catalog than ours, otherwise, return None
+def load_newer_snapshot():
+    global catalog_index
+    path = Path(catalog_snapshot_path())
+    try:
+        if catalog_index is not None and path.stat().st_mtime <= catalog_index.created_at:
+            return None
+        index = load_snapshot(path)
+    except (OSError, ValueError):
+        return None
+    if index is None or (catalog_index is not None and index.created_at <= catalog_index.created_at):
+        return None
+    index.source = "dataspace" # downloaded by another worker
+    catalog_index = index
+    return index
+
+def catalog_snapshot_path():
+    return get_settings(default_identity).catalog_snapshot
+
+def catalog_ttl():
+    return get_settings(default_identity).catalog_ttl
+
+# load the catalog snapshot from disk if no index is in memory yet
+def load_catalog_snapshot():
+    global catalog_index
+    if catalog_index is not None:
+        return catalog_index
+    try:
+        index = load_snapshot(catalog_snapshot_path())
+    except (OSError, ValueError) as exc:
+        print(f"Catalog snapshot could not be loaded: {exc!r}")
+        return None
+    if index is not None:
+        print(f"Catalog snapshot loaded: {len(index)} KITs, {time.time() - index.created_at:.0f}s old")
+        catalog_index = index
+    return index
+
+async def refresh_catalog_quietly():
+    global catalog_last_error
+    try:
+        await refresh_catalog_index()
+        catalog_last_error = None
+    except Exception as exc:
+        catalog_last_error = repr(exc)
+        print(f"Federated catalog refresh failed, serving the last good catalog: {exc!r}")
+
+def refresh_catalog_in_background():
+    global catalog_refresh_task
+    if catalog_refresh_task is None or catalog_refresh_task.done():
+        catalog_refresh_task = start_background_task(refresh_catalog_quietly())
+    return catalog_refresh_task
+
+# return the federated catalog index
+# a stale index (older than CATALOG_TTL seconds) is served while it is refreshed in the background
+async def get_catalog_index():
+    if catalog_index is None:
+        load_catalog_snapshot() # warm start from disk
+    if catalog_index is not None:
+        if time.time() - catalog_index.created_at >= catalog_ttl():
+            refresh_catalog_in_background()
+        return catalog_index
+    async with catalog_lock: # cold start: wait for the download
+        # another request may have built the index while waiting for the lock
+        if catalog_index is not None:
+            return catalog_index
+        return await refresh_catalog_index()
+
+# state of the federated catalog index
+def catalog_status():
+    if catalog_index is None:
+        return {"available": False, "stale": True, "age": None, "source": None,
+                "refreshing": False, "last_error": catalog_last_error}
+    age = time.time() - catalog_index.created_at
+    return {
+        "available": True,
+        "stale": age >= catalog_ttl(),
+        "age": age,
+        "source": catalog_index.source,
+        "refreshing": catalog_refresh_task is not None and not catalog_refresh_task.done(),
+        "last_error": catalog_last_error
+    }
+
+# staleness marker of the served catalog data as response headers
+def catalog_headers():
+    state = catalog_status()
+    if not state["available"]:
+        return {}
+    return {
+        "X-Catalog-Age": f"{state['age']:.0f}",
+        "X-Catalog-Stale": "true" if state["stale"] else "false",
+        "X-Catalog-Source": state["source"]
+    }
+
+# maximum age (seconds) of a crawled provider catalog to be served locally
+def crawled_catalog_max_age():
+    return get_settings(default_identity).crawler_max_age
 
 # return the asset metadata provided by the target provider
-# TODO: re-implement this without using the federated catalogue
+# the crawled provider catalogs are preferred, then the federated catalog is used
 async def get_target_offer_by_id(provider_id, asset_id):
-    fed_catalog = await get_federated_catalog()
-    for cat in fed_catalog:
-        participantId = cat["dspace:participantId"]
-        originator = cat['originator']
-        if participantId != provider_id:
-            continue
-        datasets = cat["dcat:dataset"]
-        if not isinstance(datasets, list): # cast datasets into an array
-            datasets = [datasets]
-        if not datasets: # skip if datasets is empty
-            continue
-        for asset in datasets:
-            # TODO: have better filtering out of the assets not meeting the KIT format
-            if 'kit_name' not in asset: 
-                continue # if no kit_name found, skip
-            if asset["kit_name"] != asset_id:
-                continue # if kit_name not match with the requested string, skip
-
-            # add additional useful information
-            asset['participantId'] = participantId
-            asset['originator'] = originator
-            asset['policy'] = asset['odrl:hasPolicy']
-            return asset
-    # if not found
-    return {}
-
+    if provider_catalogs.is_fresh(provider_id, crawled_catalog_max_age()):
+        offer = provider_catalogs.get_offer(provider_id, asset_id)
+        if offer:
+            return offer
+    index = await get_catalog_index()
+    return index.get_offer(provider_id, asset_id) # empty if not found
+
+@traced("get_catalog", "provider_id", "kit_name")
 async def get_catalog(provider_id, connector_url, kit_name = None):
-    url = os.getenv('CATALOG_READ') # fetch the correct endpoint URL
+    url = get_settings().url("CATALOG_READ") # fetch the correct endpoint URL
     token_header = await get_token_header()
 
     payload = {
@@ -294,25 +816,34 @@ async def get_catalog(provider_id, connector_url, kit_name = None):
         }
     }
 
-    async with httpx.AsyncClient() as client:
+    async with dataspace_client() as client:
         print(f"Dataspace API triggered: {url}")
         response = await client.post(url, json=payload, headers=token_header)
         response.raise_for_status()
 
     # post-processing of the catalog to filter out KITs or a specific KIT
     # TODO: this can be done by making the filterExpression 
-    dataset = response.json()['dataset']
+    catalog = response_json(response) # parsed only once
+    dataset = catalog['dataset']
     if kit_name != None: 
         kit = [d for d in dataset if "edc:kit_type" in d and d["id"] == kit_name]
     else: # return all kits (still exclude assets that are not a KIT)
         kit = [d for d in dataset if "edc:kit_type" in d]
-    catalog = response.json()
     catalog['dataset'] = kit
     return catalog
 
 
+# return the provider catalog from the crawler if fresh, otherwise, request it from the provider
+async def get_catalog_cached(provider_id, connector_url, kit_name = None):
+    if provider_catalogs.is_fresh(provider_id, crawled_catalog_max_age()):
+        catalog = provider_catalogs.get_catalog(provider_id, kit_name)
+        if catalog['dataset'] or kit_name is None:
+            return catalog
+    return await get_catalog(provider_id, connector_url, kit_name)
+
+
 async def get_catalog_by_kit(provider_id, asset_id, connector_url):
-    url = os.getenv('CATALOG_FIND_KIT') # fetch the correct endpoint URL
+    url = get_settings().url("CATALOG_FIND_KIT") # fetch the correct endpoint URL
     token_header = await get_token_header()
 
     payload = {
@@ -326,16 +857,17 @@ async def get_catalog_by_kit(provider_id, asset_id, connector_url):
         "protocol": "dataspace-protocol-http:2025-1"
     }
 
-    async with httpx.AsyncClient() as client:
+    async with dataspace_client() as client:
         print(f"Dataspace API triggered: {url}")
         response = await client.post(url, json=payload, headers=token_header)
         response.raise_for_status()
-        return response.json()
+        return response_json(response)
 
 # return a negotiation id
 # TODO: currently we always create a new one without checking existing valid one
+@traced("create_http_negotiation", "bpn", "asset_id")
 async def create_http_negotiation(connector_url, policy, bpn, asset_id, token_header):
-    url = os.getenv("EDR_NEGOTIATION_URL")
+    url = get_settings().url("EDR_NEGOTIATION_URL")
     payload = {
         "@context": {
             "odrl": "http://www.w3.org/ns/odrl/2/"
@@ -344,16 +876,19 @@ async def create_http_negotiation(connector_url, policy, bpn, asset_id, token_he
         "protocol": "dataspace-protocol-http",
         "policy": policy | {"odrl:assigner": {"@id": bpn}, "odrl:target": {"@id": asset_id}}
     }
-    async with httpx.AsyncClient() as client:
+    if callbacks_enabled(): # the EDC reports the negotiation (and the EDR transfer) to /callbacks/edc
+        payload["callbackAddresses"] = callback_addresses()
+    async with dataspace_client() as client:
         print(f"Dataspace API triggered: {url}")
         response = await client.post(url, json=payload, headers=token_header)
         response.raise_for_status()
-        print(f'Negotiation id: {response.json()["@id"]}')
-        return response.json()["@id"]
+        negotiation_id = response_json(response)["@id"]
+        print(f'Negotiation id: {negotiation_id}')
+        return negotiation_id
 
-# return the HTTP asset access_token and endpoint
-async def get_transfer_credentials(asset_id, token_header):
-    url = os.getenv("EDR_READ_URL")
+# return the EDR entries of an asset (transfer process, agreement, ...)
+async def query_edrs(asset_id, token_header):
+    url = get_settings().url("EDR_READ_URL")
     payload = {
     "@context": {},
     "@type": "QuerySpec",
@@ -365,68 +900,172 @@ async def get_transfer_credentials(asset_id, token_header):
             }
         ]
     }
-    # obtain the transfer id
-    async with httpx.AsyncClient() as client:
+    async with dataspace_client() as client:
         print(f"Dataspace API triggered: {url}")
         response = await client.post(url, json=payload, headers=token_header)
         response.raise_for_status()
-        if response.json() == []: return None, None
-        transfer_id = response.json()[0]["transferProcessId"]
-        print(f'Transfer id: {transfer_id}')
+        return response_json(response) # parsed only once
+
+# return the HTTP asset access_token and endpoint
+@traced("get_transfer_credentials", "asset_id")
+async def get_transfer_credentials(asset_id, token_header):
+    # obtain the transfer id
+    edrs = await query_edrs(asset_id, token_header)
+    if edrs == []: return None, None
+    transfer_id = edrs[0]["transferProcessId"]
+    print(f'Transfer id: {transfer_id}')
 
     # use the transfer id to get the access url and token
-    template = os.getenv("EDR_DATA_ADDRESS_URL")
-    url = template.replace("{transfer_id}", transfer_id)
-    async with httpx.AsyncClient() as client:
+    url = get_settings().url("EDR_DATA_ADDRESS_URL", transfer_id=transfer_id)
+    async with dataspace_client() as client:
         print(f"Dataspace API triggered: {url}")
         response = await client.get(url, headers=token_header)
         response.raise_for_status()
-    access_token = response.json()["authorization"]
-    endpoint = response.json()["endpoint"]
+    data_address = response_json(response) # parsed only once
+    access_token = data_address["authorization"]
+    endpoint = data_address["endpoint"]
     return endpoint, access_token
 
+# key of the cached EDR of an asset for the current connector identity
+def edr_cache_key(asset_id):
+    return f"edr:{current_identity.get()}:{asset_id}"
+
+# return the EDR of the asset, shared by all workers for EDR_CACHE_TTL seconds
+# (and kept by this worker for up to edr_local_ttl seconds, without asking the store)
+async def get_cached_transfer_credentials(asset_id, token_header):
+    key = edr_cache_key(asset_id)
+    local = edr_cache.get(key)
+    if local is not None and time.monotonic() < local[0]:
+        return local[1]["endpoint"], local[1]["token"]
+    store = get_store()
+    cached = await store.aget(key)
+    if not cached:
+        endpoint, access_token = await get_transfer_credentials(asset_id, token_header)
+        if endpoint is None:
+            return None, None
+        cached = {"endpoint": endpoint, "token": access_token}
+        await store.aset(key, cached, ttl=get_settings().edr_cache_ttl)
+    edr_cache[key] = (time.monotonic() + min(edr_local_ttl, get_settings().edr_cache_ttl), cached)
+    return cached["endpoint"], cached["token"]
+
+# forget the EDRs of the identity in all workers (e.g., after a new certificate was registered)
+def clear_edr_cache(identity):
+    for key in [key for key in edr_cache if key.startswith(f"edr:{identity}:")]:
+        edr_cache.pop(key, None)
+    get_store().delete_prefix(f"edr:{identity}:")
+
+# forget the EDR of the asset (e.g., its token was rejected by the data plane)
+async def forget_transfer_credentials(asset_id):
+    edr_cache.pop(edr_cache_key(asset_id), None)
+    await get_store().adelete(edr_cache_key(asset_id))
+
 
 # TODO: currently, we create negotiation id every single time
+@traced("http_transfer", "save_to_file", "prefix")
 async def http_transfer(request_data, policy, metadata, save_to_file=True, prefix=''):
     token_header = await get_token_header()
     asset_id = request_data['kit_name']
     connector_url = request_data['connector_url']
     bpn = request_data['provider_id']
     payload = request_data['request_body'] if 'request_body' in request_data else None
+    set_span_attribute("provider_id", bpn)
+    set_span_attribute("kit_name", asset_id)
+
+    # a data KIT downloaded before (same provider, KIT and version) is served from the workspace blobs;
+    # a KIT without a version is revalidated with the provider instead (conditional request below)
+    overwrite = False if 'overwrite' not in request_data else request_data['overwrite']
+    reusable = save_to_file and payload is None and metadata.get('offerType', 'data') != 'service'
+    if reusable and not overwrite and metadata.get('version'):
+        validators = await asyncio.to_thread(find_kit_blob, bpn, asset_id, metadata.get('version'))
+        if validators is not None:
+            print(f"KIT {asset_id} is served from the local workspace")
+            set_span_attribute("workspace_hit", True)
+            await asyncio.to_thread(save_kit_file, prefix, bpn, asset_id, metadata, validators, overwrite)
+            return True, None
+
+    # a KIT downloaded before is only transferred again if it changed (ETag/Last-Modified)
+    validators = None
+    if reusable:
+        validators = await asyncio.to_thread(previous_validators, kit_folder_path(prefix, bpn, asset_id), bpn, asset_id, metadata.get('version'))
 
     # Search for an existing EDR negotiation id
     print(f"Target asset to download: {asset_id}")
-    endpoint, token = await get_transfer_credentials(asset_id, token_header)
+    endpoint, token = await get_cached_transfer_credentials(asset_id, token_header)
     print(f'endpoint: {endpoint}')
 
     if endpoint == None:  # In case, we need to create a new negotiation id
         print('Creating a negotiation')
+        since = time.time()
         negotiation_id = await create_http_negotiation(connector_url, policy, bpn, asset_id, token_header)
-        await asyncio.sleep(5) # we need around 10 seconds to wait before the agreement id is generated
-        endpoint, token = await get_transfer_credentials(asset_id, token_header)
+        with start_span("wait_for_agreement", negotiation_id=negotiation_id):
+            event = await wait_for_negotiation(negotiation_id, asset_id, since, ("TransferProcessStarted", "ContractNegotiationTerminated"))
+        if event is not None and event_state(event) == "TERMINATED":
+            print(f"Negotiation {negotiation_id} was terminated")
+            return False, None
+        endpoint, token = await get_cached_transfer_credentials(asset_id, token_header)
     print(endpoint)
+    if endpoint is None:
+        print(f"No EDR for {asset_id}, the transfer is not started")
+        return False, None
     
     # Activate transfer
     print("Data transfer started")
-    headers = {"Authorization": token}
-    async with httpx.AsyncClient() as client:
-        print(f"Dataspace API triggered: {endpoint}")
-        if payload == None:
-            response = await client.get(endpoint, headers=headers)
-        else:
-            response = await client.post(endpoint, headers=headers, json=payload)
+    for attempt in range(2):
+        headers = {"Authorization": token} | conditional_headers(validators)
+        if accepted_encodings() is not None:
+            headers["Accept-Encoding"] = accepted_encodings()
+        with start_span("data_plane_request", provider_id=bpn, kit_name=asset_id) as span:
+            async with dataspace_client() as client:
+                print(f"Dataspace API triggered: {endpoint}")
+                if payload == None:
+                    response = await client.get(endpoint, headers=headers)
+                else:
+                    response = await client.post(endpoint, headers=headers, json=payload)
+            if span is not None:
+                span.set_attribute("http.status_code", response.status_code)
+                span.set_attribute("bytes", len(response.content))
+                span.set_attribute("wire_bytes", response.num_bytes_downloaded) # before content decoding
+        if attempt or response.status_code not in (401, 403):
+            break
+        # the cached EDR token is no longer accepted: fetch a fresh EDR and retry once
+        await forget_transfer_credentials(asset_id)
+        endpoint, token = await get_cached_transfer_credentials(asset_id, token_header)
+        if endpoint is None:
+            break
 
     # if not to save as a file, early exit
     if not save_to_file:
         return True, response
 
+    # the provider's data did not change: keep the local file
+    if response.status_code == 304 and validators is not None:
+        print(f"KIT {asset_id} is not modified, the local file is kept")
+        set_span_attribute("not_modified", True)
+        await asyncio.to_thread(save_kit_file, prefix, bpn, asset_id, metadata, validators, overwrite)
+        return True, response
+
+    # an error response is never saved (nor reused) as the KIT
+    if not response.is_success:
+        print(f"KIT {asset_id} was not transferred: {response.status_code}")
+        return False, response
+
     # Now, we need to save KIT into the local drive
     print("KIT is being saved to the local drive")
-    # create the workspace folder if not exist
-    workspace = Path("KIT-Workspace")
-    workspace.mkdir(parents=True, exist_ok=True)
     print(metadata)
+    filename = kit_file_name(metadata, response, asset_id)
+
+    # save KIT into the blob store and link it into the KIT folder
+    _, digest, size, compression = await save_blob(response.aiter_bytes())
+    validators = response_validators(response, digest, size, filename, compression)
+    await asyncio.to_thread(save_kit_file, prefix, bpn, asset_id, metadata, validators, overwrite)
+    if reusable:
+        await get_store().call(remember_kit_blob, bpn, asset_id, metadata.get('version'), validators)
+    await asyncio.to_thread(evict_blobs)
+
+    return True, response
 
+# name of the KIT file in the KIT folder
+def kit_file_name(metadata, response, asset_id):
     # to save into a file, we need to know the file name
     filename = None
     
@@ -454,27 +1093,32 @@ async def http_transfer(request_data, policy, metadata, save_to_file=True, prefi
         # TODO: we can also generate file name based on the content-type
     
     # if file name is NOT given, we use the asset id as the file name
-    filename = asset_id    
-    kit_folder = workspace / prefix / f'{bpn}-{asset_id}'
-    file_path = kit_folder / filename
+    if not filename:
+        filename = asset_id
+    return Path(filename).name # never outside of the KIT folder
 
-    # check if overwriting is enabled
-    overwrite = False if 'overwrite' not in request_data else request_data['overwrite']
+def kit_folder_path(prefix, bpn, asset_id):
+    return workspace_root / prefix / f'{bpn}-{asset_id}'
+
+# link the KIT file (blob) into its KIT folder, emptied first if overwriting is enabled,
+# and write the metadata with the validators of the file into it
+def save_kit_file(prefix, bpn, asset_id, metadata, validators, overwrite):
+    kit_folder = kit_folder_path(prefix, bpn, asset_id)
     if kit_folder.exists() and overwrite:
-        shutil.rmtree(kit_folder) # delete the already downloaded KIT
+        shutil.rmtree(kit_folder) # delete the already downloaded KIT (the blobs stay in the store)
     kit_folder.mkdir(parents=True, exist_ok=True) # recreate the folder
+    for suffix in ("", *suffixes.values()): # the file may have been stored with another compression before
+        (kit_folder / f"{validators['filename']}{suffix}").unlink(missing_ok=True)
+    compression = validators.get("compression")
+    kit_file = kit_folder / f"{validators['filename']}{suffixes.get(compression, '')}"
+    link_blob(blob_path(validators["digest"], compression), kit_file)
     
     # write the metadata in the folder
     metadata_path = kit_folder / "metadata.json"
     with open(metadata_path, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=4, ensure_ascii=False)
-
-    # save KIT into a file
-    with open(file_path, "wb") as f:
-        async for chunk in response.aiter_bytes():
-            f.write(chunk)
-
-    return True, response
+        json.dump(metadata | {"transfer": validators}, f, indent=4, ensure_ascii=False)
+    record_kit(prefix, bpn, asset_id, metadata, validators, kit_file.stat().st_size) # KIT inventory
+    return kit_folder
 
 
 # Convert the search query into tokens, otherwise, return None
@@ -562,69 +1206,37 @@ async def search_by_query(query):
     if tokens is None:
         return {}
 
-    fed_catalog = await get_federated_catalog()
-    if tokens is None:
-        return fed_catalog
-
-    for catalog in fed_catalog:
-        datasets = catalog["dcat:dataset"]
-        bpn = catalog["dspace:participantId"]
-        if not isinstance(datasets, list): # caset datasets to an array
-            datasets = [datasets]
-        if not datasets: # skip if datasets is empty
-            continue
-
-        filtered_datasets = []
-        for dataset in datasets:
-            preprocessed = {**{key : value for key, value in dataset.items() 
-                                if key not in {"@id","@type","odrl:hasPolicy","dcat:distribution","semantic_model",}},
-                            **dataset.get("semantic_model", {})}
-            preprocessed = {k.casefold(): v for k, v in preprocessed.items()} # make key all casefold()
-            preprocessed["bpn"] = bpn
-            if check_match(preprocessed, tokens):
-                filtered_datasets.append(dataset)
-        catalog["dcat:dataset"] = filtered_datasets
-    return fed_catalog
+    # the search fields of each KIT are preprocessed once when the index is built
+    index = await get_catalog_index()
+    return index.search(lambda fields: check_match(fields, tokens))
 
 # To edit an asset details with new data
 async def edit_asset(context, asset_id, properties, dataAddress):
     token_header = await get_token_header()
-    url = os.getenv("ASSET_EDIT_URL")
+    url = get_settings().url("ASSET_EDIT_URL")
     payload = {
         "@context": context,
         "@id": asset_id,
         "properties": properties,
         "dataAddress": dataAddress
     }
-    async with httpx.AsyncClient() as client:
+    async with dataspace_client() as client:
         print(f"Dataspace API triggered: {url}")
         response = await client.put(url, json=payload, headers=token_header)
+    await get_store().call(invalidate_management_cache, "asset")
     try:
-        return response.json()
+        return response_json(response)
     except:
         return {"status_code": response.status_code, "body": response.text or "No content"}
 
 # delete negotiation
 async def delete_negotitation(id):
-    token_header = await get_token_header()
-    template = os.getenv("NEGOTIATION_DELETE_BY_ID_URL")
-    url = template.replace("{id}", id)
-
-    payload = {
-        "@context": {
-            "@vocab": "https://w3id.org/edc/v0.0.1/ns/"
-        },
-        "@type": "https://w3id.org/edc/v0.0.1/ns/TerminateNegotiation",
-        "@id": id,
-        "reason": "User's request to terminate"
-    }
-    async with httpx.AsyncClient() as client:
-        print(f"Dataspace API triggered: {url}")
-        response = await client.post(url, json=payload, headers=token_header)
-        print(response.status_code)
+    response = await send_delete_request("negotiation", id)
+    print(response.status_code)
     try:
-        print (response.json())
-        return response.json()
+        data = response_json(response)
+        print(data)
+        return data
     except:
         return {"status_code": response.status_code, "body": response.text or "No content"}
     
@@ -640,8 +1252,16 @@ async def http_transfer_2url(originator, agreement_id, endpoint_url):
     """
     
     token_header = await get_token_header()
-    
-    url = f"{base_url}/connectors/{connector}/cp/management/v3/transferprocesses"
+    transfer_id = await start_push_transfer(originator, agreement_id, endpoint_url, token_header)
+
+    # confirm it worked
+    print(f"Transfer data:\n")
+    return await get_transfer_process(transfer_id, token_header)
+
+# start an HttpData-PUSH transfer process (the provider sends the data to endpoint_url), return its id
+@traced("start_push_transfer", "endpoint_url")
+async def start_push_transfer(originator, agreement_id, endpoint_url, token_header):
+    url = get_settings().url("TRANSFER_PROCESS_URL")
     payload = {
     "@context": {
         "odrl": "http://www.w3.org/ns/odrl/2/"
@@ -655,32 +1275,88 @@ async def http_transfer_2url(originator, agreement_id, endpoint_url):
     },
     "protocol": "dataspace-protocol-http"
     }
+    if callbacks_enabled(): # the EDC reports the transfer states to /callbacks/edc
+        payload["callbackAddresses"] = callback_addresses()
     
-    async with httpx.AsyncClient() as client:
-        response = client.post(url, json=payload, headers=token_header)
-
+    async with dataspace_client() as client:
+        print(f"Dataspace API triggered: {url}")
+        response = await client.post(url, json=payload, headers=token_header)
         response.raise_for_status()
-        
-        print(response.content)
+    transfer_id = response_json(response)["@id"]
+    print(f"Started Transfer with ID: {transfer_id}")
+    return transfer_id
+
+# return a transfer process (its state is in "state")
+async def get_transfer_process(transfer_id, token_header):
+    url = get_settings().url("TRANSFER_PROCESS_BY_ID_URL", id=transfer_id)
+    async with dataspace_client() as client:
+        response = await client.get(url, headers=token_header)
         response.raise_for_status()
-        
-        transfer_id = response.json()["@id"]
-        print(f"Started Transfer with ID: {transfer_id}")
-
-        # confirm it worked
-        url = f"{base_url}/connectors/{connector}/cp/management/v3/transferprocesses/{transfer_id}"
+    return response_json(response)
 
-        response = client.get(url, headers=token_header)
+# return a contract negotiation (its state is in "state", the agreement in "contractAgreementId")
+async def get_negotiation(negotiation_id, token_header):
+    url = get_settings().url("NEGOTIATION_BY_ID_URL", id=negotiation_id)
+    async with dataspace_client() as client:
+        response = await client.get(url, headers=token_header)
         response.raise_for_status()
-        print(f"Transfer data:\n")
-        return response.json()
+    return response_json(response)
+
+# wait for a new negotiation: with EDC callbacks, the wait ends as soon as an event of the given types arrives for the
+# negotiation (or the transfer of the asset); without callbacks, or without an event in time, the fixed delay is used
+# and the state is polled afterwards
+async def wait_for_negotiation(negotiation_id, asset_id, since, types):
+    if not callbacks_enabled():
+        await asyncio.sleep(5) # we need around 10 seconds to wait before the agreement id is generated
+        return None
+    event = await wait_for_event([("negotiation", negotiation_id), ("asset", asset_id)], get_settings().callback_timeout, since, types)
+    if event is None:
+        print(f"No callback for negotiation {negotiation_id}, polling")
+    set_span_attribute("callback", event.get("type") if event is not None else None)
+    return event
+
+# return the contract agreement of an asset (from its EDR), negotiated first if there is none
+async def get_agreement_id(request_data, policy, token_header):
+    asset_id = request_data['kit_name']
+    edrs = await query_edrs(asset_id, token_header)
+    if edrs == []:
+        print('Creating a negotiation')
+        since = time.time()
+        negotiation_id = await create_http_negotiation(request_data['connector_url'], policy, request_data['provider_id'], asset_id, token_header)
+        with start_span("wait_for_agreement", negotiation_id=negotiation_id):
+            event = await wait_for_negotiation(negotiation_id, asset_id, since, ("ContractNegotiationFinalized", "ContractNegotiationTerminated"))
+        if event is not None: # the event only ends the wait, the outcome is read from the management API
+            negotiation = await get_negotiation(negotiation_id, token_header)
+            state = negotiation.get("state") or negotiation.get("edc:state")
+            if state == "TERMINATED":
+                print(f"Negotiation {negotiation_id} was terminated")
+                return None
+            agreement_id = negotiation.get("contractAgreementId") or negotiation.get("edc:contractAgreementId")
+            if state == "FINALIZED" and agreement_id:
+                return agreement_id
+        edrs = await query_edrs(asset_id, token_header)
+    if edrs == []:
+        return None
+    return edrs[0].get("agreementId")
+
+# let the provider push the KIT data to endpoint_url (HttpData-PUSH), the data does not pass this connector
+@traced("push_transfer", "endpoint_url")
+async def push_transfer(request_data, policy, endpoint_url):
+    token_header = await get_token_header()
+    agreement_id = await get_agreement_id(request_data, policy, token_header)
+    if agreement_id is None:
+        print(f"No agreement for {request_data['kit_name']}, the transfer is not started")
+        return False, None
+    return True, await http_transfer_2url(request_data['connector_url'], agreement_id, endpoint_url)
 
 
 
 # TODO: this is a blocking operation, which is not desired for the long-term usage
+@traced("composite_kit_execution_blocking")
 async def composite_kit_execution_blocking(canvas, root_metadata):
     seq = canvas['sequence']
     state = 0 # start from zero, and increase by one to count the process stage
+    outputs = StageOutputs(get_settings().stage_output_limit) # data of the "read" KITs, kept in memory
 
     while True:
         # change to the next stage of sequence
@@ -695,35 +1371,84 @@ async def composite_kit_execution_blocking(canvas, root_metadata):
         # Get the list of KITs in this stage
         kits = seq[state_str]
 
-        for kit in kits:
-            kit_name = kit['kit_name']
-            provider_id = kit['provider_id']
-            connector_url = kit['connector_url']
-            action = kit['action']
-
-            catalog = await get_catalog(provider_id, connector_url, kit_name)
-            metadata_edc = catalog['dataset'][0] # always the first item in the dataset list
-            metadata = { # some fields has "edc:" prefix in the key to be removed
-                (k[4:] if k.startswith("edc:") else k): v
-                for k, v in metadata_edc.items()
-            }
-
-            # extract the policy
-            kit_type = metadata['kit_type']
-            policy = metadata['hasPolicy'][0] # TODO: for now we always use the first policy
-            
-            # TODO: for now, we ignore the nested composite KIT due to infinite nesting possibility
-            # We skip nested composite KITs until the nesting depth is restricted or handled properly
-            if kit_type != "basic":
-                continue
-
-            # download action
-            if action == 'download':
-                print("f'Download: {kit_name}")
-                success, _ = await http_transfer(kit, policy, metadata, save_to_file=True, prefix=root_metadata['folder_name'])
-            else: # TODO: implement other two actions: read and send-to 
-                print("currently we don't have the other actions implementation")
+        with start_span("stage", stage=state, kits=len(kits)):
+            for kit in kits:
+                kit_name = kit['kit_name']
+                provider_id = kit['provider_id']
+                connector_url = kit['connector_url']
+                action = kit['action']
+
+                with start_span("kit", provider_id=provider_id, kit_name=kit_name, action=action):
+                    catalog = await get_catalog_cached(provider_id, connector_url, kit_name)
+                    metadata_edc = catalog['dataset'][0] # always the first item in the dataset list
+                    metadata = { # some fields has "edc:" prefix in the key to be removed
+                        (k[4:] if k.startswith("edc:") else k): v
+                        for k, v in metadata_edc.items()
+                    }
+
+                    # extract the policy
+                    kit_type = metadata['kit_type']
+                    policy = metadata['hasPolicy'][0] # TODO: for now we always use the first policy
+                    
+                    # TODO: for now, we ignore the nested composite KIT due to infinite nesting possibility
+                    # We skip nested composite KITs until the nesting depth is restricted or handled properly
+                    if kit_type != "basic":
+                        continue
+
+                    # the data read by earlier KITs is passed in the request body
+                    kit = kit | outputs.request_body(kit, state)
+
+                    # download action
+                    if action == 'download':
+                        print("f'Download: {kit_name}")
+                        success, _ = await http_transfer(kit, policy, metadata, save_to_file=True, prefix=root_metadata['folder_name'])
+                    # read action: the data stays in memory for the next stages
+                    elif action == 'read':
+                        print(f'Read: {kit_name}')
+                        success, response = await http_transfer(kit, policy, metadata, save_to_file=False)
+                        outputs.add(state, kit_name, response)
+                    # send-to action: the provider pushes the data to the endpoint
+                    elif action == 'send-to':
+                        if not kit.get('endpoint_url'):
+                            print(f'No endpoint_url given to send {kit_name} to')
+                            continue
+                        print(f"Send-to: {kit_name} -> {kit['endpoint_url']}")
+                        success, _ = await push_transfer(kit, policy, kit['endpoint_url'])
+                    else:
+                        print(f"Unknown action {action} of {kit_name}")
             
     return True
 
+# Data read by the "read" KITs of a composite run, passed to the KITs of the later stages in their request body:
+# a KIT takes the data of the KITs named in its `inputs`, or else of all "read" KITs of the previous stage.
+# The data is kept in memory (never written into the KIT-Workspace), up to `limit` bytes per run.
+class StageOutputs:
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+        self.data = {}   # KIT name -> data (JSON, or text)
+        self.stages = {} # stage -> KIT names read in it
+
+    def add(self, stage, kit_name, response):
+        if response is None or response.is_error:
+            print(f"No data read from {kit_name}")
+            return
+        self.size += len(response.content)
+        if self.size > self.limit:
+            raise HTTPException(status_code=413, detail=f"The data read by the composite KIT exceeds STAGE_OUTPUT_LIMIT ({self.limit} bytes)")
+        self.data[kit_name] = response_content(response)
+        self.stages.setdefault(stage, []).append(kit_name)
+
+    # request body of a KIT: a single input is the body itself, several inputs (or a body of its own) are under "inputs"
+    def request_body(self, kit, stage):
+        names = kit.get('inputs')
+        if names is None:
+            names = self.stages.get(stage - 1, [])
+        names = [name for name in ([names] if isinstance(names, str) else names) if name in self.data]
+        if not names:
+            return {}
+        if len(names) == 1 and not kit.get('request_body'):
+            return {"request_body": self.data[names[0]]}
+        return {"request_body": (kit.get('request_body') or {}) | {"inputs": {name: self.data[name] for name in names}}}
+
         
@@ -0,0 +1,263 @@
+import os
+import time
+import asyncio
+import uuid
+import shutil
+import json
+import copy
+import zipfile
+import hashlib
+from pathlib import Path
+from collections import OrderedDict
+from src.settings import get_settings, default_identity
+from src.store import get_store
+from src.compression import suffixes, workspace_compression, is_compressed, compressor, open_workspace_file
+
+
+#####################################################
+#                 Global Variables                  #
+#####################################################
+# Downloaded KIT files are stored once in a content-addressed blob store (KIT-Workspace/.blobs/<sha256>),
+# the KIT folders (KIT-Workspace/<prefix>/<bpn>-<asset_id>/) only hold hardlinks to the blobs
+# (or copies, if the file system does not support hardlinks).
+# A blob is referenced as long as a KIT folder of the KIT inventory (src/inventory.py) uses it; the unreferenced
+# blobs are a cache of KITs seen before, evicted least recently used first once the blobs exceed WORKSPACE_QUOTA.
+# The last use of each blob is kept in the shared store (table blobs), the files (and their hardlinks) are not touched.
+# With WORKSPACE_COMPRESSION, new blobs are stored compressed (<sha256>.zst or .gz, the hash is of the content).
+workspace_root = Path("KIT-Workspace")
+blob_root = workspace_root / ".blobs"
+# parsed canvases of composite KITs: canvas file -> ((device, inode, mtime, size), canvas), least recently used last
+canvas_cache = OrderedDict()
+canvas_cache_size = 32
+blob_usage_store = None # the store whose database has the blobs table
+blob_batch_bytes = 1 << 20 # chunks of a download are hashed, compressed and written in batches of this size
+
+
+#####################################################
+#                 Utility Functions                 #
+#####################################################
+def blob_path(digest, compression=None):
+    return blob_root / digest[:2] / f"{digest}{suffixes.get(compression, '')}"
+
+# key of the blob of a data KIT (same provider, KIT and version -> same content)
+def kit_blob_key(bpn, asset_id, version):
+    return f"blob:kit:{bpn}:{asset_id}:{version or ''}"
+
+# return the validators of a KIT downloaded before, None if there are none (or its blob was evicted)
+def find_kit_blob(bpn, asset_id, version):
+    validators = get_store().get(kit_blob_key(bpn, asset_id, version))
+    if validators is None or not blob_path(validators["digest"], validators.get("compression")).is_file():
+        return None
+    mark_used(blob_path(validators["digest"], validators.get("compression")))
+    return validators
+
+def remember_kit_blob(bpn, asset_id, version, validators):
+    get_store().set(kit_blob_key(bpn, asset_id, version), validators)
+
+# validators of a downloaded KIT file, kept in the metadata.json of the KIT folder and with its blob
+def response_validators(response, digest, size, filename, compression):
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "size": size,
+        "digest": digest,     # blob of the file
+        "filename": filename,
+        "compression": compression, # None, zstd or gzip (the file name has the suffix .zst or .gz)
+    }
+
+# validators of the last download of a KIT whose blob is still stored (the KIT folder first, then the blob store)
+def previous_validators(kit_folder, bpn, asset_id, version):
+    candidates = []
+    metadata_path = kit_folder / "metadata.json"
+    if metadata_path.is_file():
+        try:
+            candidates.append(json.loads(metadata_path.read_text(encoding="utf-8")).get("transfer"))
+        except (ValueError, AttributeError):
+            pass
+    candidates.append(get_store().get(kit_blob_key(bpn, asset_id, version)))
+    for validators in candidates:
+        if validators and validators.get("digest") and blob_path(validators["digest"], validators.get("compression")).is_file():
+            return validators
+    return None
+
+# If-None-Match/If-Modified-Since headers to re-download a KIT only if it changed
+def conditional_headers(validators):
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+def blob_usage():
+    global blob_usage_store
+    store = get_store()
+    if store is not blob_usage_store:
+        store.execute("CREATE TABLE IF NOT EXISTS blobs (name TEXT PRIMARY KEY, used_at REAL)")
+        blob_usage_store = store
+    return store
+
+# mark a blob as recently used (LRU eviction)
+def mark_used(path):
+    blob_usage().execute("INSERT OR REPLACE INTO blobs (name, used_at) VALUES (?, ?)", (Path(path).name, time.time()))
+
+# write the chunks into the blob store while hashing them, return the blob path, digest, size and compression
+# the chunks are collected into batches that are hashed, compressed and written in a thread (off the event loop)
+async def save_blob(chunks):
+    writer = await asyncio.to_thread(BlobWriter)
+    try:
+        batch, batch_size = [], 0
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            batch.append(chunk)
+            batch_size += len(chunk)
+            if batch_size >= blob_batch_bytes:
+                await asyncio.to_thread(writer.write, batch)
+                batch, batch_size = [], 0
+        await asyncio.to_thread(writer.write, batch)
+        return await asyncio.to_thread(writer.finish)
+    except BaseException:
+        writer.discard()
+        raise
+
+# new blob written to a temporary file, moved into the blob store once it is complete
+# data that is compressed already (e.g., zip files) is never compressed again
+class BlobWriter:
+    def __init__(self):
+        blob_root.mkdir(parents=True, exist_ok=True)
+        self.temp_path = blob_root / f".tmp-{uuid.uuid4().hex}"
+        self.file = open(self.temp_path, "wb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.compression = workspace_compression()
+        self.encoder = None
+
+    def write(self, chunks):
+        for chunk in chunks:
+            if self.size == 0 and self.compression is not None and not is_compressed(chunk):
+                self.encoder = compressor(self.compression)
+            self.digest.update(chunk)
+            self.size += len(chunk)
+            self.file.write(self.encoder.compress(chunk) if self.encoder is not None else chunk)
+
+    def finish(self):
+        if self.encoder is not None:
+            self.file.write(self.encoder.flush())
+        self.file.close()
+        compression = self.compression if self.encoder is not None else None
+        path = blob_path(self.digest.hexdigest(), compression)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.is_file(): # the same content is stored already
+            self.temp_path.unlink()
+            mark_used(path)
+        else:
+            os.replace(self.temp_path, path)
+        return path, self.digest.hexdigest(), self.size, compression
+
+    def discard(self):
+        self.file.close()
+        self.temp_path.unlink(missing_ok=True)
+
+# place the blob at target (hardlink, or a copy if hardlinks are not supported)
+def link_blob(path, target):
+    target.unlink(missing_ok=True)
+    try:
+        os.link(path, target)
+    except OSError:
+        shutil.copyfile(path, target)
+
+# usage of the blob store: (path, size, last use, referenced) of each blob
+# (a blob never marked as used was last used when it was written)
+def scan_blobs():
+    from src.inventory import referenced_blobs
+    blobs = []
+    if not blob_root.is_dir():
+        return blobs
+    referenced = referenced_blobs()
+    used_at = dict(blob_usage().execute("SELECT name, used_at FROM blobs"))
+    for folder in os.scandir(blob_root):
+        if not folder.is_dir():
+            continue
+        for entry in os.scandir(folder.path):
+            stat = entry.stat()
+            blobs.append((entry.path, stat.st_size, used_at.get(entry.name, stat.st_mtime), entry.name in referenced))
+    return blobs
+
+# delete unreferenced blobs, least recently used first, until the blobs fit into the quota
+def evict_blobs(quota=None):
+    quota = get_settings(default_identity).workspace_quota if quota is None else quota
+    blobs = scan_blobs()
+    total = sum(size for _, size, _, _ in blobs)
+    evicted = 0
+    if quota <= 0 or total <= quota:
+        return {"total": total, "evicted": evicted}
+    for path, size, _, referenced in sorted(blobs, key=lambda b: b[2]):
+        if total <= quota:
+            break
+        if referenced:
+            continue
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        blob_usage().execute("DELETE FROM blobs WHERE name = ?", (os.path.basename(path),))
+        total -= size
+        evicted += 1
+    if total > quota:
+        print(f"KIT-Workspace: {total} bytes of referenced KITs exceed WORKSPACE_QUOTA ({quota} bytes)")
+    return {"total": total, "evicted": evicted}
+
+def workspace_status():
+    blobs = scan_blobs()
+    referenced = [b for b in blobs if b[3]]
+    unreferenced_used = [b[2] for b in blobs if not b[3]]
+    return {
+        "quota": get_settings(default_identity).workspace_quota,
+        "blobs": len(blobs),
+        "bytes": sum(b[1] for b in blobs),
+        "referenced_blobs": len(referenced),
+        "referenced_bytes": sum(b[1] for b in referenced),
+        "oldest_unreferenced_age": time.time() - min(unreferenced_used) if unreferenced_used else None,
+    }
+
+
+#####################################################
+#                 Canvas                            #
+#####################################################
+# the canvas of a composite KIT, from a JSON file or the `canvas` member of a zip archive (read in place),
+# parsed once per file version; None if the archive has no canvas
+def load_canvas(path, compression=None):
+    stat = os.stat(path)
+    identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    key = os.path.abspath(path)
+    cached = canvas_cache.get(key)
+    if cached is not None and cached[0] == identity:
+        canvas_cache.move_to_end(key)
+        return copy.deepcopy(cached[1]) # the caller may change its canvas
+    
+    with open_workspace_file(path, compression) as f:
+        if compression is None and zipfile.is_zipfile(f): # compressed files are never zip files
+            with zipfile.ZipFile(f) as archive:
+                member = canvas_member(archive)
+                if member is None:
+                    return None
+                with archive.open(member) as canvas_file:
+                    canvas = json.load(canvas_file)
+        else:
+            if compression is None:
+                f.seek(0) # rewind after is_zipfile
+            canvas = json.load(f)
+
+    canvas_cache[key] = (identity, canvas)
+    canvas_cache.move_to_end(key)
+    while len(canvas_cache) > canvas_cache_size:
+        canvas_cache.popitem(last=False)
+    return copy.deepcopy(canvas)
+
+# name of the canvas in a canvas archive (at the top level, or the only one in a folder)
+def canvas_member(archive):
+    names = [name for name in archive.namelist() if name.rsplit("/", 1)[-1] == "canvas"]
+    if "canvas" in names:
+        return "canvas"
+    return names[0] if len(names) == 1 else None